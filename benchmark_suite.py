@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark per Gestionale Gitemania
+Misura i percorsi critici su database temporanei con ordini sintetici
+Sviluppato da TechExpresso
+"""
+
+import sys
+import os
+import time
+import random
+import shutil
+import tempfile
+import tracemalloc
+
+# Aggiungi path per import moduli
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database_manager import DatabaseManager
+from export_manager import ExportManager
+
+STATUSES = ['completed', 'processing', 'pending', 'on-hold', 'cancelled', 'refunded']
+PRODUCTS = ['Gita Firenze', 'Gita Roma', 'Weekend Venezia', 'Tour Dolomiti', 'Crociera Egeo', 'Mercatini Natale']
+
+def make_order(woo_id: int, revision: int = 0) -> dict:
+    """Genera un ordine WooCommerce sintetico ma realistico"""
+    rnd = random.Random(woo_id)
+    day = 1 + woo_id % 28
+    first_name, last_name = rnd.choice(['Mario', 'Giulia', 'Luca', 'Sara']), rnd.choice(['Rossi', 'Bianchi', 'Verdi'])
+    line_items = [{'id': woo_id * 10 + i, 'product_id': 100 + i, 'name': rnd.choice(PRODUCTS), 'quantity': rnd.randint(1, 4), 'total': f"{rnd.uniform(20, 200):.2f}"} for i in range(rnd.randint(1, 3))]
+    return {
+        'id': woo_id, 'number': str(woo_id), 'status': STATUSES[(woo_id + revision) % len(STATUSES)], 'currency': 'EUR',
+        'total': f"{sum(float(i['total']) for i in line_items):.2f}", 'total_tax': '0.00', 'shipping_total': '0.00', 'customer_id': woo_id % 5000,
+        'billing': {'first_name': first_name, 'last_name': last_name, 'email': f"cliente{woo_id}@example.com", 'phone': '3331234567'},
+        'shipping': {'first_name': first_name, 'last_name': last_name}, 'line_items': line_items, 'shipping_lines': [],
+        'payment_method': 'stripe', 'payment_method_title': 'Carta di credito',
+        'date_created': f"2025-{1 + woo_id % 12:02d}-{day:02d}T10:00:00", 'date_modified': f"2025-{1 + woo_id % 12:02d}-{day:02d}T12:{revision % 60:02d}:00",
+        'date_completed': None,
+        'meta_data': [{'id': 1, 'key': '_dati_viaggiatori', 'value': [{'nome': first_name, 'cognome': last_name, 'email': f"viaggiatore{woo_id}@example.com", 'telefono': '3330000000'}]}],
+    }
+
+def bench_incremental_sync(table_sizes=(1000, 10000, 50000), batch_size: int = 100, rounds: int = 20):
+    """Costo per batch di sync_multiple_orders al crescere della tabella (deve restare piatto)"""
+    print(f"\n📊 sync_multiple_orders: batch da {batch_size} ordini (50% nuovi, 50% aggiornati)")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(db_path=os.path.join(tmp_dir, 'bench.db'))
+        loaded = 0
+        for size in table_sizes:
+            while loaded < size:
+                chunk = min(1000, size - loaded)
+                db.sync_multiple_orders([make_order(woo_id) for woo_id in range(loaded + 1, loaded + chunk + 1)])
+                loaded += chunk
+            timings = []
+            for r in range(rounds):
+                existing = [make_order(random.randint(1, loaded), revision=r + 1) for _ in range(batch_size // 2)]
+                new = [make_order(woo_id) for woo_id in range(loaded + 1, loaded + batch_size // 2 + 1)]
+                loaded += len(new)
+                start = time.perf_counter()
+                db.sync_multiple_orders(existing + new)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"   tabella ~{size:>7,} ordini → mediana {timings[len(timings) // 2] * 1000:7.2f} ms/batch")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def bench_search(table_size: int = 200000, rounds: int = 20):
+    """Tempo di risposta della casella Cerca (FTS5) su un archivio grande"""
+    print(f"\n🔎 get_orders con search_term su {table_size:,} ordini (limite 200 risultati)")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(db_path=os.path.join(tmp_dir, 'bench.db'))
+        for start in range(1, table_size + 1, 1000):
+            db.sync_multiple_orders([make_order(woo_id) for woo_id in range(start, min(start + 1000, table_size + 1))])
+        for term in ['rossi', 'mario rossi', 'giu', 'viaggiatore12345', 'dolomiti', f"cliente{table_size // 2}@example.com"]:
+            timings = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                results = db.get_orders({'search_term': term, 'limit': 200})
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"   '{term}' → {len(results):>3} risultati, mediana {timings[len(timings) // 2] * 1000:7.2f} ms")
+        db.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def bench_orders_list(table_size: int = 50000, rounds: int = 5):
+    """Aggiornamento della lista ordini: lista completa (tutte le colonne o solo quelle della tabella) contro una pagina"""
+    from modern_components import ModernOrdersView
+    print(f"\n📋 get_orders senza filtri su {table_size:,} ordini")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(db_path=os.path.join(tmp_dir, 'bench.db'))
+        for start in range(1, table_size + 1, 1000):
+            db.sync_multiple_orders([make_order(woo_id) for woo_id in range(start, min(start + 1000, table_size + 1))])
+        for label, columns in [('SELECT o.*', None), ('colonne tabella', ModernOrdersView.COLUMNS)]:
+            timings = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                db.get_orders(columns=columns)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"   {label:<16} → mediana {timings[len(timings) // 2] * 1000:8.1f} ms")
+        # Tabella a finestra: prima pagina e pagina dopo metà archivio (paginazione keyset, niente OFFSET)
+        middle = db.get_orders_page(columns=['woo_id'], limit=table_size // 2)[-1]
+        for label, key in [('prima pagina', None), ('pagina a metà', (middle['page_key'], middle['woo_id']))]:
+            timings = []
+            for _ in range(rounds * 20):
+                start = time.perf_counter()
+                db.get_orders_page(columns=ModernOrdersView.COLUMNS, after=key, limit=ModernOrdersView.PAGE_SIZE)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"   {label:<16} → mediana {timings[len(timings) // 2] * 1000:8.2f} ms")
+        db.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def bench_dashboard_redraw(updates: int = 30):
+    """Costo per aggiornamento della dashboard: ricostruzione di tutti i grafici contro ridisegno mirato"""
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from modern_dashboard import StatusDonutChart, TimelineChart, ProductsChart
+    print(f"\n🍩 Dashboard: {updates} aggiornamenti con statistiche che cambiano di poco")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(db_path=os.path.join(tmp_dir, 'bench.db'))
+        db.sync_multiple_orders([make_order(woo_id) for woo_id in range(1, 2001)])
+        snapshots = []
+        for revision in range(1, updates + 1):
+            db.sync_multiple_orders([make_order(random.randint(1, 2000), revision=revision)])
+            snapshots.append(db.get_order_stats())
+        db.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def make_charts():
+        charts = []
+        for chart_class in (StatusDonutChart, TimelineChart, ProductsChart):
+            figure = Figure(figsize=(5, 4), dpi=100)
+            charts.append(chart_class(figure, FigureCanvasAgg(figure)))
+        return charts
+
+    def feed(charts, stats):
+        for chart, key in zip(charts, ('by_status', 'by_date', 'top_products')): chart.set_data(stats.get(key, {}))
+
+    charts = make_charts()
+    start = time.perf_counter()
+    for stats in snapshots:
+        feed(charts, stats)
+        for chart in charts: chart.render(force_rebuild=True)
+    full = (time.perf_counter() - start) / len(snapshots)
+
+    charts = make_charts()
+    feed(charts, snapshots[0]); charts[0].render()
+    start = time.perf_counter()
+    for stats in snapshots:
+        feed(charts, stats)
+        charts[0].render()  # solo la scheda visibile, riusando gli artist
+    visible = (time.perf_counter() - start) / len(snapshots)
+    start = time.perf_counter()
+    for _ in snapshots:
+        feed(charts, snapshots[-1]); charts[0].render()  # dati invariati: nessun ridisegno
+    unchanged = (time.perf_counter() - start) / len(snapshots)
+    print(f"   ricostruzione di tutti i grafici → {full * 1000:7.1f} ms/aggiornamento")
+    print(f"   solo scheda visibile, artist riusati → {visible * 1000:7.1f} ms/aggiornamento")
+    print(f"   statistiche invariate (impronta) → {unchanged * 1000:7.2f} ms/aggiornamento")
+
+def bench_export_memory(table_sizes=(5000, 20000, 80000)):
+    """Picco di memoria e tempo dell'export CSV completo (deve restare piatto al crescere dell'archivio)"""
+    print("\n📄 export_orders_csv senza filtri: picco di memoria Python (tracemalloc)")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(db_path=os.path.join(tmp_dir, 'bench.db'))
+        results = []
+        export_manager = ExportManager(db, on_export_complete=results.append)
+        export_manager.exports_dir = tmp_dir
+        loaded = 0
+        for size in table_sizes:
+            for start in range(loaded + 1, size + 1, 1000):
+                db.sync_multiple_orders([make_order(woo_id) for woo_id in range(start, min(start + 1000, size + 1))])
+            loaded = size
+            tracemalloc.start()
+            start = time.perf_counter()
+            export_manager.export_orders_csv()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"   {size:>7,} ordini → {results[-1].total_records:,} righe in {elapsed:6.2f} s, picco {peak / 1024 / 1024:6.1f} MB")
+            os.remove(results[-1].file_path)
+        db.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def bench_order_analytics(order_count: int = 400000, item_count: int = 1000000):
+    """Statistiche dashboard su un milione di righe prodotto: cicli Python sui dizionari contro array NumPy"""
+    from datetime import date, timedelta
+    from order_analytics import OrderAnalytics
+    print(f"\n📈 Statistiche su {order_count:,} ordini e {item_count:,} righe prodotto")
+    rnd = random.Random(42)
+    today = date(2025, 12, 31)
+    days = [(today - timedelta(days=rnd.randrange(730))).isoformat() for _ in range(order_count)]
+    status_rows = [(day, rnd.choice(STATUSES), 1, rnd.uniform(20, 600)) for day in days]
+    product_rows = [(days[rnd.randrange(order_count)], rnd.choice(PRODUCTS), rnd.randint(1, 4)) for _ in range(item_count)]
+
+    start = time.perf_counter()
+    cutoff = (today - timedelta(days=30)).isoformat()
+    stats = {'total_orders': 0, 'total_revenue': 0.0, 'by_status': {}, 'by_date': {}, 'top_products': {}}
+    for day, status, orders, revenue in status_rows:
+        if day < cutoff: continue
+        stats['total_orders'] += orders; stats['total_revenue'] += revenue
+        stats['by_status'][status] = stats['by_status'].get(status, 0) + orders
+        stats['by_date'][day] = stats['by_date'].get(day, 0) + orders
+    for day, product, quantity in product_rows:
+        if day >= cutoff: stats['top_products'][product] = stats['top_products'].get(product, 0) + quantity
+    loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analytics = OrderAnalytics.from_rollups(status_rows, product_rows)
+    load = time.perf_counter() - start
+    start = time.perf_counter()
+    summary = analytics.summary(30, today=today)
+    vectorized = time.perf_counter() - start
+    assert summary['total_orders'] == stats['total_orders'] and summary['by_status'] == stats['by_status']
+    print(f"   cicli Python (solo ultimi 30 gg, senza KPI) → {loop * 1000:7.1f} ms")
+    print(f"   NumPy: caricamento colonne               → {load * 1000:7.1f} ms")
+    print(f"   NumPy: riepilogo + serie + confronto KPI → {vectorized * 1000:7.1f} ms")
+
+    # Dal database gli array arrivano dagli aggregati giornalieri: una riga per giorno e stato/prodotto
+    day_status = {}
+    for day, status, orders, revenue in status_rows:
+        entry = day_status.setdefault((day, status), [0, 0.0]); entry[0] += orders; entry[1] += revenue
+    day_products = {}
+    for day, product, quantity in product_rows: day_products[(day, product)] = day_products.get((day, product), 0) + quantity
+    rollup_status = [(day, status, orders, revenue) for (day, status), (orders, revenue) in day_status.items()]
+    rollup_products = [(day, product, quantity) for (day, product), quantity in day_products.items()]
+    start = time.perf_counter()
+    OrderAnalytics.from_rollups(rollup_status, rollup_products).summary(30, today=today)
+    rollups = time.perf_counter() - start
+    print(f"   NumPy su aggregati giornalieri ({len(rollup_status) + len(rollup_products):,} righe) → {rollups * 1000:7.1f} ms")
+
+def bench_payload_storage(order_count: int = 50000, lookups: int = 5000):
+    """Dimensione del database e letture di raw_data: JSON in chiaro in orders (schema v8) contro payload compressi (v9)"""
+    import json, sqlite3
+    from database_manager import MIGRATIONS, decompress_payload
+    from order_fingerprint import encode_order
+    print(f"\n🗜️  Payload raw_data: {order_count:,} ordini in formato WooCommerce completo")
+
+    def full_order(woo_id: int) -> dict:
+        # make_order con i campi che l'API WooCommerce restituisce sempre (indirizzi, tasse, link, meta)
+        order = make_order(woo_id)
+        address = {'company': '', 'address_1': f"Via Roma {woo_id % 200}", 'address_2': '', 'city': 'Milano', 'state': 'MI', 'postcode': '20100', 'country': 'IT'}
+        order['billing'].update(address); order['shipping'].update(address, phone='')
+        order.update({'parent_id': 0, 'order_key': f"wc_order_{woo_id:x}{woo_id * 7919:x}", 'version': '8.9.1', 'prices_include_tax': True,
+                      'date_created_gmt': order['date_created'], 'date_modified_gmt': order['date_modified'], 'discount_total': '0.00', 'discount_tax': '0.00',
+                      'shipping_tax': '0.00', 'cart_tax': '0.00', 'transaction_id': f"pi_{woo_id * 104729:x}", 'customer_ip_address': f"93.45.{woo_id % 250}.{woo_id % 199}",
+                      'customer_user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+                      'created_via': 'checkout', 'customer_note': '', 'date_paid': order['date_created'], 'cart_hash': f"{woo_id * 2654435761:032x}"[-32:],
+                      'tax_lines': [], 'fee_lines': [], 'coupon_lines': [], 'refunds': [], 'currency_symbol': '€',
+                      '_links': {'self': [{'href': f"https://gitemania.it/wp-json/wc/v3/orders/{woo_id}"}], 'collection': [{'href': 'https://gitemania.it/wp-json/wc/v3/orders'}]}})
+        for item in order['line_items']:
+            item.update({'variation_id': 0, 'tax_class': '', 'subtotal': item['total'], 'subtotal_tax': '0.00', 'total_tax': '0.00', 'taxes': [], 'meta_data': [],
+                         'sku': f"GITA-{item['product_id']}", 'price': float(item['total']) / item['quantity'], 'image': {'id': '', 'src': ''}, 'parent_name': None})
+        return order
+
+    def timed_reads(read):
+        ids = random.Random(7).sample(range(1, order_count + 1), lookups)
+        start = time.perf_counter()
+        for woo_id in ids: assert read(woo_id)['id'] == woo_id
+        return lookups / (time.perf_counter() - start)
+
+    def timed_scan(conn):
+        # Scansione delle colonne della lista ordini: misura quante righe entrano nelle pagine lette
+        start = time.perf_counter()
+        for _ in range(5): conn.execute('SELECT COUNT(customer_name), SUM(total) FROM orders').fetchone()
+        return (time.perf_counter() - start) / 5
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # Database v8: raw_data in chiaro nella tabella orders, scritto come faceva sync_multiple_orders
+        legacy_path = os.path.join(tmp_dir, 'legacy.db')
+        conn = sqlite3.connect(legacy_path)
+        for version, _, migrate in MIGRATIONS[:8]: migrate(conn.cursor())
+        conn.execute(f'PRAGMA user_version = {MIGRATIONS[7][0]}')
+        # Colonne di _extract_order_data con raw_data al posto di payload_digest (sync_seq non esiste ancora nello schema v8)
+        legacy_columns = [column if column != 'payload_digest' else 'raw_data' for column in DatabaseManager._extract_order_data(None, full_order(1), encode_order(full_order(1)))]
+        legacy_sql = f"INSERT INTO orders ({', '.join(legacy_columns)}) VALUES ({', '.join('?' * len(legacy_columns))})"
+        for start in range(1, order_count + 1, 1000):
+            rows = []
+            for woo_id in range(start, min(start + 1000, order_count + 1)):
+                order = full_order(woo_id)
+                encoded = encode_order(order)
+                values = list(DatabaseManager._extract_order_data(None, order, encoded).values())
+                values[19] = encoded.raw_data
+                rows.append(values)
+            conn.executemany(legacy_sql, rows)
+        conn.commit(); conn.execute('VACUUM'); conn.close()
+        legacy_size = os.path.getsize(legacy_path)
+        conn = sqlite3.connect(legacy_path); conn.row_factory = sqlite3.Row
+        legacy_reads = timed_reads(lambda woo_id: json.loads(conn.execute('SELECT * FROM orders WHERE woo_id = ?', (woo_id,)).fetchone()['raw_data']))
+        legacy_scan = timed_scan(conn)
+        conn.close()
+
+        # Stesso file aggiornato dalla migrazione v9
+        migrated_path = os.path.join(tmp_dir, 'migrated.db')
+        shutil.copy(legacy_path, migrated_path)
+        start = time.perf_counter()
+        db = DatabaseManager(db_path=migrated_path)
+        migration = time.perf_counter() - start
+        db.close()
+        migrated_size = os.path.getsize(migrated_path)
+        # Stessa lettura di get_order (SQL diretto in entrambi i casi): sottoquery sullo store e decompressione
+        conn = sqlite3.connect(migrated_path); conn.row_factory = sqlite3.Row
+        query = f"SELECT {DatabaseManager._select_columns()} FROM orders o WHERE o.woo_id = ?"
+        migrated_reads = timed_reads(lambda woo_id: json.loads(decompress_payload(conn.execute(query, (woo_id,)).fetchone()['raw_data'])))
+        migrated_scan = timed_scan(conn)
+        conn.close()
+
+        print(f"   v8 raw_data in chiaro  → {legacy_size / 1024 / 1024:7.1f} MB, letture raw_data {legacy_reads:8,.0f}/s, scansione lista {legacy_scan * 1000:6.1f} ms")
+        print(f"   v9 payload compressi   → {migrated_size / 1024 / 1024:7.1f} MB, letture raw_data {migrated_reads:8,.0f}/s, scansione lista {migrated_scan * 1000:6.1f} ms")
+        print(f"   migrazione v9 + VACUUM → {migration:6.2f} s ({migrated_size / legacy_size:.0%} della dimensione originale)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def bench_order_fingerprint(order_count: int = 100000):
+    """Rilevamento modifiche per ordine: json.dumps ordinato + MD5 e colonne serializzate a parte, contro order_fingerprint"""
+    import hashlib, json
+    from order_fingerprint import encode_order, fingerprint, same_revision
+    print(f"\n🔑 Impronte di {order_count:,} ordini sintetici")
+    orders = [make_order(woo_id) for woo_id in range(1, order_count + 1)]
+
+    def legacy(order):
+        # Percorso precedente di DatabaseManager: hash sui campi ordinati, poi ogni colonna JSON serializzata di nuovo
+        data = {k: order.get(k) for k in ('status', 'total', 'date_modified', 'line_items')}
+        order_hash = hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+        return (order_hash, json.dumps(order.get('billing', {}) or {}), json.dumps(order.get('shipping', {}) or {}),
+                json.dumps(order.get('line_items', [])), json.dumps(order.get('shipping_lines', [])), json.dumps(order))
+
+    def legacy_supabase(order):
+        data = {k: order[k] for k in ('status', 'total', 'date_modified', 'line_items', 'shipping_lines', 'payment_method') if k in order}
+        return hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+    for label, run in [('SQLite: json.dumps ordinato + MD5 + colonne', legacy),
+                       ('SQLite: encode_order (una serializzazione)', encode_order),
+                       ('Supabase: json.dumps ordinato + MD5', legacy_supabase),
+                       ('Supabase: fingerprint', fingerprint),
+                       ('fast path date_modified invariata', lambda order: same_revision(order, order['date_modified'], order['status']))]:
+        start = time.perf_counter()
+        for order in orders: run(order)
+        elapsed = time.perf_counter() - start
+        print(f"   {label:<44} → {elapsed * 1000:8.1f} ms ({elapsed / order_count * 1e6:5.2f} µs/ordine)")
+
+def bench_supabase_round_trips(order_count: int = 1000):
+    """Richieste HTTP verso Supabase per sincronizzare order_count ordini: sync_order uno alla volta contro sync_multiple_orders"""
+    from supabase_manager import SupabaseManager
+    from test_suite import StubPostgrestServer
+    print(f"\n☁️  Supabase (stub PostgREST locale): {order_count:,} ordini")
+    for label, sync in [('sync_order per ordine', lambda manager, orders: [manager.sync_order(order) for order in orders]),
+                        ('sync_multiple_orders', lambda manager, orders: manager.sync_multiple_orders(orders))]:
+        stub = StubPostgrestServer()
+        try:
+            manager = SupabaseManager()
+            manager.initialize(stub.url, 'bench-key')
+            for phase, revision in [('nuovi', 0), ('modificati', 1), ('invariati', 1)]:
+                orders = [make_order(woo_id, revision=revision) for woo_id in range(1, order_count + 1)]
+                stub.requests.clear()
+                start = time.perf_counter()
+                sync(manager, orders)
+                elapsed = time.perf_counter() - start
+                print(f"   {label:<22} {phase:<10} → {len(stub.requests):5,} richieste in {elapsed:6.2f} s")
+        finally:
+            stub.close()
+
+def bench_sync_pipeline(order_count: int = 50000, page_size: int = 100):
+    """Sincronizzazione completa: sync_multiple_orders pagina per pagina contro SyncPipeline con statistiche per stadio"""
+    from sync_pipeline import SyncPipeline
+    print(f"\n🚚 Sincronizzazione completa di {order_count:,} ordini in pagine da {page_size}")
+    pages = [[make_order(woo_id) for woo_id in range(first, min(first + page_size, order_count + 1))] for first in range(1, order_count + 1, page_size)]
+    for label, workers in [('sequenziale (sync_multiple_orders)', None), ('pipeline 1 worker', 1), ('pipeline 4 worker', 4)]:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db = DatabaseManager(db_path=os.path.join(tmp_dir, 'bench.db'))
+            start = time.perf_counter()
+            if workers is None:
+                for page in pages: db.sync_multiple_orders(page)
+            else:
+                pipeline = SyncPipeline(db, workers=workers).start()
+                for page in pages: pipeline.submit(page)
+                pipeline.finish()
+            elapsed = time.perf_counter() - start
+            print(f"   {label:<36} → {elapsed:6.2f} s ({order_count / elapsed:8,.0f} ordini/s)")
+            db.close()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def bench_incremental_export(order_count: int = 50000, changed: int = 500):
+    """Export pianificato dopo una giornata di modifiche: export completo contro incrementale (solo ordini modificati)"""
+    print(f"\n🗓️  Export pianificato: {order_count:,} ordini in archivio, {changed:,} modificati dall'ultimo export")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(db_path=os.path.join(tmp_dir, 'bench.db'))
+        for start in range(1, order_count + 1, 1000):
+            db.sync_multiple_orders([make_order(woo_id) for woo_id in range(start, min(start + 1000, order_count + 1))])
+        export_manager = ExportManager(db)
+        export_manager.exports_dir = tmp_dir
+        export_manager.run_scheduled_export({'name': 'incrementale'})
+        changed_orders = [dict(make_order(woo_id), date_modified=f"2026-01-01T00:00:{i % 60:02d}") for i, woo_id in enumerate(range(1, order_count + 1, order_count // changed))]
+        db.sync_multiple_orders(changed_orders)
+        for label, entry in [('completo', {'name': 'completo', 'incremental': False}), ('incrementale', {'name': 'incrementale'})]:
+            start = time.perf_counter()
+            result = export_manager.run_scheduled_export(entry)
+            elapsed = time.perf_counter() - start
+            print(f"   {label:<14} → {result.total_records:7,} righe in {elapsed * 1000:8.1f} ms")
+        db.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def run_benchmarks():
+    """Esegue tutti i benchmark"""
+    print("=" * 60)
+    print("  BENCHMARK GESTIONALE GITEMANIA")
+    print("  Sviluppato da TechExpresso")
+    print("=" * 60)
+    bench_incremental_sync()
+    bench_search()
+    bench_orders_list()
+    bench_dashboard_redraw()
+    bench_export_memory()
+    bench_order_analytics()
+    bench_payload_storage()
+    bench_order_fingerprint()
+    bench_supabase_round_trips()
+    bench_sync_pipeline()
+    bench_incremental_export()
+    print("=" * 60)
+
+if __name__ == "__main__":
+    run_benchmarks()
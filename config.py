@@ -19,7 +19,11 @@ class Config:
         self._fernet = None
         self.default_config = {
             "woocommerce": {"base_url": "", "consumer_key": "", "consumer_secret": ""},
-            "app": {"sync_interval": 60, "per_page": 100, "first_run": True},
+            "app": {"sync_interval": 60, "per_page": 100, "sync_concurrency": 4, "http_pool_size": 10, "http_max_retries": 4, "traveler_prefetch_concurrency": 4, "traveler_retry_hours": 24, "view_refresh_ms": 300, "ui_tick_budget_ms": 30, "sync_transform_workers": 0, "sync_pipeline_queue": 4, "sync_write_batch": 1000, "first_run": True},
+            "webhook": {"enabled": False, "host": "0.0.0.0", "port": 8765, "batch_max_orders": 50, "batch_interval_ms": 500, "reconciliation_interval": 900},
+            "export": {"fetch_size": 500, "schedules": [{"name": "giornaliero", "cron": "0 0 * * *", "incremental": True}]},
+            "dashboard": {"debounce_ms": 250, "kpi_period_days": 30, "growth_target": 15},
+            "supabase": {"url": "", "key": "", "sync_chunk_size": 500, "postgres_dsn": "", "direct_postgres": False, "postgres_pool_size": 4, "bulk_import_batch_size": 5000, "backup_page_size": 1000, "replication_enabled": False, "replication_batch_size": 200, "replication_interval": 30, "replication_retry_base": 5, "replication_retry_max": 600},
         }
         self._load_or_create_config()
     def get_database_path(self) -> str: return self.db_file
@@ -3,135 +3,914 @@
 """
 Database Manager SQLite per Gestionale Gitemania PORTABLE (Versione con statistiche complete)
 """
-import sqlite3, json, hashlib, os, threading
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+import sqlite3, json, hashlib, os, re, threading, time, queue, zlib
 from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 from config import config
+from order_analytics import OrderAnalytics
+from order_fingerprint import COMPACT_JSON, EncodedOrder, encode_order, older_revision, same_revision
+
+INSERT_ORDER_SQL = 'INSERT INTO orders (woo_id, order_number, status, currency, total, total_tax, shipping_total, customer_id, customer_email, customer_name, billing_data, shipping_data, line_items, shipping_lines, payment_method, payment_method_title, date_created, date_modified, date_completed, payload_digest, hash_signature, sync_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+UPDATE_ORDER_SQL = 'UPDATE orders SET order_number=?, status=?, currency=?, total=?, total_tax=?, shipping_total=?, customer_id=?, customer_email=?, customer_name=?, billing_data=?, shipping_data=?, line_items=?, shipping_lines=?, payment_method=?, payment_method_title=?, date_created=?, date_modified=?, date_completed=?, payload_digest=?, hash_signature=?, sync_seq=? WHERE woo_id = ?'
+
+UPSERT_TRAVELER_CACHE_SQL = 'INSERT INTO traveler_cache (woo_id, date_modified, travelers, fetched_at) VALUES (?, ?, ?, ?) ON CONFLICT(woo_id) DO UPDATE SET date_modified = excluded.date_modified, travelers = excluded.travelers, fetched_at = excluded.fetched_at'
+TRAVELERS_FETCH_FAILED = json.dumps(None)  # voce negativa della cache viaggiatori
+UPSERT_SYNC_STATE_SQL = 'INSERT INTO sync_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value'
+# Una nuova modifica sostituisce il payload in coda ma mantiene enqueued_at: il ritardo resta quello della modifica più vecchia non replicata
+UPSERT_OUTBOX_SQL = 'INSERT INTO replication_outbox (woo_id, hash_signature, payload, enqueued_at) VALUES (?, ?, ?, ?) ON CONFLICT(woo_id) DO UPDATE SET hash_signature = excluded.hash_signature, payload = excluded.payload, attempts = 0, next_attempt_at = 0'
+INSERT_ORDER_ITEM_SQL = 'INSERT INTO order_items (order_woo_id, product_id, name, quantity, total) VALUES (?, ?, ?, ?, ?)'
+
+def extract_order_items(woo_id: int, line_items) -> List[tuple]:
+    """Righe normalizzate di order_items a partire dai line_items WooCommerce."""
+    items = []
+    for item in line_items or []:
+        try: total = float(item.get('total') or 0)
+        except (TypeError, ValueError): total = 0.0
+        items.append((woo_id, item.get('product_id'), item.get('name') or 'Sconosciuto', int(item.get('quantity') or 0), total))
+    return items
+
+TRAVELER_META_KEYS = ['dati_viaggiatori', '_dati_viaggiatori', 'traveler_data', '_traveler_data', '_viaggiatori_data']
+TRAVELER_SEARCH_FIELDS = ['nome', 'cognome', 'email', 'telefono']
+INSERT_ORDER_FTS_SQL = 'INSERT INTO orders_fts (rowid, order_number, customer, products, travelers) VALUES (?, ?, ?, ?, ?)'
+
+def extract_travelers_from_meta(meta_data) -> List[dict]:
+    """Viaggiatori salvati nei meta_data dell'ordine (stesse chiavi lette dall'export)."""
+    for item in meta_data or []:
+        if not isinstance(item, dict) or str(item.get('key', '')).lower() not in TRAVELER_META_KEYS: continue
+        value = item.get('value')
+        if not value: continue
+        try: data = json.loads(value.replace('\\"', '"')) if isinstance(value, str) else value
+        except (json.JSONDecodeError, TypeError): continue
+        if isinstance(data, dict): data = [data]
+        if isinstance(data, list): return [t for t in data if isinstance(t, dict)]
+    return []
+
+def build_search_document(order_data: dict) -> tuple:
+    """Riga di orders_fts (rowid = woo_id) a partire dall'ordine WooCommerce completo."""
+    billing = order_data.get('billing', {}) or {}
+    customer = ' '.join(str(billing.get(k) or '') for k in ('first_name', 'last_name', 'email', 'phone'))
+    products = ' '.join(str(item.get('name') or '') for item in order_data.get('line_items', []) or [])
+    travelers = ' '.join(str(t.get(k) or '') for t in extract_travelers_from_meta(order_data.get('meta_data')) for k in TRAVELER_SEARCH_FIELDS)
+    return (order_data.get('id'), f"{order_data.get('number', '')} {order_data.get('id', '')}", customer, products, travelers)
+
+def build_fts_query(search_term: str) -> str:
+    """
+    Trasforma il testo della casella Cerca in una query FTS5: ogni parola diventa un prefisso obbligatorio.
+    Le parole composte (email, telefoni con trattini) restano una frase, così "mario@exa" non cerca "exa*" ovunque.
+    """
+    terms = []
+    for word in (search_term or '').split():
+        tokens = re.findall(r'\w+', word)
+        if tokens: terms.append(' + '.join(f'"{token}"' for token in tokens) + '*')
+    return ' '.join(terms)
+
+ORDER_JSON_FIELDS = ('billing_data', 'shipping_data', 'line_items', 'raw_data')
+
+# Payload raw_data: il JSON completo dell'ordine è salvato una volta per contenuto in order_payloads
+# (chiave: BLAKE2b del JSON), compresso con zlib e un dizionario predefinito delle chiavi WooCommerce.
+# Il primo byte indica il codec: i dizionari non vanno mai modificati (servono per decomprimere
+# i payload già salvati); un dizionario diverso richiede un nuovo codec.
+PAYLOAD_CODEC_RAW, PAYLOAD_CODEC_ZLIB, PAYLOAD_CODEC_ZLIB_COMPACT = b'\x00', b'\x01', b'\x02'
+PAYLOAD_SKELETON = {
+    'meta_data': [{'id': 0, 'key': '_dati_viaggiatori', 'value': [{'nome': '', 'cognome': '', 'email': '', 'telefono': ''}]}],
+    'tax_lines': [], 'fee_lines': [], 'coupon_lines': [], 'refunds': [], 'currency_symbol': '€', 'customer_note': '',
+    'shipping_lines': [{'id': 0, 'method_title': '', 'method_id': 'flat_rate', 'instance_id': '', 'total': '0.00', 'total_tax': '0.00', 'taxes': [], 'meta_data': []}],
+    'line_items': [{'id': 0, 'name': '', 'product_id': 0, 'variation_id': 0, 'quantity': 1, 'tax_class': '', 'subtotal': '0.00', 'subtotal_tax': '0.00',
+                    'total': '0.00', 'total_tax': '0.00', 'taxes': [], 'meta_data': [], 'sku': '', 'price': 0, 'image': {'id': '', 'src': ''}, 'parent_name': None}],
+    'payment_method': 'stripe', 'payment_method_title': 'Carta di credito', 'transaction_id': '', 'customer_ip_address': '', 'customer_user_agent': '', 'created_via': 'checkout',
+    'shipping': {'first_name': '', 'last_name': '', 'company': '', 'address_1': '', 'address_2': '', 'city': '', 'state': '', 'postcode': '', 'country': 'IT', 'phone': ''},
+    'billing': {'first_name': '', 'last_name': '', 'company': '', 'address_1': '', 'address_2': '', 'city': '', 'state': '', 'postcode': '', 'country': 'IT', 'email': '@gmail.com', 'phone': ''},
+    'id': 0, 'parent_id': 0, 'number': '', 'order_key': 'wc_order_', 'status': 'completed', 'currency': 'EUR', 'version': '', 'prices_include_tax': True,
+    'date_created': '2025-01-01T00:00:00', 'date_created_gmt': '', 'date_modified': '2025-01-01T00:00:00', 'date_modified_gmt': '', 'date_completed': None, 'date_paid': None,
+    'discount_total': '0.00', 'discount_tax': '0.00', 'shipping_total': '0.00', 'shipping_tax': '0.00', 'cart_tax': '0.00', 'total': '0.00', 'total_tax': '0.00', 'customer_id': 0,
+}
+# Codec 1: JSON di json.dumps; codec 2: JSON compatto di orjson (vedi order_fingerprint.dumps)
+PAYLOAD_ZDICTS = {PAYLOAD_CODEC_ZLIB: json.dumps(PAYLOAD_SKELETON).encode(),
+                  PAYLOAD_CODEC_ZLIB_COMPACT: json.dumps(PAYLOAD_SKELETON, separators=(',', ':'), ensure_ascii=False).encode()}
+PAYLOAD_CODEC = PAYLOAD_CODEC_ZLIB_COMPACT if COMPACT_JSON else PAYLOAD_CODEC_ZLIB
+PAYLOAD_DIGEST_SIZE = 16
+
+def payload_digest(payload: str) -> bytes:
+    """
+    Chiave di contenuto di un payload JSON (BLAKE2b a 128 bit). Il payload è l'ordine completo, id e
+    date_modified compresi: due ordini diversi non condividono mai un digest. La deduplica evita solo copie
+    della stessa revisione di un ordine (risincronizzazioni, pagine ripetute), non contenuti simili tra ordini.
+    """
+    return hashlib.blake2b(payload.encode(), digest_size=PAYLOAD_DIGEST_SIZE).digest()
+
+def compress_payload(payload: str, codec: bytes = PAYLOAD_CODEC) -> bytes:
+    compressor = zlib.compressobj(6, zdict=PAYLOAD_ZDICTS[codec])
+    return codec + compressor.compress(payload.encode()) + compressor.flush()
+
+def decompress_payload(data: bytes) -> str:
+    codec, body = data[:1], data[1:]
+    if codec in PAYLOAD_ZDICTS:
+        decompressor = zlib.decompressobj(zdict=PAYLOAD_ZDICTS[codec])
+        return (decompressor.decompress(body) + decompressor.flush()).decode()
+    if codec == PAYLOAD_CODEC_RAW: return body.decode()
+    raise ValueError(f"Codec payload sconosciuto: {codec!r}")
+
+# raw_data letto on demand dallo store dei payload (compresso: OrderRow lo decomprime al primo accesso)
+RAW_DATA_COLUMN_SQL = "(SELECT p.data FROM order_payloads p WHERE p.digest = o.payload_digest) AS raw_data"
+# Colonne di un ordine completo, nell'ordine storico di SELECT *: payload_digest resta interno
+ORDER_COLUMNS = ('id', 'woo_id', 'order_number', 'status', 'currency', 'total', 'total_tax', 'shipping_total', 'customer_id', 'customer_email', 'customer_name',
+                 'billing_data', 'shipping_data', 'line_items', 'shipping_lines', 'payment_method', 'payment_method_title', 'date_created', 'date_modified',
+                 'date_completed', 'raw_data', 'hash_signature', 'order_date')
+INSERT_PAYLOAD_SQL = 'INSERT OR IGNORE INTO order_payloads (digest, data) VALUES (?, ?)'
+# Payload non più referenziati da alcun ordine (tra quelli indicati): lookup sull'indice idx_orders_payload_digest
+DELETE_ORPHAN_PAYLOAD_SQL = 'DELETE FROM order_payloads WHERE digest = ? AND NOT EXISTS (SELECT 1 FROM orders WHERE payload_digest = ?)'
+
+class SyncResult(tuple):
+    """Esito di sync_multiple_orders: si usa come la tupla (inseriti, aggiornati), con in più i woo_id toccati."""
+
+    def __new__(cls, inserted_ids: List[int] = (), updated_ids: List[int] = ()):
+        result = super().__new__(cls, (len(inserted_ids), len(updated_ids)))
+        result.inserted_ids, result.updated_ids = list(inserted_ids), list(updated_ids)
+        return result
+
+    @property
+    def changed_ids(self) -> List[int]:
+        """woo_id inseriti o aggiornati, senza ripetizioni."""
+        return list(dict.fromkeys(self.inserted_ids + self.updated_ids))
+
+@dataclass
+class PreparedOrder:
+    """Ordine pronto per write_prepared_orders: tutto il lavoro CPU (serializzazione, compressione, righe derivate) è già fatto."""
+    woo_id: int
+    row: tuple  # valori di INSERT_ORDER_SQL senza sync_seq (assegnato al momento della scrittura)
+    revision: tuple  # (impronta, date_modified, stato)
+    digest: bytes
+    payload: bytes  # raw_data compresso
+    raw_data: str  # JSON per la coda di replica
+    items: List[tuple]
+    document: Optional[tuple]  # riga di orders_fts (None senza FTS5)
+    contribution: tuple  # (giorno, stato, totale, prodotti) per gli aggregati
+
+# Chiavi di ordinamento della lista paginata: stesse espressioni degli indici della migrazione v7
+PAGE_SORT_KEYS = {
+    'woo_id': "o.woo_id",
+    'date_created': "IFNULL(o.date_created, '')",
+    'customer_name': "IFNULL(o.customer_name, '')",
+    'status': "IFNULL(o.status, '')",
+    'total': "IFNULL(o.total, 0)",
+    'payment_method_title': "IFNULL(o.payment_method_title, '')",
+}
+# Ordinamento per pertinenza della ricerca full-text (predefinito con search_term): numero ordine e cliente
+# pesano più di prodotti e viaggiatori. Segno invertito: con descending=True i più pertinenti vengono prima
+RELEVANCE_SORT = 'relevance'
+BM25_RANK_SQL = "bm25(orders_fts, 10.0, 5.0, 2.0, 3.0)"
+
+class OrderRow(dict):
+    """
+    Riga della tabella orders. Le colonne JSON restano testo (raw_data: payload compresso) finché non vengono
+    lette: il primo accesso le decodifica e memorizza il risultato (la lista ordini non paga mai raw_data).
+    """
+    __slots__ = ('_encoded',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encoded = {field for field in ORDER_JSON_FIELDS if isinstance(dict.get(self, field), (str, bytes))}
+
+    def _decode(self, field):
+        self._encoded.discard(field)
+        value = dict.__getitem__(self, field)
+        try: 
+            if isinstance(value, bytes): value = decompress_payload(value)
+            value = json.loads(value) if value else value
+        except (ValueError, TypeError, zlib.error):
+            print(f"⚠️ Warning: Impossibile decodificare il campo JSON '{field}' per l'ordine ID {dict.get(self, 'woo_id')}")
+            value = {}
+        dict.__setitem__(self, field, value)
+
+    def _decode_all(self):
+        for field in list(self._encoded): self._decode(field)
+
+    def __getitem__(self, key):
+        if key in self._encoded: self._decode(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        self._encoded.discard(key); dict.__setitem__(self, key, value)
+
+    def pop(self, key, *default):
+        if key in self._encoded: self._decode(key)
+        return dict.pop(self, key, *default)
+
+    # Copie, confronti e serializzazione vedono sempre i valori decodificati
+    def __iter__(self): return dict.__iter__(self)  # niente fast path di dict(): passa da __getitem__
+    def items(self): self._decode_all(); return dict.items(self)
+    def values(self): self._decode_all(); return dict.values(self)
+    def copy(self): self._decode_all(); return OrderRow(dict.items(self))
+    def __eq__(self, other): self._decode_all(); return dict.__eq__(self, other)
+    def __repr__(self): self._decode_all(); return dict.__repr__(self)
+    __hash__ = None
+
+# --- Migrazioni di schema (versione salvata in PRAGMA user_version) ---
+
+def _migrate_v1_base_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, woo_id INTEGER UNIQUE NOT NULL, 
+            order_number TEXT, status TEXT, currency TEXT, total REAL, 
+            total_tax REAL, shipping_total REAL, customer_id INTEGER, 
+            customer_email TEXT, customer_name TEXT, billing_data TEXT, 
+            shipping_data TEXT, line_items TEXT, shipping_lines TEXT, 
+            payment_method TEXT, payment_method_title TEXT, date_created TEXT, 
+            date_modified TEXT, date_completed TEXT, raw_data TEXT, 
+            hash_signature TEXT
+        )
+    ''')
+
+def _migrate_v2_order_items_and_indexes(cursor):
+    # Giorno dell'ordine calcolato da SQLite: raggruppamenti per data senza substr() in Python
+    cursor.execute("ALTER TABLE orders ADD COLUMN order_date TEXT GENERATED ALWAYS AS (substr(date_created, 1, 10)) VIRTUAL")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_woo_id INTEGER NOT NULL REFERENCES orders(woo_id) ON DELETE CASCADE,
+            product_id INTEGER, name TEXT, quantity INTEGER, total REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_woo_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_date_created ON orders(date_created)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_customer_email ON orders(customer_email)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_date ON orders(status, date_created)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders(order_date)')
+    # Popola order_items dai line_items JSON già presenti nei database esistenti
+    for woo_id, line_items in cursor.execute('SELECT woo_id, line_items FROM orders').fetchall():
+        try: items = extract_order_items(woo_id, json.loads(line_items) if line_items else [])
+        except (json.JSONDecodeError, TypeError, AttributeError): continue
+        cursor.executemany(INSERT_ORDER_ITEM_SQL, items)
+
+def _migrate_v3_orders_fts(cursor):
+    # remove_diacritics: "nicolò" trova "nicolo"; prefix: indici dedicati per i prefissi corti digitati nella ricerca
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+                order_number, customer, products, travelers,
+                tokenize = "unicode61 remove_diacritics 2", prefix = '2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ FTS5 non disponibile, la ricerca userà LIKE: {e}")
+        return
+    for (raw_data,) in cursor.execute('SELECT raw_data FROM orders').fetchall():
+        try: cursor.execute(INSERT_ORDER_FTS_SQL, build_search_document(json.loads(raw_data)))
+        except (json.JSONDecodeError, TypeError, AttributeError): continue
+
+def _rebuild_stats(cursor):
+    """Ricalcola da zero le tabelle di aggregati a partire da orders e order_items."""
+    cursor.execute('DELETE FROM stats_daily_status')
+    cursor.execute("INSERT INTO stats_daily_status (day, status, orders, revenue) SELECT COALESCE(order_date, ''), COALESCE(status, ''), COUNT(*), COALESCE(SUM(total), 0) FROM orders GROUP BY 1, 2")
+    cursor.execute('DELETE FROM stats_daily_products')
+    cursor.execute("INSERT INTO stats_daily_products (day, product, quantity) SELECT COALESCE(o.order_date, ''), COALESCE(i.name, 'Sconosciuto'), SUM(i.quantity) FROM order_items i JOIN orders o ON o.woo_id = i.order_woo_id GROUP BY 1, 2")
+
+def _migrate_v4_stats_rollups(cursor):
+    # Aggregati giornalieri mantenuti da sync_multiple_orders: get_order_stats legge poche righe per giorno
+    cursor.execute('CREATE TABLE IF NOT EXISTS stats_daily_status (day TEXT NOT NULL, status TEXT NOT NULL, orders INTEGER NOT NULL, revenue REAL NOT NULL, PRIMARY KEY (day, status)) WITHOUT ROWID')
+    cursor.execute('CREATE TABLE IF NOT EXISTS stats_daily_products (day TEXT NOT NULL, product TEXT NOT NULL, quantity INTEGER NOT NULL, PRIMARY KEY (day, product)) WITHOUT ROWID')
+    _rebuild_stats(cursor)
+
+def _migrate_v5_sync_state(cursor):
+    cursor.execute('CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)')
+
+def _migrate_v6_traveler_cache(cursor):
+    # Risposte dell'endpoint viaggiatori, valide finché date_modified dell'ordine non cambia
+    cursor.execute('CREATE TABLE IF NOT EXISTS traveler_cache (woo_id INTEGER PRIMARY KEY, date_modified TEXT, travelers TEXT NOT NULL, fetched_at TEXT NOT NULL)')
+
+def _migrate_v7_page_sort_indexes(cursor):
+    # Un indice (chiave, woo_id) per colonna ordinabile: ogni pagina della lista è una lettura di intervallo
+    for column, expression in PAGE_SORT_KEYS.items():
+        if column == 'woo_id': continue
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_orders_page_{column} ON orders({expression.replace('o.', '')}, woo_id)")
+    # Filtro per stato con l'ordinamento predefinito (data)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_orders_page_status_date ON orders(status, {PAGE_SORT_KEYS['date_created'].replace('o.', '')}, woo_id)")
+
+def _migrate_v8_replication_outbox(cursor):
+    # Coda write-behind verso Supabase: una voce per ordine (l'ultima versione), rimossa quando il replicatore la conferma
+    cursor.execute('CREATE TABLE IF NOT EXISTS replication_outbox (woo_id INTEGER PRIMARY KEY, hash_signature TEXT NOT NULL, payload TEXT NOT NULL, enqueued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL DEFAULT 0)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_replication_outbox_enqueued ON replication_outbox(enqueued_at)')
+
+def _migrate_v9_payload_store(cursor):
+    # raw_data esce da orders: payload compressi in order_payloads (chiave payload_digest, deduplicata solo tra
+    # copie della stessa revisione), righe di orders più piccole (più righe per pagina, page cache più efficace);
+    # convertiti a blocchi di woo_id. Su database grandi richiede tempo: la GUI la esegue fuori dal thread Tk
+    # (vedi pending_migrations)
+    cursor.execute('CREATE TABLE IF NOT EXISTS order_payloads (digest BLOB PRIMARY KEY, data BLOB NOT NULL)')
+    cursor.execute('ALTER TABLE orders ADD COLUMN payload_digest BLOB')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_payload_digest ON orders(payload_digest)')
+    last_id = None
+    while True:
+        rows = cursor.execute('SELECT woo_id, raw_data FROM orders WHERE woo_id > IFNULL(?, -1) AND raw_data IS NOT NULL ORDER BY woo_id LIMIT 1000', (last_id,)).fetchall()
+        if not rows: break
+        references = [(payload_digest(raw_data), woo_id, raw_data) for woo_id, raw_data in rows]
+        cursor.executemany(INSERT_PAYLOAD_SQL, [(digest, compress_payload(raw_data)) for digest, _, raw_data in references])
+        cursor.executemany('UPDATE orders SET payload_digest = ? WHERE woo_id = ?', [(digest, woo_id) for digest, woo_id, _ in references])
+        last_id = rows[-1][0]
+    try:
+        cursor.execute('ALTER TABLE orders DROP COLUMN raw_data')
+    except sqlite3.OperationalError:
+        cursor.execute('UPDATE orders SET raw_data = NULL')  # SQLite < 3.35: colonna lasciata vuota
+
+def _migrate_v10_export_logs(cursor):
+    # Registro locale degli export con le stesse colonne della tabella export_logs di Supabase, più sync_seq: sequenza di
+    # ingestione locale (ogni scrittura di un ordine gli assegna MAX(sync_seq) + 1). Gli export incrementali riprendono
+    # dal sync_seq dell'ultimo export riuscito invece che da date_modified, che più ordini condividono e che un ordine
+    # sincronizzato in ritardo (webhook perso, orologio del negozio) può avere più vecchia del punto di ripresa
+    cursor.execute('CREATE TABLE IF NOT EXISTS export_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, export_type TEXT NOT NULL, file_name TEXT, file_path TEXT, total_records INTEGER, date_from TEXT, date_to TEXT, status TEXT NOT NULL, error_message TEXT, created_at TEXT NOT NULL, sync_seq INTEGER)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_export_logs_type_status ON export_logs(export_type, status, id)')
+    cursor.execute('ALTER TABLE orders ADD COLUMN sync_seq INTEGER')
+    cursor.execute('UPDATE orders SET sync_seq = id')  # ordini già presenti: tutti nel primo export incrementale
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_sync_seq ON orders(sync_seq)')
+
+MIGRATIONS = [
+    (1, "schema iniziale ordini", _migrate_v1_base_schema),
+    (2, "tabella order_items, colonna order_date e indici", _migrate_v2_order_items_and_indexes),
+    (3, "indice full-text orders_fts", _migrate_v3_orders_fts),
+    (4, "aggregati giornalieri per stato e prodotto", _migrate_v4_stats_rollups),
+    (5, "stato persistente della sincronizzazione", _migrate_v5_sync_state),
+    (6, "cache dei dati viaggiatori", _migrate_v6_traveler_cache),
+    (7, "indici per la lista ordini paginata", _migrate_v7_page_sort_indexes),
+    (8, "coda di replica verso Supabase", _migrate_v8_replication_outbox),
+    (9, "payload raw_data compressi e deduplicati", _migrate_v9_payload_store),
+    (10, "registro degli export e sequenza di ingestione degli ordini", _migrate_v10_export_logs),
+]
+# Migrazioni che liberano molto spazio: al termine il file viene compattato con VACUUM (fuori transazione)
+VACUUM_AFTER_MIGRATIONS = {9}
+
+def pending_migrations(db_path: str) -> List[Tuple[int, str]]:
+    """Migrazioni ancora da applicare al file (legge PRAGMA user_version senza modificarlo); [] per un database nuovo"""
+    if not os.path.exists(db_path): return []
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+    return [(version, description) for version, description, _ in MIGRATIONS if version > current_version]
+
+class ConnectionManager:
+    """
+    Connessioni SQLite persistenti in modalità WAL: un unico writer condiviso (serializzato da un lock)
+    e un piccolo pool di reader, prestati al thread che li richiede. Con WAL i reader continuano a
+    leggere l'ultimo snapshot confermato mentre il writer esegue una scrittura in blocco.
+    """
+    PRAGMAS = {
+        'synchronous': 'NORMAL',     # sicuro con WAL, evita un fsync per ogni commit
+        'cache_size': -32000,        # ~32 MB di page cache per connessione
+        'mmap_size': 268435456,      # 256 MB di I/O memory-mapped
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    }
+    CACHED_STATEMENTS = 256  # statement preparati riutilizzati da ogni connessione (cache sqlite3 per SQL)
+
+    def __init__(self, db_path: str, max_readers: int = 4):
+        self.db_path = db_path
+        self.max_readers = max_readers
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._idle_readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(max_readers)
+        self._all_readers = []
+        self._local = threading.local()
+        self._closed = False
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, cached_statements=self.CACHED_STATEMENTS)
+        if not read_only: conn.execute('PRAGMA journal_mode=WAL')
+        for pragma, value in self.PRAGMAS.items(): conn.execute(f'PRAGMA {pragma}={value}')
+        if read_only: conn.execute('PRAGMA query_only=ON')
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Connessione di scrittura: commit all'uscita, rollback in caso di eccezione."""
+        with self._writer_lock:
+            if self._closed: raise sqlite3.ProgrammingError("ConnectionManager chiuso")
+            if self._writer is None: self._writer = self._connect()
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """Connessione di sola lettura presa dal pool (riusata se il thread ne ha già una in prestito)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        with self._reader_slots:
+            try: conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                if self._closed: raise sqlite3.ProgrammingError("ConnectionManager chiuso")
+                conn = self._connect(read_only=True)
+                self._all_readers.append(conn)
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+                if conn.in_transaction: conn.rollback()
+                self._idle_readers.put(conn)
+
+    def close(self):
+        with self._writer_lock:
+            self._closed = True
+            if self._writer is not None:
+                try: self._writer.execute('PRAGMA optimize')
+                except sqlite3.Error: pass
+                self._writer.close(); self._writer = None
+            for conn in self._all_readers: conn.close()
+            self._all_readers.clear()
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_path = config.get_database_path()
+    LOOKUP_CHUNK_SIZE = 500  # resta sotto SQLITE_MAX_VARIABLE_NUMBER anche sulle build più vecchie
+    RANKED_SEARCH_MAX_HITS = 2000  # oltre questa soglia il termine è generico: ordini più recenti invece del ranking bm25
+
+    def __init__(self, db_path: str = None, on_migration_progress: Callable[[str], None] = None):
+        self.db_path = db_path or config.get_database_path()
+        self.on_migration_progress = on_migration_progress  # messaggi di avanzamento di migrazioni e VACUUM
         self.lock = threading.Lock()
+        # Impostato quando nessuna scrittura della sincronizzazione è in corso: gli export in background lo attendono tra un blocco e l'altro
+        self.sync_idle = threading.Event()
+        self.sync_idle.set()
+        self.connections = ConnectionManager(self.db_path)
+        self.fts_enabled = False
+        self.replication_enabled = config.get('supabase', 'replication_enabled', False)  # ordini modificati accodati in replication_outbox
         self._initialize_database()
+
+    def close(self):
+        self.connections.close()
         
     def _initialize_database(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS orders (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT, woo_id INTEGER UNIQUE NOT NULL, 
-                        order_number TEXT, status TEXT, currency TEXT, total REAL, 
-                        total_tax REAL, shipping_total REAL, customer_id INTEGER, 
-                        customer_email TEXT, customer_name TEXT, billing_data TEXT, 
-                        shipping_data TEXT, line_items TEXT, shipping_lines TEXT, 
-                        payment_method TEXT, payment_method_title TEXT, date_created TEXT, 
-                        date_modified TEXT, date_completed TEXT, raw_data TEXT, 
-                        hash_signature TEXT
-                    )
-                ''')
-                conn.commit()
+            with self.connections.writer() as conn:
+                applied = self._run_migrations(conn)
+                if VACUUM_AFTER_MIGRATIONS.intersection(applied):
+                    self._report_migration("Compattazione del database (VACUUM)")
+                    conn.execute('VACUUM')
+                self.fts_enabled = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'orders_fts'").fetchone() is not None
         except Exception as e:
             print(f"❌ Errore inizializzazione database: {e}")
+
+    def _run_migrations(self, conn) -> List[int]:
+        """Aggiorna in loco lo schema del database: ogni migrazione gira nella propria transazione. Restituisce le versioni applicate."""
+        current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+        applied = []
+        for version, description, migrate in MIGRATIONS:
+            if version <= current_version: continue
+            self._report_migration(f"Migrazione database v{version}: {description}")
+            conn.execute('BEGIN')
+            try:
+                migrate(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+        return applied
+
+    def _report_migration(self, message: str):
+        print(f"🛠️ {message}")
+        if self.on_migration_progress: self.on_migration_progress(message)
+
+    def get_schema_version(self) -> int:
+        with self.connections.reader() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
             
     def sync_order(self, order_data: dict):
         self.sync_multiple_orders([order_data])
 
-    def sync_multiple_orders(self, orders_data: List[dict]) -> Tuple[int, int]:
+    def sync_multiple_orders(self, orders_data: List[dict], sync_state: Dict[str, str] = None) -> SyncResult:
+        """
+        Inserisce/aggiorna il batch; sync_state (es. high-water mark) viene salvato nella stessa transazione.
+        Restituisce (inseriti, aggiornati) con i woo_id toccati in inserted_ids/updated_ids.
+        """
+        try:
+            prepared = self.prepare_orders(orders_data, self.get_order_revisions([order.get('id') for order in orders_data]))
+        except Exception as e:
+            print(f"❌ Errore durante la sincronizzazione in blocco: {e}")
+            return SyncResult()
+        return self.write_prepared_orders(prepared, sync_state)
+
+    def get_order_revisions(self, woo_ids: List[int]) -> Dict[int, tuple]:
+        """(hash, date_modified, stato) salvati per i woo_id indicati, letti da un reader (non attende il writer)."""
+        with self.connections.reader() as conn:
+            return self._get_existing_revisions(conn.cursor(), woo_ids)
+
+    def prepare_orders(self, orders_data: List[dict], revisions: Dict[int, tuple] = None) -> List[PreparedOrder]:
+        """
+        Parte CPU di sync_multiple_orders, senza connessioni né lock (si può eseguire su più thread):
+        salta gli ordini con la stessa revisione in revisions (vedi get_order_revisions) e serializza gli altri.
+        """
+        revisions = dict(revisions or {})
+        prepared = []
+        for order in orders_data:
+            woo_id = order.get('id')
+            stored = revisions.get(woo_id)
+            # Stessa revisione WooCommerce: nessuna serializzazione; altrimenti una sola per colonne e impronta
+            if stored and same_revision(order, stored[1], stored[2]): continue
+            # Copia più vecchia di quella salvata: il mark del polling l'ha già superata, una sovrascrittura non verrebbe più corretta
+            if stored and older_revision(order.get('date_modified'), stored[1]): continue
+            encoded = encode_order(order)
+            if stored and stored[0] == encoded.fingerprint: continue
+            digest = payload_digest(encoded.raw_data)
+            row = tuple(self._extract_order_data(order, encoded, digest).values())
+            items = extract_order_items(woo_id, order.get('line_items'))
+            revisions[woo_id] = (encoded.fingerprint, order.get('date_modified'), order.get('status'))  # gestisce ordini duplicati nello stesso batch
+            prepared.append(PreparedOrder(woo_id, row, revisions[woo_id], digest, compress_payload(encoded.raw_data), encoded.raw_data, items,
+                                          build_search_document(order) if self.fts_enabled else None,
+                                          ((order.get('date_created') or '')[:10], order.get('status') or '', row[4], [(item[2], item[3]) for item in items])))
+        return prepared
+
+    def write_prepared_orders(self, prepared: List[PreparedOrder], sync_state: Dict[str, str] = None, raise_errors: bool = False) -> SyncResult:
+        """
+        Scrive in una transazione gli ordini di prepare_orders (e sync_state); restituisce il SyncResult di sync_multiple_orders.
+        Con raise_errors un errore di scrittura (disco pieno, database bloccato) viene rilanciato invece che ridotto a un risultato vuoto.
+        """
         with self.lock:
-            to_insert, to_update = [], []
+            to_insert, to_update, written = [], [], []
+            self.sync_idle.clear()
             try:
-                with sqlite3.connect(self.db_path) as conn:
+                enqueued_at = time.time()
+                with self.connections.writer() as conn:
                     cursor = conn.cursor()
-                    cursor.execute('SELECT woo_id, hash_signature FROM orders')
-                    existing_orders = {row[0]: row[1] for row in cursor.fetchall()}
-                    for order in orders_data:
-                        order_hash = self._calculate_order_hash(order)
-                        order_tuple = tuple(self._extract_order_data(order, order_hash).values())
-                        woo_id = order.get('id')
-                        if woo_id not in existing_orders:
-                            to_insert.append(order_tuple)
-                        elif existing_orders[woo_id] != order_hash:
-                            to_update.append(order_tuple[1:] + (order_tuple[0],))
+                    existing_orders = self._get_existing_revisions(cursor, [order.woo_id for order in prepared])
+                    # Sequenza di ingestione: ogni ordine scritto riceve un numero più alto di tutti quelli già salvati
+                    sync_seq = cursor.execute('SELECT MAX(sync_seq) FROM orders').fetchone()[0] or 0
+                    for order in prepared:
+                        stored = existing_orders.get(order.woo_id)
+                        # Ricontrollo sullo stato attuale: dopo prepare_orders un'altra scrittura può aver salvato la stessa versione
+                        if stored and (stored[0] == order.revision[0] or older_revision(order.revision[1], stored[1])): continue
+                        sync_seq += 1
+                        if stored: to_update.append(order.row[1:] + (sync_seq, order.row[0]))
+                        else: to_insert.append(order.row + (sync_seq,))
+                        existing_orders[order.woo_id] = order.revision
+                        written.append(order)
+                    items = {order.woo_id: order.items for order in written}
+                    documents = {order.woo_id: order.document for order in written if order.document}
+                    payloads = {order.digest: order.payload for order in written}
+                    # Contributi agli aggregati prima della scrittura, per sottrarre i vecchi valori degli ordini modificati
+                    previous = self._get_stats_contributions(cursor, [row[-1] for row in to_update])
+                    replaced = self._fetch_by_ids(cursor, 'SELECT payload_digest FROM orders WHERE woo_id IN ({ids}) AND payload_digest IS NOT NULL', [row[-1] for row in to_update])
+                    if payloads:
+                        # Un payload già presente (stesso contenuto) non viene riscritto
+                        cursor.executemany(INSERT_PAYLOAD_SQL, list(payloads.items()))
                     if to_insert:
-                        cursor.executemany('INSERT INTO orders (woo_id, order_number, status, currency, total, total_tax, shipping_total, customer_id, customer_email, customer_name, billing_data, shipping_data, line_items, shipping_lines, payment_method, payment_method_title, date_created, date_modified, date_completed, raw_data, hash_signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', to_insert)
+                        cursor.executemany(INSERT_ORDER_SQL, to_insert)
                     if to_update:
-                        cursor.executemany('UPDATE orders SET order_number=?, status=?, currency=?, total=?, total_tax=?, shipping_total=?, customer_id=?, customer_email=?, customer_name=?, billing_data=?, shipping_data=?, line_items=?, shipping_lines=?, payment_method=?, payment_method_title=?, date_created=?, date_modified=?, date_completed=?, raw_data=?, hash_signature=? WHERE woo_id = ?', to_update)
-                    conn.commit()
-                    return len(to_insert), len(to_update)
+                        cursor.executemany(UPDATE_ORDER_SQL, to_update)
+                        cursor.executemany('DELETE FROM order_items WHERE order_woo_id = ?', [(row[-1],) for row in to_update])
+                    # Payload sostituiti (o versioni intermedie dello stesso batch) rimasti senza ordini
+                    orphans = {digest for (digest,) in replaced}.union(payloads)
+                    if orphans:
+                        cursor.executemany(DELETE_ORPHAN_PAYLOAD_SQL, [(digest, digest) for digest in orphans])
+                    if items:
+                        cursor.executemany(INSERT_ORDER_ITEM_SQL, [row for rows in items.values() for row in rows])
+                    if documents:
+                        cursor.executemany('DELETE FROM orders_fts WHERE rowid = ?', [(woo_id,) for woo_id in documents])
+                        cursor.executemany(INSERT_ORDER_FTS_SQL, list(documents.values()))
+                    if written:
+                        self._apply_stats_delta(cursor, [(order.woo_id, order.contribution) for order in written], previous)
+                    if self.replication_enabled and written:
+                        cursor.executemany(UPSERT_OUTBOX_SQL, [(order.woo_id, order.revision[0], order.raw_data, enqueued_at) for order in written])
+                    if sync_state:
+                        cursor.executemany(UPSERT_SYNC_STATE_SQL, list(sync_state.items()))
+                return SyncResult([row[0] for row in to_insert], [row[-1] for row in to_update])
             except Exception as e:
+                if raise_errors: raise
                 print(f"❌ Errore durante la sincronizzazione in blocco: {e}")
-                return 0, 0
+                return SyncResult()
+            finally:
+                self.sync_idle.set()
                 
-    def _calculate_order_hash(self, order_data: dict) -> str:
-        fields = ['status', 'total', 'date_modified', 'line_items']
-        data = {k: order_data.get(k) for k in fields}; return hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+    def _fetch_by_ids(self, cursor, query_template: str, woo_ids: List[int]) -> List[tuple]:
+        """Esegue query_template (con segnaposto {ids}) a blocchi sui woo_id indicati, senza scansioni complete."""
+        ids = list({woo_id for woo_id in woo_ids if woo_id is not None})
+        rows = []
+        # Chunk sempre della stessa lunghezza (riempiti con NULL) così lo statement preparato viene riusato
+        query = query_template.format(ids=','.join('?' * self.LOOKUP_CHUNK_SIZE))
+        for start in range(0, len(ids), self.LOOKUP_CHUNK_SIZE):
+            chunk = ids[start:start + self.LOOKUP_CHUNK_SIZE]
+            rows.extend(cursor.execute(query, chunk + [None] * (self.LOOKUP_CHUNK_SIZE - len(chunk))).fetchall())
+        return rows
+
+    def _get_existing_revisions(self, cursor, woo_ids: List[int]) -> Dict[int, tuple]:
+        """(hash, date_modified, stato) solo per i woo_id del batch (lookup sull'indice UNIQUE, niente scansione completa)."""
+        return {woo_id: revision for woo_id, *revision in self._fetch_by_ids(cursor, 'SELECT woo_id, hash_signature, date_modified, status FROM orders WHERE woo_id IN ({ids})', woo_ids)}
+
+    def _get_stats_contributions(self, cursor, woo_ids: List[int]) -> Dict[int, tuple]:
+        """Contributo attuale (giorno, stato, totale, prodotti) degli ordini indicati agli aggregati."""
+        contributions = {}
+        for woo_id, day, status, total in self._fetch_by_ids(cursor, "SELECT woo_id, COALESCE(order_date, ''), COALESCE(status, ''), COALESCE(total, 0) FROM orders WHERE woo_id IN ({ids})", woo_ids):
+            contributions[woo_id] = (day, status, total, [])
+        for woo_id, name, quantity in self._fetch_by_ids(cursor, "SELECT order_woo_id, COALESCE(name, 'Sconosciuto'), COALESCE(quantity, 0) FROM order_items WHERE order_woo_id IN ({ids})", woo_ids):
+            if woo_id in contributions: contributions[woo_id][3].append((name, quantity))
+        return contributions
+
+    def _apply_stats_delta(self, cursor, changed: List[tuple], previous: Dict[int, tuple]):
+        """Aggiorna gli aggregati con la differenza vecchio/nuovo di ogni ordine inserito o modificato."""
+        status_delta, product_delta = defaultdict(lambda: [0, 0.0]), defaultdict(int)
+        def add(contribution, sign):
+            day, status, total, products = contribution
+            status_delta[(day, status)][0] += sign; status_delta[(day, status)][1] += sign * (total or 0.0)
+            for name, quantity in products: product_delta[(day, name)] += sign * quantity
+        for woo_id, contribution in changed:
+            if woo_id in previous: add(previous[woo_id], -1)
+            add(contribution, +1)
+            previous[woo_id] = contribution
+        cursor.executemany('INSERT INTO stats_daily_status (day, status, orders, revenue) VALUES (?, ?, ?, ?) ON CONFLICT(day, status) DO UPDATE SET orders = orders + excluded.orders, revenue = revenue + excluded.revenue',
+                           [(day, status, count, revenue) for (day, status), (count, revenue) in status_delta.items() if count or revenue])
+        cursor.executemany('INSERT INTO stats_daily_products (day, product, quantity) VALUES (?, ?, ?) ON CONFLICT(day, product) DO UPDATE SET quantity = quantity + excluded.quantity',
+                           [(day, name, quantity) for (day, name), quantity in product_delta.items() if quantity])
+        cursor.execute('DELETE FROM stats_daily_status WHERE orders <= 0')
+        cursor.execute('DELETE FROM stats_daily_products WHERE quantity <= 0')
+
+    def get_sync_state(self, key: str, default: str = None) -> str:
+        try:
+            with self.connections.reader() as conn:
+                row = conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+                return row[0] if row else default
+        except Exception as e:
+            print(f"❌ Errore lettura stato sincronizzazione '{key}': {e}"); return default
+
+    def set_sync_state(self, key: str, value: str):
+        with self.lock:
+            with self.connections.writer() as conn:
+                conn.execute(UPSERT_SYNC_STATE_SQL, (key, value))
+
+    def get_cached_travelers(self, woo_ids: List[int]) -> Dict[int, List[dict]]:
+        """Viaggiatori in cache per gli ordini indicati, solo se salvati per l'attuale date_modified dell'ordine (richieste fallite escluse)."""
+        try:
+            with self.connections.reader() as conn:
+                rows = self._fetch_by_ids(conn.cursor(), f"SELECT t.woo_id, t.travelers FROM traveler_cache t JOIN orders o ON o.woo_id = t.woo_id WHERE t.woo_id IN ({{ids}}) AND t.date_modified IS o.date_modified AND t.travelers != '{TRAVELERS_FETCH_FAILED}'", woo_ids)
+            return {woo_id: json.loads(travelers) for woo_id, travelers in rows}
+        except Exception as e:
+            print(f"❌ Errore lettura cache viaggiatori: {e}"); return {}
+
+    def save_cached_travelers(self, entries: List[Tuple[int, str, List[dict]]]):
+        """
+        Salva in cache le risposte dell'endpoint viaggiatori: (woo_id, date_modified al momento della richiesta, viaggiatori).
+        Viaggiatori None = richiesta fallita (ordine cancellato, 404, errore): voce negativa, ritentata solo dopo un'attesa.
+        """
+        if not entries: return
+        fetched_at = datetime.now().isoformat()
+        with self.lock:
+            with self.connections.writer() as conn:
+                conn.executemany(UPSERT_TRAVELER_CACHE_SQL, [(woo_id, date_modified, json.dumps(travelers), fetched_at) for woo_id, date_modified, travelers in entries])
+
+    def get_orders_missing_travelers(self, limit: int = None, failed_retry_hours: float = 24) -> List[Tuple[int, str]]:
+        """
+        (woo_id, date_modified) degli ordini senza viaggiatori in cache o con cache scaduta, dai più recenti.
+        Una richiesta fallita viene ripetuta solo se l'ordine cambia o dopo failed_retry_hours.
+        """
+        query = ('SELECT o.woo_id, o.date_modified FROM orders o LEFT JOIN traveler_cache t ON t.woo_id = o.woo_id '
+                 f"WHERE t.woo_id IS NULL OR t.date_modified IS NOT o.date_modified OR (t.travelers = '{TRAVELERS_FETCH_FAILED}' AND t.fetched_at < ?) ORDER BY o.date_created DESC")
+        if limit: query += f" LIMIT {int(limit)}"
+        retry_before = (datetime.now() - timedelta(hours=failed_retry_hours)).isoformat()
+        try:
+            with self.connections.reader() as conn:
+                return conn.execute(query, (retry_before,)).fetchall()
+        except Exception as e:
+            print(f"❌ Errore lettura ordini senza viaggiatori: {e}"); return []
+
+    def seed_replication_outbox(self) -> int:
+        """Alla prima attivazione della replica accoda tutti gli ordini già presenti (una volta sola); restituisce quanti."""
+        with self.lock:
+            with self.connections.writer() as conn:
+                if conn.execute("SELECT 1 FROM sync_state WHERE key = 'replication_seeded'").fetchone(): return 0
+                enqueued_at = time.time()
+                rows = conn.execute('SELECT o.woo_id, o.hash_signature, p.data FROM orders o JOIN order_payloads p ON p.digest = o.payload_digest')
+                seeded = conn.executemany('INSERT OR IGNORE INTO replication_outbox (woo_id, hash_signature, payload, enqueued_at) VALUES (?, ?, ?, ?)',
+                                          ((woo_id, hash_signature, decompress_payload(data), enqueued_at) for woo_id, hash_signature, data in rows)).rowcount
+                conn.execute(UPSERT_SYNC_STATE_SQL, ('replication_seeded', datetime.now().isoformat()))
+                return seeded
+
+    def get_replication_batch(self, limit: int) -> List[Tuple[int, str, str]]:
+        """(woo_id, hash, payload) delle voci in coda pronte per un tentativo, dalle più vecchie."""
+        with self.connections.reader() as conn:
+            return conn.execute('SELECT woo_id, hash_signature, payload FROM replication_outbox WHERE next_attempt_at <= ? ORDER BY enqueued_at LIMIT ?', (time.time(), limit)).fetchall()
+
+    def ack_replication(self, entries: List[Tuple[int, str]]):
+        """Rimuove le voci replicate, solo se nel frattempo l'ordine non è cambiato (stesso hash)."""
+        with self.lock:
+            with self.connections.writer() as conn:
+                conn.executemany('DELETE FROM replication_outbox WHERE woo_id = ? AND hash_signature = ?', entries)
 
-    def _extract_order_data(self, order_data: dict, hash_str: str) -> dict:
-        billing = order_data.get('billing', {}) or {}; return {'woo_id': order_data.get('id'), 'order_number': order_data.get('number', ''), 'status': order_data.get('status', ''), 'currency': order_data.get('currency', 'EUR'), 'total': float(order_data.get('total', 0)), 'total_tax': float(order_data.get('total_tax', 0)), 'shipping_total': float(order_data.get('shipping_total', 0)), 'customer_id': order_data.get('customer_id'), 'customer_email': billing.get('email', ''), 'customer_name': f"{billing.get('first_name', '')} {billing.get('last_name', '')}".strip(), 'billing_data': json.dumps(billing), 'shipping_data': json.dumps(order_data.get('shipping', {}) or {}), 'line_items': json.dumps(order_data.get('line_items', [])), 'shipping_lines': json.dumps(order_data.get('shipping_lines', [])), 'payment_method': order_data.get('payment_method', ''), 'payment_method_title': order_data.get('payment_method_title', ''), 'date_created': order_data.get('date_created'), 'date_modified': order_data.get('date_modified'), 'date_completed': order_data.get('date_completed'), 'raw_data': json.dumps(order_data), 'hash_signature': hash_str}
+    def defer_replication(self, woo_ids: List[int], base_delay: float, max_delay: float):
+        """Rinvia le voci fallite con backoff esponenziale per voce (base_delay * 2^tentativi, al massimo max_delay)."""
+        with self.lock:
+            with self.connections.writer() as conn:
+                conn.executemany('UPDATE replication_outbox SET next_attempt_at = ? + MIN(?, ? * (1 << MIN(attempts, 20))), attempts = attempts + 1 WHERE woo_id = ?',
+                                 [(time.time(), max_delay, base_delay, woo_id) for woo_id in woo_ids])
+
+    def get_replication_status(self) -> Tuple[int, float]:
+        """(voci in coda, secondi dalla modifica più vecchia non ancora replicata)."""
+        with self.connections.reader() as conn:
+            depth, oldest = conn.execute('SELECT COUNT(*), MIN(enqueued_at) FROM replication_outbox').fetchone()
+        return depth, (time.time() - oldest) if oldest else 0.0
+
+    def get_last_sync_seq(self) -> int:
+        """Sequenza di ingestione più alta nell'archivio locale (limite superiore di un export incrementale); 0 se vuoto."""
+        with self.connections.reader() as conn:
+            return conn.execute('SELECT MAX(sync_seq) FROM orders').fetchone()[0] or 0
+
+    def log_export(self, export_type: str, file_name: str, file_path: str, total_records: int, date_from: str = None, date_to: str = None,
+                   status: str = 'success', error_message: str = None, sync_seq: int = None) -> int:
+        """
+        Registra un export in export_logs (stessi campi di SupabaseManager.log_export, più sync_seq: ultima sequenza
+        di ingestione inclusa, punto di ripresa degli export incrementali); restituisce l'id.
+        """
+        with self.lock:
+            with self.connections.writer() as conn:
+                return conn.execute('INSERT INTO export_logs (export_type, file_name, file_path, total_records, date_from, date_to, status, error_message, created_at, sync_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (export_type, file_name, file_path, total_records, date_from, date_to, status, error_message, datetime.now().isoformat(), sync_seq)).lastrowid
+
+    def get_last_export(self, export_type: str, status: str = 'success') -> Optional[dict]:
+        """Ultimo export del tipo indicato con lo stato dato, None se non ce ne sono."""
+        with self.connections.reader() as conn:
+            cursor = conn.cursor(); cursor.row_factory = sqlite3.Row
+            row = cursor.execute('SELECT * FROM export_logs WHERE export_type = ? AND status = ? ORDER BY id DESC LIMIT 1', (export_type, status)).fetchone()
+            return dict(row) if row else None
+
+    def rebuild_order_stats(self):
+        """Ricalcola tutti gli aggregati da zero (controlli di coerenza o dopo interventi manuali sul DB)."""
+        with self.lock:
+            with self.connections.writer() as conn:
+                _rebuild_stats(conn.cursor())
+
+    def _extract_order_data(self, order_data: dict, encoded: EncodedOrder, digest: bytes = None) -> dict:
+        billing = order_data.get('billing', {}) or {}; return {'woo_id': order_data.get('id'), 'order_number': order_data.get('number', ''), 'status': order_data.get('status', ''), 'currency': order_data.get('currency', 'EUR'), 'total': float(order_data.get('total', 0)), 'total_tax': float(order_data.get('total_tax', 0)), 'shipping_total': float(order_data.get('shipping_total', 0)), 'customer_id': order_data.get('customer_id'), 'customer_email': billing.get('email', ''), 'customer_name': f"{billing.get('first_name', '')} {billing.get('last_name', '')}".strip(), 'billing_data': encoded.billing_data, 'shipping_data': encoded.shipping_data, 'line_items': encoded.line_items, 'shipping_lines': encoded.shipping_lines, 'payment_method': order_data.get('payment_method', ''), 'payment_method_title': order_data.get('payment_method_title', ''), 'date_created': order_data.get('date_created'), 'date_modified': order_data.get('date_modified'), 'date_completed': order_data.get('date_completed'), 'payload_digest': digest, 'hash_signature': encoded.fingerprint}
         
-    def get_orders(self, filters: dict = None) -> List[dict]:
+    def _build_orders_query(self, cursor, filters: dict = None, columns: str = "o.*", rank: bool = True) -> Tuple[str, list, str]:
+        """
+        FROM/WHERE e ORDER BY della lista ordini per i filtri dati (ricerca FTS5 o LIKE, stato).
+        Con rank=False la ricerca non stima i risultati per il ranking bm25 (ordinamento deciso dal chiamante).
+        """
+        query = f"SELECT {columns} FROM orders o"; where_clauses = []; params = []; order_by = "o.date_created DESC"
+        if filters:
+            if filters.get('search_term'):
+                fts_query = build_fts_query(filters['search_term']) if self.fts_enabled else ''
+                if fts_query:
+                    query = f"SELECT {columns} FROM orders_fts f JOIN orders o ON o.woo_id = f.rowid"; where_clauses.append("orders_fts MATCH ?"); params.append(fts_query)
+                    if rank:
+                        # Risultati per pertinenza; per termini troppo comuni il ranking costerebbe più della ricerca: prima i più recenti
+                        order_by = f"{BM25_RANK_SQL}, o.date_created DESC" if self._search_is_rankable(cursor, fts_query) else "f.rowid DESC"
+                else:
+                    term = f"%{filters['search_term']}%"; where_clauses.append("(o.order_number LIKE ? OR o.customer_name LIKE ? OR o.customer_email LIKE ?)"); params.extend([term, term, term])
+            if filters.get('status'):
+                where_clauses.append("o.status = ?"); params.append(filters['status'])
+            # Export incrementali: ordini scritti dopo synced_after (escluso) e fino a synced_until (incluso), per sequenza di ingestione
+            if filters.get('synced_after') is not None:
+                where_clauses.append("o.sync_seq > ?"); params.append(filters['synced_after'])
+            if filters.get('synced_until') is not None:
+                where_clauses.append("o.sync_seq <= ?"); params.append(filters['synced_until'])
+        if where_clauses: query += " WHERE " + " AND ".join(where_clauses)
+        return query, params, order_by
+
+    def _search_is_rankable(self, cursor, fts_query: str) -> bool:
+        hits = cursor.execute("SELECT COUNT(*) FROM (SELECT 1 FROM orders_fts WHERE orders_fts MATCH ? LIMIT ?)", (fts_query, self.RANKED_SEARCH_MAX_HITS + 1)).fetchone()[0]
+        return hits <= self.RANKED_SEARCH_MAX_HITS
+
+    def _page_sort_expr(self, cursor, filters: dict, sort_by: str) -> str:
+        """Espressione della chiave di paginazione per sort_by; 'relevance' vale solo con una ricerca full-text."""
+        if sort_by == RELEVANCE_SORT:
+            fts_query = build_fts_query(filters['search_term']) if self.fts_enabled and filters and filters.get('search_term') else ''
+            if not fts_query: return PAGE_SORT_KEYS['date_created']
+            # Come get_orders: per termini troppo comuni chiave costante, quindi ordine per woo_id (i più recenti)
+            return f"-{BM25_RANK_SQL}" if self._search_is_rankable(cursor, fts_query) else "0"
+        if sort_by not in PAGE_SORT_KEYS: raise ValueError(f"Ordinamento non supportato: {sort_by}")
+        return PAGE_SORT_KEYS[sort_by]
+
+    def get_orders(self, filters: dict = None, columns: List[str] = None) -> List[OrderRow]:
+        """Ordini filtrati; columns limita le colonne lette (es. solo quelle mostrate nella tabella)."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row; cursor = conn.cursor()
-                query = "SELECT * FROM orders"; where_clauses = []; params = []
-                if filters:
-                    if filters.get('search_term'):
-                        term = f"%{filters['search_term']}%"; where_clauses.append("(order_number LIKE ? OR customer_name LIKE ? OR customer_email LIKE ?)"); params.extend([term, term, term])
-                    if filters.get('status'):
-                        where_clauses.append("status = ?"); params.append(filters['status'])
-                if where_clauses: query += " WHERE " + " AND ".join(where_clauses)
-                query += " ORDER BY date_created DESC"
+            with self.connections.reader() as conn:
+                cursor = conn.cursor(); cursor.row_factory = sqlite3.Row
+                query, params, order_by = self._build_orders_query(cursor, filters, self._select_columns(columns))
+                query += f" ORDER BY {order_by}"
                 if filters and filters.get('limit'): query += f" LIMIT {int(filters['limit'])}"
-                
-                rows = cursor.execute(query, tuple(params)).fetchall()
-                orders = []
-                for row in rows:
-                    order = dict(row)
-                    for field in ['billing_data', 'shipping_data', 'line_items', 'raw_data']:
-                        if order.get(field):
-                            try: 
-                                order[field] = json.loads(order[field])
-                            except (json.JSONDecodeError, TypeError):
-                                print(f"⚠️ Warning: Impossibile decodificare il campo JSON '{field}' per l'ordine ID {order.get('woo_id')}")
-                                order[field] = {}
-                    orders.append(order)
-                return orders
+                return [OrderRow(zip(row.keys(), row)) for row in cursor.execute(query, tuple(params)).fetchall()]
         except Exception as e:
             print(f"❌ Errore recupero ordini: {e}"); return []
+
+    def get_order(self, woo_id: int) -> OrderRow:
+        """Ordine completo (tutte le colonne) per la finestra di dettaglio; None se non presente."""
+        try:
+            with self.connections.reader() as conn:
+                cursor = conn.cursor(); cursor.row_factory = sqlite3.Row
+                row = cursor.execute(f'SELECT {self._select_columns()} FROM orders o WHERE o.woo_id = ?', (woo_id,)).fetchone()
+                return OrderRow(zip(row.keys(), row)) if row else None
+        except Exception as e:
+            print(f"❌ Errore recupero ordine {woo_id}: {e}"); return None
+
+    @staticmethod
+    def _select_columns(columns: List[str] = None) -> str:
+        columns = columns or ORDER_COLUMNS
+        invalid = [c for c in columns if not re.fullmatch(r'\w+', c)]
+        if invalid: raise ValueError(f"Colonne non valide: {invalid}")
+        return ', '.join(RAW_DATA_COLUMN_SQL if c == 'raw_data' else f"o.{c}" for c in columns)
+
+    def count_orders(self, filters: dict = None) -> int:
+        try:
+            with self.connections.reader() as conn:
+                query, params, _ = self._build_orders_query(conn.cursor(), filters, columns="COUNT(*)", rank=False)
+                return conn.execute(query, tuple(params)).fetchone()[0]
+        except Exception as e:
+            print(f"❌ Errore conteggio ordini: {e}"); return 0
+
+    def iter_orders(self, filters: dict = None, columns: List[str] = None, fetch_size: int = 500):
+        """
+        Come get_orders ma in streaming: legge fetch_size righe alla volta dal cursore.
+        Va consumato nel thread che lo crea.
+        """
+        with self.connections.reader() as conn:
+            cursor = conn.cursor(); cursor.row_factory = sqlite3.Row
+            query, params, order_by = self._build_orders_query(cursor, filters, self._select_columns(columns))
+            query += f" ORDER BY {order_by}"
+            if filters and filters.get('limit'): query += f" LIMIT {int(filters['limit'])}"
+            cursor.execute(query, tuple(params))
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows: return
+                for row in rows: yield OrderRow(zip(row.keys(), row))
             
+    def get_orders_page(self, filters: dict = None, columns: List[str] = None, sort_by: str = 'date_created', descending: bool = True,
+                        after: tuple = None, before: tuple = None, inclusive: bool = False, limit: int = 100) -> List[OrderRow]:
+        """
+        Una pagina della lista ordini con paginazione keyset su (sort_by, woo_id): after/before sono la chiave
+        (page_key, woo_id) dell'ultima/prima riga già mostrata, restituita in ogni riga come 'page_key'.
+        Il costo non dipende da quante pagine precedono quella richiesta (niente OFFSET).
+        sort_by='relevance' ordina una ricerca per pertinenza bm25, con chiave (rank, woo_id).
+        """
+        if sort_by not in PAGE_SORT_KEYS and sort_by != RELEVANCE_SORT: raise ValueError(f"Ordinamento non supportato: {sort_by}")
+        backwards = before is not None
+        # Pagina precedente: stessa chiave letta al contrario, poi riportata nell'ordine della vista
+        scan_descending = descending != backwards
+        direction = "DESC" if scan_descending else "ASC"
+        try:
+            with self.connections.reader() as conn:
+                cursor = conn.cursor(); cursor.row_factory = sqlite3.Row
+                sort_expr = self._page_sort_expr(cursor, filters, sort_by)
+                query, params, _ = self._build_orders_query(cursor, filters, f"{self._select_columns(columns)}, {sort_expr} AS page_key", rank=False)
+                key = before if backwards else after
+                if key is not None:
+                    comparison = '<' if scan_descending else '>'
+                    operator = comparison + ('=' if inclusive else '')
+                    # Il primo confronto (ridondante) permette a SQLite la ricerca per intervallo sull'indice di espressione
+                    # Ogni condizione dei filtri ha un parametro (le colonne possono contenere sottoquery con WHERE)
+                    query += (" AND " if params else " WHERE ") + f"{sort_expr} {comparison}= ? AND ({sort_expr}, o.woo_id) {operator} (?, ?)"
+                    params.extend((key[0],) + tuple(key))
+                query += f" ORDER BY {sort_expr} {direction}, o.woo_id {direction} LIMIT {int(limit)}"
+                rows = [OrderRow(zip(row.keys(), row)) for row in cursor.execute(query, tuple(params)).fetchall()]
+                return rows[::-1] if backwards else rows
+        except Exception as e:
+            print(f"❌ Errore recupero pagina ordini: {e}"); return []
+
+    def get_orders_by_ids(self, woo_ids: List[int], filters: dict = None, columns: List[str] = None, sort_by: str = 'date_created') -> List[OrderRow]:
+        """
+        Gli ordini indicati che rispettano i filtri, con la stessa 'page_key' di get_orders_page
+        (aggiornamento mirato della tabella dopo una sincronizzazione).
+        """
+        if sort_by not in PAGE_SORT_KEYS and sort_by != RELEVANCE_SORT: raise ValueError(f"Ordinamento non supportato: {sort_by}")
+        ids = list({woo_id for woo_id in woo_ids if woo_id is not None})
+        try:
+            with self.connections.reader() as conn:
+                cursor = conn.cursor(); cursor.row_factory = sqlite3.Row
+                sort_expr = self._page_sort_expr(cursor, filters, sort_by)
+                query, params, _ = self._build_orders_query(cursor, filters, f"{self._select_columns(columns)}, {sort_expr} AS page_key", rank=False)
+                query += " AND " if params else " WHERE "
+                rows = []
+                for start in range(0, len(ids), self.LOOKUP_CHUNK_SIZE):
+                    chunk = ids[start:start + self.LOOKUP_CHUNK_SIZE]
+                    rows.extend(cursor.execute(query + f"o.woo_id IN ({','.join('?' * len(chunk))})", tuple(params) + tuple(chunk)).fetchall())
+                return [OrderRow(zip(row.keys(), row)) for row in rows]
+        except Exception as e:
+            print(f"❌ Errore recupero ordini modificati: {e}"); return []
+
+    def get_order_analytics(self) -> OrderAnalytics:
+        """Aggregati giornalieri caricati in blocco come array colonnari (una riga per giorno e stato/prodotto)."""
+        with self.connections.reader() as conn:
+            status_rows = conn.execute('SELECT day, status, orders, revenue FROM stats_daily_status').fetchall()
+            product_rows = conn.execute('SELECT day, product, quantity FROM stats_daily_products').fetchall()
+        return OrderAnalytics.from_rollups(status_rows, product_rows)
+
     def get_order_stats(self, days: int = 0) -> dict:
+        """Statistiche dagli aggregati giornalieri (days > 0: solo gli ultimi N giorni), con confronti KPI sul periodo precedente."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                query = "SELECT status, total, date_created, line_items FROM orders"
-                params = []
-                if days > 0:
-                    date_from = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%S')
-                    query += " WHERE date_created >= ?"
-                    params.append(date_from)
-                cursor.execute(query, tuple(params))
-                orders = cursor.fetchall()
-                if not orders: return {'total_orders': 0, 'total_revenue': 0, 'by_status': {}, 'by_date': {}, 'top_products': {}}
-                total_orders = len(orders)
-                total_revenue = sum(o['total'] for o in orders if o['total'] is not None)
-                by_status = defaultdict(int)
-                by_date = defaultdict(int)
-                top_products = defaultdict(int)
-                for order in orders:
-                    by_status[order['status']] += 1
-                    if order['date_created']:
-                        order_date = order['date_created'][:10]
-                        by_date[order_date] += 1
-                    try:
-                        line_items = json.loads(order['line_items'])
-                        for item in line_items:
-                            top_products[item.get('name', 'Sconosciuto')] += item.get('quantity', 0)
-                    except: pass
-                sorted_products = sorted(top_products.items(), key=lambda item: item[1], reverse=True)[:5]
-                return {'total_orders': total_orders, 'total_revenue': total_revenue, 'by_status': dict(by_status), 'by_date': dict(by_date), 'top_products': dict(sorted_products)}
+            return self.get_order_analytics().summary(days, period_days=config.get('dashboard', 'kpi_period_days', 30))
         except Exception as e:
             print(f"❌ Errore calcolo statistiche: {e}")
             return {}
@@ -6,31 +6,103 @@ Gestisce export automatici CSV/DOCX con dettagli viaggiatori
 Sviluppato da TechExpresso
 """
 
-import os, csv, json, schedule, threading, time
-from datetime import datetime
-from typing import Dict, List
+import os, sys, csv, json, threading
+from datetime import datetime, timedelta
+from datetime import time as day_time
+from itertools import islice
+from typing import Dict, List, Optional
 from config import config
 
+# Export pianificati predefiniti (sezione export.schedules della configurazione): ogni mezzanotte gli ordini modificati dall'ultimo export
+DEFAULT_SCHEDULES = [{"name": "giornaliero", "cron": "0 0 * * *", "incremental": True}]
+
 class ExportResult:
-    def __init__(self, success: bool, file_name: str = "", file_path: str = "", total_records: int = 0, error_message: str = ""):
+    def __init__(self, success: bool, file_name: str = "", file_path: str = "", total_records: int = 0, error_message: str = "",
+                 sync_seq_from: int = None, sync_seq_to: int = None):
         self.success = success
         self.file_name = file_name
         self.file_path = file_path
         self.total_records = total_records
         self.error_message = error_message
+        self.sync_seq_from = sync_seq_from  # intervallo di sequenze di ingestione (sync_seq) di un export incrementale
+        self.sync_seq_to = sync_seq_to
+
+class CronSchedule:
+    """
+    Espressione cron a 5 campi (minuto ora giorno mese giorno_settimana, 0 e 7 = domenica) con *, elenchi,
+    intervalli e passi: "0 0 * * *", "30 6 * * 1-5", "*/15 8-18 * * *". Come in cron, se giorno del mese e
+    giorno della settimana sono entrambi limitati basta che corrisponda uno dei due.
+    """
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5: raise ValueError(f"Espressione cron non valida (servono 5 campi): '{expression}'")
+        self.expression = expression
+        minutes, hours, self.days, self.months, weekdays = [self._parse_field(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours = sorted(minutes), sorted(hours)
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2].startswith('*') or parts[4].startswith('*')
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> set:
+        values = set()
+        for item in field.split(','):
+            span, _, step = item.partition('/')
+            if span == '*': start, end = low, high
+            elif '-' in span: start, end = (int(value) for value in span.split('-', 1))
+            else: start = int(span); end = high if step else start  # "5/15": dal 5 ogni 15
+            step = int(step) if step else 1
+            if not low <= start <= end <= high or step < 1: raise ValueError(f"Campo cron fuori intervallo {low}-{high}: '{item}'")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _matches_day(self, day) -> bool:
+        in_month, in_week = day.day in self.days, (day.weekday() + 1) % 7 in self.weekdays
+        return (in_month and in_week) if self.any_day else (in_month or in_week)
+
+    def next_run(self, after: datetime) -> datetime:
+        """Primo minuto previsto dall'espressione successivo ad after (ora locale)."""
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(366 * 5):  # giorni rari come il 29 febbraio ricorrono entro un ciclo bisestile
+            if day.month in self.months and self._matches_day(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime.combine(day, day_time(hour, minute))
+                        if candidate >= start: return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"L'espressione cron '{self.expression}' non ricorre mai")
+
+def lower_thread_priority():
+    """Abbassa la priorità del thread corrente (best effort): la sincronizzazione resta avanti nella coda della CPU."""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), -1)  # THREAD_PRIORITY_BELOW_NORMAL
+        elif sys.platform.startswith('linux'):
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)  # su Linux il nice vale per il singolo thread
+    except (AttributeError, OSError):
+        pass
 
 class ExportManager:
-    def __init__(self, database_manager, on_export_complete=None):
+    SYNC_YIELD_MAX = 5.0  # secondi massimi di attesa di un export pianificato dietro una scrittura della sincronizzazione
+
+    def __init__(self, database_manager, on_export_complete=None, on_export_progress=None, on_scheduled_export=None):
         self.database_manager = database_manager
         self.on_export_complete = on_export_complete
+        self.on_export_progress = on_export_progress  # (ordini esportati, ordini totali) dopo ogni blocco
+        self.on_scheduled_export = on_scheduled_export  # (nome pianificazione, ExportResult) dopo ogni export pianificato
         self.exports_dir = config.exports_dir
         os.makedirs(self.exports_dir, exist_ok=True)
         self.scheduler_running = False
         self.scheduler_thread = None
+        self._scheduler_stop = threading.Event()
 
     @staticmethod
     def _extract_traveler_data(order: Dict) -> List[Dict]:
-        meta_data = order.get('raw_data', {}).get('meta_data', [])
+        meta_data = (order.get('raw_data') or {}).get('meta_data', [])  # ordini migrati senza payload: raw_data None
         possible_keys = ['dati_viaggiatori', '_dati_viaggiatori', 'traveler_data', '_traveler_data', '_viaggiatori_data']
         for item in meta_data:
             key = item.get('key', '').lower()
@@ -45,71 +117,149 @@ class ExportManager:
                     return [{'Info': str(value)}]
         return []
 
+    def load_schedules(self) -> List[tuple]:
+        """(pianificazione, CronSchedule) da export.schedules; le voci disattivate o non valide vengono saltate."""
+        schedules = []
+        for entry in config.get('export', 'schedules', DEFAULT_SCHEDULES) or []:
+            if not entry.get('enabled', True): continue
+            try:
+                if not entry.get('name'): raise ValueError("nome mancante")
+                schedules.append((entry, CronSchedule(entry.get('cron', ''))))
+            except ValueError as e:
+                print(f"❌ Pianificazione export '{entry.get('name', '?')}' ignorata: {e}")
+        return schedules
+
     def start_scheduler(self):
-        # ... (codice invariato)
-        pass
+        if self.scheduler_running: return
+        self.scheduler_running = True
+        self._scheduler_stop.clear()
+        self.scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True, name='export-scheduler')
+        self.scheduler_thread.start()
 
     def stop_scheduler(self):
-        # ... (codice invariato)
-        pass
+        self.scheduler_running = False
+        self._scheduler_stop.set()
+        if self.scheduler_thread: self.scheduler_thread.join(timeout=10); self.scheduler_thread = None
 
     def _run_scheduler(self):
-        # ... (codice invariato)
-        pass
+        """
+        Thread a bassa priorità: dorme fino alla prossima esecuzione prevista e lancia gli export dovuti, uno alla volta.
+        Un'esecuzione saltata (programma chiuso a mezzanotte) parte all'avvio: la prossima data è calcolata dall'ultimo export riuscito.
+        """
+        lower_thread_priority()
+        next_runs = {}
+        for entry, cron in self.load_schedules():
+            try:
+                last = self.database_manager.get_last_export(entry['name'])
+                next_runs[entry['name']] = (entry, cron, cron.next_run(datetime.fromisoformat(last['created_at']) if last else datetime.now()))
+            except ValueError as e:
+                print(f"❌ Pianificazione export '{entry['name']}' ignorata: {e}")
+        while next_runs and not self._scheduler_stop.is_set():
+            for name, (entry, cron, due) in list(next_runs.items()):
+                if self._scheduler_stop.is_set() or due > datetime.now(): continue
+                self.run_scheduled_export(entry)
+                next_runs[name] = (entry, cron, cron.next_run(datetime.now()))
+            wake = min(due for _, _, due in next_runs.values())
+            # Risveglio almeno ogni minuto: cambi d'ora e sospensioni del PC non spostano le esecuzioni
+            self._scheduler_stop.wait(min(max((wake - datetime.now()).total_seconds(), 0), 60))
+
+    def run_scheduled_export(self, entry: Dict) -> ExportResult:
+        """
+        Esegue una pianificazione e la registra in export_logs. Se incrementale esporta solo gli ordini scritti in locale
+        dopo l'ultimo export riuscito (sync_seq oltre il suo), fino alla sequenza più alta letta all'avvio: un ordine
+        aggiornato durante l'export riceve una sequenza nuova e va nel successivo. Un export fallito non sposta il punto di ripresa.
+        """
+        name = entry['name']
+        seq_from = seq_to = None
+        try:
+            filters = None
+            if entry.get('incremental', True):
+                last = self.database_manager.get_last_export(name)
+                seq_from = (last['sync_seq'] or 0) if last else 0
+                seq_to = self.database_manager.get_last_sync_seq()
+                filters = {'synced_after': seq_from, 'synced_until': seq_to}
+            if filters and seq_to <= seq_from:
+                result = ExportResult(success=True)  # nessun ordine modificato dall'ultimo export
+            else:
+                result = self._export_csv(filters, f"export_{name}", background=True) or ExportResult(success=True)
+        except Exception as e:
+            result = ExportResult(success=False, error_message=f"Errore durante l'export pianificato '{name}': {e}")
+        result.sync_seq_from, result.sync_seq_to = seq_from, seq_to
+        self._log_export(name, result)
+        if result.success: print(f"📤 Export pianificato '{name}': {result.total_records} righe")
+        else: print(f"❌ {result.error_message}")
+        if self.on_scheduled_export: self.on_scheduled_export(name, result)
+        return result
+
+    def _log_export(self, export_type: str, result: ExportResult):
+        try:
+            self.database_manager.log_export(export_type, result.file_name, result.file_path, result.total_records, status='success' if result.success else 'error',
+                                             error_message=result.error_message or None, sync_seq=result.sync_seq_to)
+        except Exception as e:
+            print(f"❌ Errore registrazione export: {e}")
 
-    def _daily_export(self):
-        self.export_orders_csv()
+    def _yield_to_sync(self):
+        # Export in background: se la sincronizzazione sta scrivendo, il blocco successivo aspetta il segnale di fine scrittura
+        self.database_manager.sync_idle.wait(self.SYNC_YIELD_MAX)
 
-    def export_orders_csv(self, filters: Dict = None):
-        """ Esporta ordini in CSV. Se non ci sono filtri, esporta TUTTI gli ordini. """
+    EXPORT_COLUMNS = ['woo_id', 'order_number', 'date_created', 'customer_name', 'customer_email', 'status', 'total', 'payment_method_title', 'line_items', 'raw_data']
+    FIELDNAMES = ['ID Ordine', 'Numero Ordine', 'Data Ordine', 'Cliente Principale', 'Email Cliente', 'Stato Ordine', 'Totale Ordine', 'Nome Viaggiatore', 'Cognome Viaggiatore', 'Email Viaggiatore', 'Telefono Viaggiatore', 'Partenza Viaggiatore', 'Prodotti', 'Metodo Pagamento']
+
+    def _build_rows(self, order: Dict, cached_travelers: Dict[int, List[Dict]]) -> List[Dict]:
+        """Righe CSV di un ordine: una per viaggiatore (o una sola senza dati viaggiatore)."""
+        common_info = {'ID Ordine': order.get('woo_id', ''), 'Numero Ordine': order.get('order_number', ''), 'Data Ordine': order.get('date_created', ''), 'Cliente Principale': order.get('customer_name', ''), 'Email Cliente': order.get('customer_email', ''), 'Stato Ordine': order.get('status', ''), 'Totale Ordine': order.get('total', 0), 'Metodo Pagamento': order.get('payment_method_title', '')}
+        line_items = order.get('line_items') or []
+        common_info['Prodotti'] = '; '.join([f"{item.get('name', 'N/A')} (x{item.get('quantity', 0)})" for item in line_items])
+        # raw_data (OrderRow) viene decodificato solo per gli ordini senza viaggiatori in cache
+        travelers = cached_travelers.get(order.get('woo_id')) or self._extract_traveler_data(order)
+
+        empty_traveler = {'Nome Viaggiatore': '', 'Cognome Viaggiatore': '', 'Email Viaggiatore': '', 'Telefono Viaggiatore': '', 'Partenza Viaggiatore': ''}
+        if not travelers: return [dict(common_info, **empty_traveler)]
+        return [dict(common_info, **{'Nome Viaggiatore': traveler.get('nome', ''), 'Cognome Viaggiatore': traveler.get('cognome', ''), 'Email Viaggiatore': traveler.get('email', ''), 'Telefono Viaggiatore': traveler.get('telefono', ''), 'Partenza Viaggiatore': traveler.get('partenza', '')}) for traveler in travelers]
+
+    def export_orders_csv(self, filters: Dict = None) -> ExportResult:
+        """
+        Esporta ordini in CSV. Se non ci sono filtri, esporta TUTTI gli ordini.
+        Gli ordini vengono letti e scritti a blocchi di export.fetch_size: la memoria non cresce con l'archivio.
+        """
         try:
-            final_filters = filters if filters else None
-            
-            print("\n--- AVVIO EXPORT ---")
-            print("DEBUG: Export richiesto con i seguenti filtri:", final_filters)
-            
-            orders = self.database_manager.get_orders(final_filters)
-            
-            print(f"DEBUG: Il database ha restituito {len(orders)} ordini per l'export.")
-            
-            if not orders:
-                result = ExportResult(success=False, error_message="Nessun ordine trovato con i filtri specificati.")
-                if self.on_export_complete: self.on_export_complete(result)
-                return
+            result = self._export_csv(filters if filters else None, "export_dettaglio_viaggiatori") or ExportResult(success=False, error_message="Nessun ordine trovato con i filtri specificati.")
+        except Exception as e:
+            result = ExportResult(success=False, error_message=f"Errore durante l'export CSV: {e}")
+        self._log_export('manuale', result)
+        if result.success: print(f"📤 Export manuale: {result.total_records} righe in {result.file_name}")
+        else: print(f"❌ {result.error_message}")
+        if self.on_export_complete: self.on_export_complete(result)
+        return result
+
+    def _export_csv(self, filters: Optional[Dict], file_prefix: str, background: bool = False) -> Optional[ExportResult]:
+        """Scrive il CSV degli ordini filtrati; None se non ci sono ordini. Con background cede il passo alla sincronizzazione tra un blocco e l'altro."""
+        file_path = None
+        try:
+            fetch_size = config.get('export', 'fetch_size', 500)
+            total_orders = self.database_manager.count_orders(filters)
+            if not total_orders: return None
 
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"export_dettaglio_viaggiatori_{timestamp}.csv"
+            filename = f"{file_prefix}_{timestamp}.csv"
             file_path = os.path.join(self.exports_dir, filename)
 
-            fieldnames = ['ID Ordine', 'Numero Ordine', 'Data Ordine', 'Cliente Principale', 'Email Cliente', 'Stato Ordine', 'Totale Ordine', 'Nome Viaggiatore', 'Cognome Viaggiatore', 'Email Viaggiatore', 'Telefono Viaggiatore', 'Partenza Viaggiatore', 'Prodotti', 'Metodo Pagamento']
-            
-            rows_to_write = []
-            for order in orders:
-                common_info = {'ID Ordine': order.get('woo_id', ''), 'Numero Ordine': order.get('order_number', ''), 'Data Ordine': order.get('date_created', ''), 'Cliente Principale': order.get('customer_name', ''), 'Email Cliente': order.get('customer_email', ''), 'Stato Ordine': order.get('status', ''), 'Totale Ordine': order.get('total', 0), 'Metodo Pagamento': order.get('payment_method_title', '')}
-                line_items = json.loads(order['line_items']) if isinstance(order.get('line_items'), str) else order.get('line_items', [])
-                common_info['Prodotti'] = '; '.join([f"{item.get('name', 'N/A')} (x{item.get('quantity', 0)})" for item in line_items])
-                travelers = self._extract_traveler_data(order)
-
-                if travelers:
-                    for traveler in travelers:
-                        row = common_info.copy()
-                        row.update({'Nome Viaggiatore': traveler.get('nome', ''), 'Cognome Viaggiatore': traveler.get('cognome', ''), 'Email Viaggiatore': traveler.get('email', ''), 'Telefono Viaggiatore': traveler.get('telefono', ''), 'Partenza Viaggiatore': traveler.get('partenza', '')})
-                        rows_to_write.append(row)
-                else:
-                    row = common_info.copy()
-                    row.update({'Nome Viaggiatore': '', 'Cognome Viaggiatore': '', 'Email Viaggiatore': '', 'Telefono Viaggiatore': '', 'Partenza Viaggiatore': ''})
-                    rows_to_write.append(row)
-            
-            print(f"DEBUG: Sto per scrivere {len(rows_to_write)} righe nel file CSV...")
-            
-            with open(file_path, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames); writer.writeheader(); writer.writerows(rows_to_write)
-                
-            result = ExportResult(success=True, file_name=filename, file_path=file_path, total_records=len(rows_to_write))
-            if self.on_export_complete: self.on_export_complete(result)
-            print("--- EXPORT COMPLETATO ---")
+            orders = self.database_manager.iter_orders(filters, columns=self.EXPORT_COLUMNS, fetch_size=fetch_size)
+            rows_written = orders_done = 0
+            with open(file_path + '.part', 'w', newline='', encoding='utf-8-sig') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=self.FIELDNAMES); writer.writeheader()
+                for batch in iter(lambda: list(islice(orders, fetch_size)), []):
+                    # Viaggiatori dalla cache locale con una query per blocco (niente chiamate HTTP per ordine)
+                    cached_travelers = self.database_manager.get_cached_travelers([order.get('woo_id') for order in batch])
+                    for order in batch:
+                        rows = self._build_rows(order, cached_travelers)
+                        writer.writerows(rows); rows_written += len(rows)
+                    orders_done += len(batch)
+                    if background: self._yield_to_sync()
+                    elif self.on_export_progress: self.on_export_progress(orders_done, total_orders)
+            os.replace(file_path + '.part', file_path)
+            return ExportResult(success=True, file_name=filename, file_path=file_path, total_records=rows_written)
 
-        except Exception as e:
-            error_msg = f"Errore durante l'export CSV: {e}"
-            result = ExportResult(success=False, error_message=error_msg)
-            if self.on_export_complete: self.on_export_complete(result)
+        except Exception:
+            if file_path and os.path.exists(file_path + '.part'): os.remove(file_path + '.part')
+            raise
@@ -3,17 +3,22 @@
 """
 Gestionale Gitemania - Applicazione Desktop (Versione Finale Stabile e Real-time)
 """
-import sys, os, tkinter as tk, threading, queue
+import sys, os, tkinter as tk, threading
 from tkinter import ttk, messagebox
 from typing import Dict, List
 from config import config
 from woocommerce_api import WooCommerceManager
-from database_manager import DatabaseManager
+from database_manager import DatabaseManager, pending_migrations
 from export_manager import ExportManager
+from webhook_server import WebhookServer
+from traveler_prefetcher import TravelerPrefetcher
+from query_executor import QueryExecutor
+from sync_pipeline import SyncPipeline
+from ui_dispatcher import UIQueue, QueueDispatcher
 from theme_manager import GiteManiTheme
 from modern_components import ModernStatusBar, ModernOrdersView
 from modern_dashboard import ModernDashboard
-from gui_components import SettingsPanel, AboutDialog, OrderDetailWindow
+from gui_components import SettingsPanel, AboutDialog, OrderDetailWindow, MigrationProgressDialog
 
 class GestionaleGitemania:
     def __init__(self):
@@ -23,56 +28,91 @@ class GestionaleGitemania:
         self.root.minsize(1200, 700)
         GiteManiTheme.apply_to_root(self.root)
         
-        self.queue = queue.Queue()
-        self.database_manager = DatabaseManager()
+        self.queue = UIQueue()
+        self.database_manager = self._open_database()
         self.sync_running = False
+        self.webhook_server = None
         self.total_orders_synced = 0
+        self.pending_changed_ids = set()
+        self.view_refresh_scheduled = False
+        self.orders_view_filters = {}  # filtri dell'ultima finestra caricata, non il testo non ancora applicato
         
         self._init_application()
 
+    def _open_database(self) -> DatabaseManager:
+        """Con migrazioni in sospeso (es. v9 + VACUUM su un database grande) le esegue fuori dal thread Tk mostrando l'avanzamento"""
+        db_path = config.get_database_path()
+        if not pending_migrations(db_path): return DatabaseManager(db_path)
+        return MigrationProgressDialog(self.root, lambda on_progress: DatabaseManager(db_path, on_migration_progress=on_progress)).run()
+
     def _init_application(self):
         try:
             self._init_managers()
             self._create_gui()
             self._bind_events()
-            self.root.after(100, self._process_queue)
+            self._start_dispatcher()
             self._load_initial_data_from_db()
             self._auto_connect()
         except Exception as e:
             messagebox.showerror("Errore Critico", f"Errore inizializzazione:\n{e}")
             sys.exit(1)
 
-    def _process_queue(self):
-        try:
-            while not self.queue.empty():
-                msg_type, data = self.queue.get_nowait()
-                if msg_type == "update_status": self.status_bar.set_status(data)
-                elif msg_type == "refresh_view": self._refresh_orders_view()
-                elif msg_type == "sync_finished": self.status_bar.set_status(f"Sincronizzazione completata. Trovati {data} ordini totali.")
-                elif msg_type == "sync_complete":
-                    inserted, updated = data
-                    self.status_bar.set_status(f"Sincronizzazione recente completata: {inserted} nuovi, {updated} aggiornati.")
-                    self._refresh_orders_view()
-                elif msg_type == "export_complete":
-                    success, result_data = data
-                    if success:
-                        messagebox.showinfo("Export Completato", f"File '{result_data['file_name']}' esportato con successo!\nSalvataggio in: {result_data['file_path']}")
-                        self.status_bar.set_status(f"Export di {result_data['total_records']} record completato.")
-                    else:
-                        messagebox.showerror("Errore Export", f"Errore durante l'esportazione:\n{result_data['error_message']}")
-                        self.status_bar.set_status("Errore durante l'export.")
-                elif msg_type == "error": 
-                    messagebox.showerror("Errore", data)
-                    self.status_bar.set_status(f"Errore: {data}")
-        finally:
-            self.root.after(200, self._process_queue)
+    def _start_dispatcher(self):
+        handlers = {
+            "update_status": self.status_bar.set_status,
+            "refresh_view": lambda data: self._refresh_orders_view(self.orders_view_filters, keep_position=True),
+            "orders_changed": self._schedule_view_changes,
+            "query_result": lambda data: self.query_executor.deliver(*data),
+            "sync_finished": lambda data: self.status_bar.set_status(f"Sincronizzazione completata. Trovati {data} ordini totali."),
+            "sync_complete": lambda data: self.status_bar.set_status(f"Sincronizzazione recente completata: {data[0]} nuovi, {data[1]} aggiornati."),
+            "export_complete": self._show_export_result,
+            "error": self._show_error,
+            "replication_status": lambda data: self.status_bar.set_replication_status(data['depth'], data['lag'], data['online']),
+        }
+        self.dispatcher = QueueDispatcher(self.root, self.queue, handlers, budget_ms=config.get('app', 'ui_tick_budget_ms', 30))
+        self.dispatcher.start()
+
+    def _show_export_result(self, data):
+        success, result_data = data
+        if success:
+            messagebox.showinfo("Export Completato", f"File '{result_data['file_name']}' esportato con successo!\nSalvataggio in: {result_data['file_path']}")
+            self.status_bar.set_status(f"Export di {result_data['total_records']} record completato.")
+        else:
+            messagebox.showerror("Errore Export", f"Errore durante l'esportazione:\n{result_data['error_message']}")
+            self.status_bar.set_status("Errore durante l'export.")
+
+    def _show_error(self, message):
+        messagebox.showerror("Errore", message)
+        self.status_bar.set_status(f"Errore: {message}")
 
     def _init_managers(self):
-        self.woo_manager = WooCommerceManager(on_order_update=self.handle_background_sync)
-        self.export_manager = ExportManager(database_manager=self.database_manager, on_export_complete=self._on_export_complete)
+        self.woo_manager = WooCommerceManager(on_order_update=self.handle_background_sync, state_store=self.database_manager)
+        self.export_manager = ExportManager(database_manager=self.database_manager, on_export_complete=self._on_export_complete, on_export_progress=self._on_export_progress,
+                                            on_scheduled_export=self._on_scheduled_export)
+        self.export_manager.start_scheduler()
+        self.traveler_prefetcher = TravelerPrefetcher(self.woo_manager, self.database_manager)
+        self.replicator = None
+        if config.get('supabase', 'replication_enabled', False):
+            # Import solo con la replica attiva: supabase e psycopg2 restano dipendenze opzionali
+            from supabase_manager import SupabaseManager
+            from supabase_replicator import SupabaseReplicator
+            self.supabase_manager = SupabaseManager()
+            self.replicator = SupabaseReplicator(self.database_manager, self.supabase_manager,
+                                                 connect=lambda: self.supabase_manager.initialize(config.get('supabase', 'url'), config.get_encrypted('supabase', 'key')),
+                                                 on_status=lambda status: self.queue.put(("replication_status", status)))
+            self.replicator.start()
+        self.query_executor = QueryExecutor(self.queue)
+
+    def handle_background_sync(self, orders: List[Dict], sync_state: Dict = None):
+        if not orders: return
+        result = self.database_manager.sync_multiple_orders(orders, sync_state)
+        if result.changed_ids:
+            self.queue.put(("orders_changed", result.changed_ids)); self._schedule_background_work()
 
-    def handle_background_sync(self, orders: List[Dict]):
-        if orders: self.database_manager.sync_multiple_orders(orders); self.queue.put(("refresh_view", None))
+    def _schedule_background_work(self):
+        """Dopo una sincronizzazione locale: prefetch dei viaggiatori e replica verso Supabase degli ordini cambiati."""
+        self.traveler_prefetcher.schedule()
+        if self.replicator: self.replicator.schedule()
 
     def _create_gui(self):
         if os.path.exists('assets/icon.ico'): self.root.iconbitmap('assets/icon.ico')
@@ -92,6 +132,7 @@ class GestionaleGitemania:
         file_menu.add_command(label="Connetti", command=self._connect_services)
         file_menu.add_command(label="Disconnetti", command=self._disconnect_services)
         file_menu.add_separator(); file_menu.add_command(label="Esporta Ordini", command=self._export_orders)
+        if self.replicator: file_menu.add_command(label="Backup Supabase", command=self._backup_supabase)
         file_menu.add_separator(); file_menu.add_command(label="Esci", command=self._on_closing)
         orders_menu = tk.Menu(menubar, tearoff=0); menubar.add_cascade(label="Ordini", menu=orders_menu)
         orders_menu.add_command(label="Sincronizza Recenti", command=self._quick_sync)
@@ -112,6 +153,7 @@ class GestionaleGitemania:
         self.notebook = ttk.Notebook(main_container, style='TNotebook'); self.notebook.pack(fill='both', expand=True)
         self.dashboard = ModernDashboard(self.notebook); self.notebook.add(self.dashboard, text="📊 Dashboard")
         self.orders_view = ModernOrdersView(self.notebook, on_filter_apply=self._apply_order_filters); self.notebook.add(self.orders_view, text="📋 Ordini")
+        self.orders_view.submit_query = self.query_executor.submit  # pagine e riordinamenti letti fuori dal thread Tk
         settings_panel = SettingsPanel(self.notebook, current_config=config.config, on_save=self._on_settings_saved, on_test=self._test_connections)
         self.notebook.add(settings_panel, text="⚙️ Impostazioni")
         
@@ -132,7 +174,7 @@ class GestionaleGitemania:
         
     def _perform_connection(self, url, key, secret):
         if self.woo_manager.initialize(url, key, secret):
-            self.root.after(0, self._update_connection_status, True); self._start_sync(); self._load_initial_data_from_db()
+            self.root.after(0, self._update_connection_status, True); self._start_sync(); self._start_webhook_server(); self.queue.put(("refresh_view", None)); self._schedule_background_work()
         else:
             self.root.after(0, self._update_connection_status, False); self.queue.put(("error", "Connessione a WooCommerce fallita."))
             
@@ -146,15 +188,60 @@ class GestionaleGitemania:
     def _load_initial_data_from_db(self):
         self._refresh_orders_view()
         
-    def _refresh_orders_view(self, filters: Dict = None):
-        orders = self.database_manager.get_orders(filters)
-        stats = self.database_manager.get_order_stats(0 if not filters else 30)
-        self.orders_view.update_orders(orders)
-        self.dashboard.update_dashboard(stats)
-        self.status_bar.set_status(f"Visualizzati {len(orders)} ordini.")
+    def _refresh_orders_view(self, filters: Dict = None, keep_position: bool = False):
+        """Ricarica tabella, statistiche e conteggio: le query girano sul QueryExecutor, la vista si aggiorna nel thread Tk."""
+        # La tabella legge solo le pagine visibili: il costo non dipende dal numero di ordini
+        page_filters = dict(filters or {})
+        self.orders_view_filters = page_filters
+        fetch_page = lambda **kwargs: self.database_manager.get_orders_page(page_filters, columns=ModernOrdersView.COLUMNS, **kwargs)
+        request = self.orders_view.window_request(keep_position)
+        
+        def query():
+            return fetch_page(**request['query']), self.database_manager.get_order_stats(0 if not filters else 30), self.database_manager.count_orders(page_filters)
         
+        def apply(result):
+            rows, stats, total = result
+            if not self.orders_view.load_window(fetch_page, request, rows): return
+            self.dashboard.update_dashboard(stats)
+            self.status_bar.set_status(f"Visualizzati {total} ordini.")
+        
+        # Un nuovo filtro supera la richiesta precedente: niente ricerche accodate mentre si digita
+        self.query_executor.submit(ModernOrdersView.WINDOW_CHANNEL, query, apply)
+        
+    def _schedule_view_changes(self, woo_ids: List[int]):
+        """Raccoglie gli ordini sincronizzati e aggiorna la vista una sola volta ogni app.view_refresh_ms."""
+        self.pending_changed_ids.update(woo_ids)
+        if self.view_refresh_scheduled: return
+        self.view_refresh_scheduled = True
+        self.root.after(config.get('app', 'view_refresh_ms', 300), self._flush_view_changes)
+
+    def _flush_view_changes(self):
+        self.view_refresh_scheduled = False
+        changed_ids, self.pending_changed_ids = list(self.pending_changed_ids), set()
+        if not changed_ids: return
+        filters = self.orders_view_filters
+        # Oltre la dimensione della finestra conviene ricaricarla che applicare le singole modifiche
+        if len(changed_ids) > ModernOrdersView.PAGE_SIZE * ModernOrdersView.WINDOW_PAGES:
+            self._refresh_orders_view(filters, keep_position=True); return
+        sort_by = self.orders_view.sort_by
+        
+        def query():
+            rows = self.database_manager.get_orders_by_ids(changed_ids, filters, columns=ModernOrdersView.COLUMNS, sort_by=sort_by)
+            return rows, self.database_manager.get_order_stats(0 if not filters else 30), self.database_manager.count_orders(filters)
+        
+        def apply(result):
+            rows, stats, total = result
+            if sort_by != self.orders_view.sort_by: return  # l'ordinamento cambiato ha già ricaricato la finestra
+            if not self.orders_view.apply_changes(changed_ids, rows):
+                self._refresh_orders_view(filters, keep_position=True); return
+            self.dashboard.update_dashboard(stats)
+            self.status_bar.set_status(f"Visualizzati {total} ordini.")
+        
+        self.query_executor.submit("orders_changes", query, apply)
+
     def _apply_order_filters(self):
         filters = self._get_current_filters()
+        self.orders_view.use_relevance_sort(bool(filters.get('search_term')))
         self.queue.put(("update_status", "Ricerca in corso...")); self._refresh_orders_view(filters or {})
         
     def _get_current_filters(self) -> Dict:
@@ -171,17 +258,18 @@ class GestionaleGitemania:
         self.total_orders_synced = 0
         self.queue.put(("update_status", "Download di tutti gli ordini in corso..."))
 
-        def process_page(orders_page: List[Dict]):
-            inserted, updated = self.database_manager.sync_multiple_orders(orders_page)
-            self.total_orders_synced += len(orders_page)
-            self.queue.put(("update_status", f"Sincronizzati {self.total_orders_synced} ordini..."))
-            if inserted > 0 or updated > 0:
-                self.queue.put(("refresh_view", None))
+        def on_progress(synced: int):
+            self.total_orders_synced = synced
+            self.queue.put(("update_status", f"Sincronizzati {synced} ordini..."))
 
         def sync_task():
-            success = self.woo_manager.get_orders_paged(params=None, page_callback=process_page)
+            # Download, preparazione degli ordini e scrittura su DB si sovrappongono (vedi SyncPipeline)
+            pipeline = SyncPipeline(self.database_manager, on_progress=on_progress, on_changed=lambda ids: self.queue.put(("orders_changed", ids))).start()
+            success = self.woo_manager.get_orders_paged(params=None, page_callback=pipeline.submit)
+            try: pipeline.finish()
+            except Exception: success = False
             if success:
-                self.queue.put(("sync_finished", self.total_orders_synced))
+                self.queue.put(("sync_finished", self.total_orders_synced)); self._schedule_background_work()
             else:
                 self.queue.put(("error", "La sincronizzazione completa è fallita."))
 
@@ -195,8 +283,10 @@ class GestionaleGitemania:
         self.queue.put(("update_status", "Sincronizzazione ordini recenti..."))
         recent_orders = self.woo_manager.fetch_last_day_orders()
         if recent_orders is not None:
-            inserted, updated = self.database_manager.sync_multiple_orders(recent_orders)
-            self.queue.put(("sync_complete", (inserted, updated)))
+            result = self.database_manager.sync_multiple_orders(recent_orders)
+            self.queue.put(("sync_complete", tuple(result)))
+            if result.changed_ids:
+                self.queue.put(("orders_changed", result.changed_ids)); self._schedule_background_work()
         else:
             self.queue.put(("error", "Errore durante la sincronizzazione rapida."))
     
@@ -204,13 +294,31 @@ class GestionaleGitemania:
         if self.woo_manager and not self.sync_running:
             self.woo_manager.start_sync(); self.sync_running = True; self.status_bar.set_sync_status(True)
             
+    def _start_webhook_server(self):
+        if not config.get('webhook', 'enabled', False) or self.webhook_server: return
+        secret = config.get_encrypted('webhook', 'secret')
+        if not secret:
+            self.queue.put(("update_status", "Webhook non attivo: secret mancante nella configurazione.")); return
+        self.webhook_server = WebhookServer(secret, on_batch=self.handle_background_sync)
+        if self.webhook_server.start(): self.woo_manager.webhook_server = self.webhook_server
+        else: self.webhook_server = None
+            
+    def _stop_webhook_server(self):
+        if self.webhook_server:
+            self.webhook_server.stop(); self.webhook_server = None; self.woo_manager.webhook_server = None
+            
     def _disconnect_services(self):
         if self.sync_running:
             self.woo_manager.stop_sync(); self.sync_running = False; self.status_bar.set_sync_status(False)
+        self._stop_webhook_server(); self.traveler_prefetcher.stop()
         self._update_connection_status(False)
         
     def _on_closing(self):
         if self.sync_running: self.woo_manager.stop_sync()
+        self._stop_webhook_server(); self.traveler_prefetcher.stop(); self.query_executor.stop()
+        if self.replicator: self.replicator.stop()
+        self.export_manager.stop_scheduler()
+        self.database_manager.close()
         self.root.destroy()
         
     def _on_settings_saved(self, new_config: Dict):
@@ -229,22 +337,29 @@ class GestionaleGitemania:
             order_id = self.orders_view.selected_order_id
             if order_id is None: return
             
-            order_data = next((order for order in self.orders_view.orders_data if order.get('woo_id') == order_id), None)
+            order_data = self.database_manager.get_order(order_id)
             
             if order_data:
-                self.queue.put(("update_status", f"Caricamento dati viaggiatori per ordine #{order_id}..."))
-                
-                def fetch_viaggiatori_and_show():
-                    viaggiatori = self.woo_manager.get_viaggiatori_for_order(order_id)
-                    
+                def show(viaggiatori):
                     if viaggiatori is not None:
                         raw_data = order_data.get('raw_data', {})
-                        raw_data['_viaggiatori_data'] = viaggiatori 
+                        raw_data['_viaggiatori_data'] = viaggiatori
                         order_data['raw_data'] = raw_data
+                    OrderDetailWindow(self.root, order_data)
+                
+                cached = self.database_manager.get_cached_travelers([order_id])
+                if order_id in cached:
+                    show(cached[order_id]); return
+                
+                # Ordine non ancora in cache (nuovo o appena modificato): scarica e salva per le prossime aperture
+                self.queue.put(("update_status", f"Caricamento dati viaggiatori per ordine #{order_id}..."))
+                
+                def fetch_viaggiatori_and_show():
+                    viaggiatori = self.traveler_prefetcher.fetch_and_cache(order_id, order_data.get('date_modified'))
                     
                     def open_window():
                         self.queue.put(("update_status", "Pronto."))
-                        OrderDetailWindow(self.root, order_data)
+                        show(viaggiatori)
                     
                     self.root.after(0, open_window)
 
@@ -259,10 +374,26 @@ class GestionaleGitemania:
         current_filters = self._get_current_filters()
         threading.Thread(target=self.export_manager.export_orders_csv, args=(current_filters,), daemon=True).start()
         
+    def _backup_supabase(self):
+        """Backup in streaming (Postgres diretto se supabase.direct_postgres, altrimenti PostgREST) fuori dal thread Tk"""
+        self.queue.put(("update_status", "Backup Supabase in corso..."))
+        def backup_task():
+            if not self.supabase_manager.connected and not self.supabase_manager.pg_pool: self.replicator.connect()
+            self.queue.put(("update_status", "Backup Supabase completato." if self.supabase_manager.backup_data() else "Errore durante il backup Supabase."))
+        threading.Thread(target=backup_task, daemon=True).start()
+        
+    def _on_export_progress(self, exported: int, total: int):
+        self.queue.put(("update_status", f"Export in corso: {exported}/{total} ordini..."))
+        
     def _on_export_complete(self, result):
         result_data = {'file_name': result.file_name, 'total_records': result.total_records, 'file_path': result.file_path, 'error_message': result.error_message}
         self.queue.put(("export_complete", (result.success, result_data)))
         
+    def _on_scheduled_export(self, name: str, result):
+        # Export notturni: solo barra di stato, niente finestre di dialogo
+        message = f"Export pianificato '{name}': {result.total_records} record in {result.file_name}." if result.file_name else f"Export pianificato '{name}': nessun ordine modificato."
+        self.queue.put(("update_status", message if result.success else f"Export pianificato '{name}' fallito: {result.error_message}"))
+        
     def _show_about(self): AboutDialog(self.root)
     
     def run(self): self.root.mainloop()
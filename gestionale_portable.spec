@@ -19,7 +19,7 @@ a = Analysis(
         ('export_manager.py', '.'),
         ('gui_components.py', '.'),
     ],
-    hiddenimports=['tkinter', 'tkinter.ttk', 'tkinter.messagebox', 'tkinter.filedialog', 'PIL', 'PIL._tkinter_finder', 'woocommerce', 'cryptography', 'matplotlib', 'matplotlib.backends.backend_tkagg', 'pandas', 'openpyxl', 'docx', 'flask', 'schedule', 'apscheduler', 'qrcode', 'sqlite3', 'json', 'threading', 'datetime', 'requests', 'urllib3', 'certifi', 'charset_normalizer', 'idna', 'ttkthemes', 'ttkbootstrap'],
+    hiddenimports=['tkinter', 'tkinter.ttk', 'tkinter.messagebox', 'tkinter.filedialog', 'PIL', 'PIL._tkinter_finder', 'woocommerce', 'cryptography', 'matplotlib', 'matplotlib.backends.backend_tkagg', 'pandas', 'openpyxl', 'docx', 'flask', 'apscheduler', 'qrcode', 'sqlite3', 'json', 'threading', 'datetime', 'requests', 'urllib3', 'certifi', 'charset_normalizer', 'idna', 'ttkthemes', 'ttkbootstrap'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -7,6 +7,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from typing import Dict, Callable, List
 import json
+import queue
+import threading
 from config import config
 from theme_manager import GiteManiTheme
 
@@ -57,6 +59,38 @@ class AboutDialog(tk.Toplevel):
         ttk.Label(main_frame, text="Versione 1.0").pack()
         ttk.Button(main_frame, text="Chiudi", command=self.destroy, style='Primary.TButton').pack(pady=20)
 
+class MigrationProgressDialog(tk.Toplevel):
+    """Avanzamento di un task lungo (migrazioni del database all'avvio) eseguito in un thread separato"""
+    def __init__(self, parent, task: Callable[[Callable[[str], None]], object], title: str = "Aggiornamento database"):
+        super().__init__(parent)
+        self.title(title); self.geometry("450x130"); self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", lambda: None)  # non interrompibile: il database resterebbe a metà migrazione
+        self.messages, self.result, self.error = queue.Queue(), None, None
+        main_frame = ttk.Frame(self, padding=20)
+        main_frame.pack(fill='both', expand=True)
+        self.status_label = ttk.Label(main_frame, text="Aggiornamento dello schema in corso...")
+        self.status_label.pack(anchor='w')
+        self.progress = ttk.Progressbar(main_frame, mode='indeterminate')
+        self.progress.pack(fill='x', pady=10); self.progress.start(15)
+        self._thread = threading.Thread(target=self._run_task, args=(task,), daemon=True, name="db-migrations")
+        self._thread.start()
+        self.after(100, self._poll)
+
+    def _run_task(self, task):
+        try: self.result = task(self.messages.put)
+        except Exception as e: self.error = e
+
+    def _poll(self):
+        while not self.messages.empty(): self.status_label.config(text=self.messages.get_nowait())
+        if self._thread.is_alive(): self.after(100, self._poll)
+        else: self.progress.stop(); self.destroy()
+
+    def run(self):
+        """Attende la fine del task mantenendo attivo il ciclo Tk; restituisce il risultato o rilancia l'errore"""
+        self.wait_window()
+        if self.error: raise self.error
+        return self.result
+
 class OrderDetailWindow(tk.Toplevel):
     def __init__(self, parent, order: Dict):
         super().__init__(parent)
@@ -180,6 +214,10 @@ class OrderDetailWindow(tk.Toplevel):
                 return [{'Info': str(value)}]
             return None
 
+        # Dati dell'endpoint viaggiatori (cache locale o download all'apertura)
+        result = process_value(raw_data.get('_viaggiatori_data'))
+        if result: return result
+
         # Cerca nei meta_data (dove il filtro PHP li inserirà)
         meta_data = raw_data.get('meta_data', [])
         for item in meta_data:
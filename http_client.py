@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sessione HTTP condivisa per Gestionale Gitemania
+Pool di connessioni keep-alive, compressione, retry con backoff esponenziale e metriche di latenza
+Sviluppato da TechExpresso
+"""
+
+import re, threading, time
+from collections import defaultdict, deque
+from typing import Dict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING  # include "br" solo se brotli è installato
+from config import config
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class LatencyMetrics:
+    """Latenze per endpoint (gli id numerici nel percorso sono raggruppati in {id})."""
+    WINDOW = 200
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.WINDOW))
+        self._counts = defaultdict(int)
+        self._errors = defaultdict(int)
+
+    @staticmethod
+    def endpoint_key(method: str, url: str) -> str:
+        path = re.sub(r'/\d+(?=/|$)', '/{id}', requests.utils.urlparse(url).path)
+        return f"{method.upper()} {path}"
+
+    def record(self, key: str, seconds: float, ok: bool):
+        with self._lock:
+            self._samples[key].append(seconds)
+            self._counts[key] += 1
+            if not ok: self._errors[key] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Per endpoint: richieste, errori, latenza media/p50/p95/max (ms) sulle ultime WINDOW richieste."""
+        with self._lock:
+            result = {}
+            for key, samples in self._samples.items():
+                ordered = sorted(samples)
+                result[key] = {
+                    'requests': self._counts[key], 'errors': self._errors[key],
+                    'avg_ms': sum(ordered) / len(ordered) * 1000,
+                    'p50_ms': ordered[len(ordered) // 2] * 1000,
+                    'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                    'max_ms': ordered[-1] * 1000,
+                }
+            return result
+
+class InstrumentedSession(requests.Session):
+    """requests.Session che misura la durata di ogni richiesta (retry inclusi)."""
+
+    def __init__(self):
+        super().__init__()
+        self.metrics = LatencyMetrics()
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            ok = response.status_code < 400
+            return response
+        finally:
+            self.metrics.record(LatencyMetrics.endpoint_key(method, url), time.perf_counter() - start, ok)
+
+def _build_retry(max_retries: int, backoff_factor: float, backoff_jitter: float) -> Retry:
+    options = dict(total=max_retries, connect=max_retries, read=max_retries, status=max_retries,
+                   backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                   respect_retry_after_header=True, raise_on_status=False)
+    try:
+        return Retry(backoff_jitter=backoff_jitter, **options)
+    except TypeError:  # urllib3 < 2.0: niente jitter
+        return Retry(**options)
+
+def create_session(pool_size: int = None, max_retries: int = None, backoff_factor: float = 0.5, backoff_jitter: float = 0.5) -> InstrumentedSession:
+    """Sessione con pool di connessioni (app.http_pool_size), gzip/brotli e retry su 429/5xx che rispettano Retry-After."""
+    pool_size = pool_size or config.get('app', 'http_pool_size', 10)
+    max_retries = config.get('app', 'http_max_retries', 4) if max_retries is None else max_retries
+    session = InstrumentedSession()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=_build_retry(max_retries, backoff_factor, backoff_jitter))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'})
+    return session
+
+def mount_single_attempt(session: requests.Session, prefix: str):
+    """
+    Per i percorsi che ritentano da sé 429/5xx ed errori di rete: adapter senza retry montato su prefix, con lo
+    stesso pool di connessioni keep-alive della sessione. Evita due livelli di retry annidati.
+    """
+    adapter = HTTPAdapter(max_retries=0)
+    adapter.poolmanager = session.get_adapter(prefix).poolmanager
+    session.mount(prefix, adapter)
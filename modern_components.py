@@ -27,6 +27,9 @@ class ModernStatusBar(ttk.Frame):
         self.conn_label.pack(side=tk.LEFT, padx=(5, 0))
         self.sync_indicator = ttk.Label(self, text="⏸️", font=('Segoe UI', 12))
         self.sync_indicator.pack(side=tk.RIGHT, padx=5)
+        self.replication_var = tk.StringVar(value="")
+        self.replication_label = ttk.Label(self, textvariable=self.replication_var)
+        self.replication_label.pack(side=tk.RIGHT, padx=10)
     def set_status(self, message: str): self.status_var.set(message)
     def set_connection_status(self, connected: bool, service: str = ""):
         color = GiteManiTheme.COLORS['success'] if connected else GiteManiTheme.COLORS['danger']
@@ -35,12 +38,37 @@ class ModernStatusBar(ttk.Frame):
         self.conn_indicator.configure(foreground=color)
     def set_sync_status(self, syncing: bool):
         self.sync_indicator.configure(text="🔄" if syncing else "⏸️")
+    def set_replication_status(self, depth: int, lag: float, online: bool):
+        """Coda verso Supabase: ordini in attesa e ritardo della modifica più vecchia non replicata."""
+        lag_text = f"{lag:.0f}s" if lag < 120 else f"{lag / 60:.0f} min" if lag < 7200 else f"{lag / 3600:.0f} h"
+        if not depth: text = "☁️ Supabase allineato" if online else "☁️ Supabase offline"
+        else: text = f"☁️ {'' if online else 'Supabase offline, '}{depth} in coda ({lag_text})"
+        self.replication_var.set(text)
+        self.replication_label.configure(foreground=GiteManiTheme.COLORS['text' if online else 'warning'])
 
 class ModernOrdersView(ttk.Frame):
+    # Colonne di orders lette per la tabella: niente JSON da decodificare a ogni aggiornamento
+    COLUMNS = ['woo_id', 'customer_name', 'customer_email', 'status', 'total', 'date_created', 'payment_method_title']
+    
+    # Modalità a finestra: in memoria e nel Treeview solo WINDOW_PAGES pagine attorno alla posizione visibile
+    PAGE_SIZE = 100
+    WINDOW_PAGES = 3
+    SCROLL_MARGIN = 0.1  # frazione della finestra dal bordo che fa caricare la pagina successiva/precedente
+    SORT_COLUMNS = {'id': 'woo_id', 'customer': 'customer_name', 'status': 'status', 'total': 'total', 'date': 'date_created', 'payment': 'payment_method_title'}
+    WINDOW_CHANNEL, PAGE_CHANNEL = "orders_view", "orders_page"  # canali QueryExecutor: ricarica della finestra, pagina successiva/precedente
+    RELEVANCE_SORT = 'relevance'  # ordinamento per pertinenza della ricerca (DatabaseManager.get_orders_page)
+    HEADINGS = {'id': 'ID Ordine', 'customer': 'Cliente', 'status': 'Stato', 'total': 'Totale', 'date': 'Data', 'payment': 'Pagamento'}
+    
     def __init__(self, parent, on_filter_apply: Callable, **kwargs):
         super().__init__(parent, **kwargs)
         self.orders_data = []
         self.on_filter_apply = on_filter_apply
+        self.fetch_page = None          # (sort_by, descending, after, before, inclusive, limit) -> righe con 'page_key'
+        self.submit_query = None        # (canale, query, on_result): QueryExecutor.submit; senza, le query girano subito
+        self._window_version = 0        # cambia a ogni ricarica della finestra: scarta le pagine chieste prima
+        self.sort_by, self.sort_descending = 'date_created', True
+        self.has_more_above = self.has_more_below = False
+        self._loading = False
         self._create_widgets()
 
     def _create_widgets(self):
@@ -55,13 +83,12 @@ class ModernOrdersView(ttk.Frame):
         
         columns = ('id', 'customer', 'status', 'total', 'date', 'payment')
         self.tree = ttk.Treeview(table_container, columns=columns, show='headings')
-        headings = {'id': 'ID Ordine', 'customer': 'Cliente', 'status': 'Stato', 'total': 'Totale', 'date': 'Data', 'payment': 'Pagamento'}
         widths = {'id': 100, 'customer': 250, 'status': 150, 'total': 120, 'date': 160, 'payment': 200}
-        for col, text in headings.items(): self.tree.heading(col, text=text)
+        for col, text in self.HEADINGS.items(): self.tree.heading(col, text=text, command=lambda c=col: self._on_heading_click(c))
         for col, width in widths.items(): self.tree.column(col, width=width, anchor='w' if col != 'total' else 'e')
-        vsb = ttk.Scrollbar(table_container, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
-        vsb.pack(side='right', fill='y')
+        self.vsb = ttk.Scrollbar(table_container, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.vsb.pack(side='right', fill='y')
         self.tree.pack(side='left', fill='both', expand=True)
         self.tree.bind("<Double-1>", self._on_double_click)
 
@@ -96,33 +123,202 @@ class ModernOrdersView(ttk.Frame):
         self.on_filter_apply()
         
     def update_orders(self, orders: List[Dict]):
-        self.orders_data = orders
+        """Modalità lista: mostra tutti gli ordini passati (per elenchi brevi)."""
+        self.fetch_page = None
+        self.has_more_above = self.has_more_below = False
+        self.orders_data = list(orders or [])
         self.tree.delete(*self.tree.get_children())
-        if orders:
-            for order in orders: self._add_order_to_tree(order)
+        for order in self.orders_data: self._add_order_to_tree(order)
+            
+    def set_data_source(self, fetch_page: Callable, keep_position: bool = False):
+        """
+        Modalità a finestra: le righe arrivano a pagine da fetch_page (paginazione keyset lato database).
+        keep_position ricarica dalla prima riga visibile (aggiornamenti in background) invece che dall'inizio.
+        La query gira su submit_query; la finestra si aggiorna nella callback, nel thread Tk.
+        """
+        request = self.window_request(keep_position)
+        self._submit(self.WINDOW_CHANNEL, lambda: fetch_page(**request['query']), lambda rows: self.load_window(fetch_page, request, rows))
+
+    def _submit(self, channel: str, query: Callable, on_result: Callable):
+        if self.submit_query: self.submit_query(channel, query, on_result)
+        else: on_result(query())
+
+    def window_request(self, keep_position: bool = False) -> Dict:
+        """Parametri per ricaricare la finestra: letti nel thread Tk, la query può girare altrove."""
+        start_key = self._row_key(self.orders_data[0]) if keep_position and self.fetch_page and self.orders_data else None
+        limit = max(len(self.orders_data), self.PAGE_SIZE) if start_key else self.PAGE_SIZE
+        return {'query': {'sort_by': self.sort_by, 'descending': self.sort_descending, 'after': start_key, 'before': None, 'inclusive': True, 'limit': limit},
+                'has_more_above': self.has_more_above if start_key else False}
+
+    def load_window(self, fetch_page: Callable, request: Dict, rows: List[Dict]) -> bool:
+        """Mostra le righe lette per request; False (e nessun cambiamento) se nel frattempo è cambiato l'ordinamento."""
+        if (request['query']['sort_by'], request['query']['descending']) != (self.sort_by, self.sort_descending): return False
+        keep_position = request['query']['after'] is not None
+        self.fetch_page = fetch_page
+        self._window_version += 1; self._loading = False
+        first_visible = self.tree.yview()[0]
+        selection = self.tree.selection()
+        self.tree.delete(*self.tree.get_children())
+        self.orders_data = list(rows)
+        for order in self.orders_data: self._add_order_to_tree(order)
+        self.has_more_above, self.has_more_below = request['has_more_above'], len(rows) == request['query']['limit']
+        if keep_position: self.tree.yview_moveto(first_visible)
+        kept = [iid for iid in selection if self.tree.exists(iid)]
+        if kept: self.tree.selection_set(kept)
+        return True
+
+    def _page_query(self, after=None, before=None) -> Callable:
+        # Parametri letti ora nel thread Tk: la query può girare su un altro thread
+        fetch_page, params = self.fetch_page, dict(sort_by=self.sort_by, descending=self.sort_descending, after=after, before=before, inclusive=False, limit=self.PAGE_SIZE)
+        return lambda: fetch_page(**params)
+
+    @staticmethod
+    def _row_key(order: Dict) -> tuple:
+        return (order.get('page_key'), order.get('woo_id'))
+
+    def _on_tree_scroll(self, first, last):
+        self.vsb.set(first, last)
+        if not self.fetch_page or self._loading: return
+        if float(last) >= 1 - self.SCROLL_MARGIN and self.has_more_below:
+            self._loading = True; self.after_idle(self._load_next_page)
+        elif float(first) <= self.SCROLL_MARGIN and self.has_more_above:
+            self._loading = True; self.after_idle(self._load_previous_page)
+
+    def _load_next_page(self):
+        if not self.orders_data: self._loading = False; return
+        version = self._window_version
+        self._submit(self.PAGE_CHANNEL, self._page_query(after=self._row_key(self.orders_data[-1])), lambda rows: self._append_page(rows, version))
+
+    def _load_previous_page(self):
+        if not self.orders_data: self._loading = False; return
+        version = self._window_version
+        self._submit(self.PAGE_CHANNEL, self._page_query(before=self._row_key(self.orders_data[0])), lambda rows: self._prepend_page(rows, version))
+
+    def _append_page(self, rows: List[Dict], version: int):
+        if version != self._window_version: return  # finestra ricaricata mentre la pagina era in lettura
+        try:
+            self.has_more_below = len(rows) == self.PAGE_SIZE
+            rows = [order for order in rows if not self.tree.exists(str(order.get('woo_id')))]  # già inseriti da apply_changes
+            if not rows: return
+            first_visible = self.tree.yview()[0] * len(self.orders_data)
+            for order in rows: self._add_order_to_tree(order)
+            self.orders_data.extend(rows)
+            excess = len(self.orders_data) - self.PAGE_SIZE * self.WINDOW_PAGES
+            if excess > 0:
+                # Scarta le righe più in alto mantenendo ferma la riga visibile
+                self.tree.delete(*[str(order.get('woo_id')) for order in self.orders_data[:excess]])
+                del self.orders_data[:excess]
+                self.has_more_above = True
+                self.tree.yview_moveto(max(first_visible - excess, 0) / len(self.orders_data))
+        finally:
+            self._loading = False
+
+    def _prepend_page(self, rows: List[Dict], version: int):
+        if version != self._window_version: return
+        try:
+            self.has_more_above = len(rows) == self.PAGE_SIZE
+            rows = [order for order in rows if not self.tree.exists(str(order.get('woo_id')))]
+            if not rows: return
+            first_visible = self.tree.yview()[0] * len(self.orders_data)
+            for index, order in enumerate(rows): self._add_order_to_tree(order, index)
+            self.orders_data[:0] = rows
+            excess = len(self.orders_data) - self.PAGE_SIZE * self.WINDOW_PAGES
+            if excess > 0:
+                self.tree.delete(*[str(order.get('woo_id')) for order in self.orders_data[-excess:]])
+                del self.orders_data[-excess:]
+                self.has_more_below = True
+            self.tree.yview_moveto((first_visible + len(rows)) / len(self.orders_data))
+        finally:
+            self._loading = False
+
+    def apply_changes(self, changed_ids: List[int], rows: List[Dict]) -> bool:
+        """
+        Aggiorna solo gli ordini sincronizzati: rows sono quelli (tra changed_ids) che rispettano ancora i filtri.
+        Righe già presenti aggiornate sul posto o spostate, nuove righe inserite solo se cadono nella finestra caricata.
+        False in modalità lista, dove serve un aggiornamento completo.
+        """
+        if not self.fetch_page: return False
+        rows_by_id = {order.get('woo_id'): order for order in rows}
+        selection = set(self.tree.selection())
+        for woo_id in changed_ids:
+            iid = str(woo_id)
+            if not self.tree.exists(iid): continue
+            position = self._position_of(woo_id)
+            order = rows_by_id.get(woo_id)
+            if order is not None and self._row_key(order) == self._row_key(self.orders_data[position]):
+                # Stessa posizione nell'ordinamento: solo i valori cambiano
+                self.orders_data[position] = order
+                self.tree.item(iid, values=self._format_values(order))
+                del rows_by_id[woo_id]
+            else:
+                self.tree.delete(iid); del self.orders_data[position]
+        for woo_id, order in rows_by_id.items():
+            position = self._insert_position(self._row_key(order))
+            # Fuori dalla finestra: comparirà quando l'utente scorre fino a quella pagina
+            if (position == 0 and self.has_more_above) or (position == len(self.orders_data) and self.has_more_below): continue
+            self.orders_data.insert(position, order)
+            self._add_order_to_tree(order, position)
+            if str(woo_id) in selection: self.tree.selection_add(str(woo_id))
+        return True
+
+    def _position_of(self, woo_id: int) -> int:
+        return next(index for index, order in enumerate(self.orders_data) if order.get('woo_id') == woo_id)
+
+    def _insert_position(self, key: tuple) -> int:
+        """Posizione di key nella finestra ordinata (ricerca binaria, nei due versi di ordinamento)."""
+        low, high = 0, len(self.orders_data)
+        while low < high:
+            middle = (low + high) // 2
+            current = self._row_key(self.orders_data[middle])
+            if (current > key) if self.sort_descending else (current < key): low = middle + 1
+            else: high = middle
+        return low
+
+    def use_relevance_sort(self, searching: bool):
+        """Una nuova ricerca ordina per pertinenza (nessuna colonna evidenziata); senza ricerca si torna alla data."""
+        if searching: self.sort_by, self.sort_descending = self.RELEVANCE_SORT, True
+        elif self.sort_by == self.RELEVANCE_SORT: self.sort_by, self.sort_descending = 'date_created', True
+        self._update_heading_arrows()
+
+    def _update_heading_arrows(self):
+        for col, text in self.HEADINGS.items():
+            arrow = (' ▼' if self.sort_descending else ' ▲') if self.SORT_COLUMNS[col] == self.sort_by else ''
+            self.tree.heading(col, text=text + arrow)
+
+    def _on_heading_click(self, column: str):
+        """Ordina sul database per la colonna cliccata (secondo clic: verso opposto)."""
+        sort_by = self.SORT_COLUMNS[column]
+        if sort_by == self.sort_by: self.sort_descending = not self.sort_descending
+        else: self.sort_by, self.sort_descending = sort_by, sort_by in ('woo_id', 'total', 'date_created')
+        self._update_heading_arrows()
+        if self.fetch_page: self.set_data_source(self.fetch_page)
+        else:
+            key = lambda order: (order.get(self.sort_by) or 0) if self.sort_by in ('woo_id', 'total') else str(order.get(self.sort_by) or '')
+            self.update_orders(sorted(self.orders_data, key=key, reverse=self.sort_descending))
             
     def _on_double_click(self, event):
         if not self.tree.selection(): return
-        item_id_text = self.tree.item(self.tree.selection()[0])['values'][0]
-        order_id_str = item_id_text.replace('#', '').strip()
+        order_id_str = self.tree.selection()[0]
         if order_id_str.isdigit():
             self.selected_order_id = int(order_id_str)
             self.event_generate("<<ShowOrderDetails>>")
         else:
             self.selected_order_id = None
 
-    def _add_order_to_tree(self, order: Dict):
+    def _add_order_to_tree(self, order: Dict, index='end'):
         try:
-            order_id = f"#{order.get('woo_id', 'N/D')}"
-            billing = order.get('billing_data', {}) or {}
-            customer_name = f"{billing.get('first_name', '')} {billing.get('last_name', '')}".strip() or billing.get('email', 'N/D')
-            status_raw = order.get('status', 'n/d').lower()
-            status_text = f"{GiteManiTheme.get_status_icon(status_raw)} {status_raw.capitalize()}"
-            total_text = f"€ {float(order.get('total', 0.0)):,.2f}"
-            date_created_raw = order.get('date_created', '')
-            date_text = datetime.fromisoformat(date_created_raw.replace('Z', '+00:00')).strftime('%d/%m/%Y %H:%M') if date_created_raw else "N/D"
-            payment_text = order.get('payment_method_title', 'N/D')
-            values = (order_id, customer_name, status_text, total_text, date_text, payment_text)
-            self.tree.insert('', 'end', values=values)
+            self.tree.insert('', index, iid=str(order.get('woo_id')), values=self._format_values(order))
         except Exception as e:
             print(f"ERRORE: Impossibile aggiungere l'ordine #{order.get('woo_id')} alla tabella: {e}")
+
+    @staticmethod
+    def _format_values(order: Dict) -> tuple:
+        order_id = f"#{order.get('woo_id', 'N/D')}"
+        customer_name = order.get('customer_name') or order.get('customer_email') or 'N/D'
+        status_raw = order.get('status', 'n/d').lower()
+        status_text = f"{GiteManiTheme.get_status_icon(status_raw)} {status_raw.capitalize()}"
+        total_text = f"€ {float(order.get('total', 0.0)):,.2f}"
+        date_created_raw = order.get('date_created', '')
+        date_text = datetime.fromisoformat(date_created_raw.replace('Z', '+00:00')).strftime('%d/%m/%Y %H:%M') if date_created_raw else "N/D"
+        payment_text = order.get('payment_method_title', 'N/D')
+        return (order_id, customer_name, status_text, total_text, date_text, payment_text)
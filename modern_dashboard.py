@@ -5,19 +5,166 @@ Dashboard Moderna per Gestionale Gitemania (Versione Finale Stabile)
 """
 import tkinter as tk
 from tkinter import ttk
+import hashlib, json, math, time
+from abc import ABC, abstractmethod
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
+from collections import deque
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Optional
 import warnings
+from config import config
 
 from theme_manager import GiteManiTheme, ModernUIHelper
 
+def stats_fingerprint(data) -> str:
+    """Impronta dei dati di un grafico o delle statistiche: stessa impronta, niente da ridisegnare."""
+    return hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+def format_trend(change, label: str, unit: str = "%") -> str:
+    """Testo del trend di una card KPI (▲/▼ colorati da _update_kpi)."""
+    if change is None: return "Nessun dato prec."
+    if abs(change) < 0.05: return f"Invariato {label}"
+    return f"{'▲' if change > 0 else '▼'} {change:+.1f}{unit} {label}"
+
+class DashboardChart(ABC):
+    """
+    Grafico della dashboard su una Figure matplotlib. Ridisegna solo quando i dati cambiano e,
+    se la struttura è la stessa (stesse etichette/stesso numero di barre), aggiorna gli artist esistenti
+    invece di ricostruire gli assi con ax.clear() e tight_layout().
+    """
+    def __init__(self, figure: Figure, canvas):
+        self.fig, self.canvas = figure, canvas
+        self.ax = figure.add_subplot(111)
+        self.data: Dict = {}
+        self.rendered_fingerprint: Optional[str] = None
+        self.render_times = deque(maxlen=100)  # secondi per ridisegno, per misurarne il costo
+
+    def set_data(self, data: Dict):
+        self.data = data or {}
+
+    @property
+    def dirty(self) -> bool:
+        return stats_fingerprint(self.data) != self.rendered_fingerprint
+
+    def render(self, force_rebuild: bool = False) -> bool:
+        """Ridisegna se i dati sono cambiati (force_rebuild: ricostruzione completa come in passato)."""
+        if not force_rebuild and not self.dirty: return False
+        start = time.perf_counter()
+        if force_rebuild or not self._update_artists(self.data):
+            self.ax.clear()
+            if self.data: self._build(self.data)
+            self.fig.tight_layout()
+        self.canvas.draw()
+        self.rendered_fingerprint = stats_fingerprint(self.data)
+        self.render_times.append(time.perf_counter() - start)
+        return True
+
+    @abstractmethod
+    def _build(self, data: Dict):
+        """Disegna il grafico da zero sugli assi vuoti (ogni grafico concreto deve implementarlo)."""
+    def _update_artists(self, data: Dict) -> bool: return False
+
+class StatusDonutChart(DashboardChart):
+    PCT_DISTANCE = 0.8
+    START_ANGLE = 90
+
+    def __init__(self, figure, canvas):
+        super().__init__(figure, canvas)
+        self.labels, self.wedges, self.autotexts = [], [], []
+
+    def _build(self, by_status: Dict):
+        self.labels = list(by_status.keys())
+        self.wedges, _, self.autotexts = self.ax.pie(
+            list(by_status.values()), autopct='%1.1f%%', startangle=self.START_ANGLE,
+            wedgeprops=dict(width=0.4, edgecolor=GiteManiTheme.COLORS['card'], linewidth=2),
+            pctdistance=self.PCT_DISTANCE
+        )
+        plt.setp(self.autotexts, size=8, weight="bold", color="white")
+        self.ax.set_title('Distribuzione Stati Ordini', fontweight='bold')
+
+    def _update_artists(self, by_status: Dict) -> bool:
+        if not self.wedges or list(by_status.keys()) != self.labels: return False
+        total = sum(by_status.values())
+        if total <= 0: return False
+        # Stessi angoli calcolati da ax.pie (antiorario da START_ANGLE)
+        theta = self.START_ANGLE
+        for wedge, autotext, value in zip(self.wedges, self.autotexts, by_status.values()):
+            fraction = value / total
+            wedge.set_theta1(theta); wedge.set_theta2(theta + 360 * fraction)
+            middle = math.radians(theta + 180 * fraction)
+            autotext.set_position((self.PCT_DISTANCE * math.cos(middle), self.PCT_DISTANCE * math.sin(middle)))
+            autotext.set_text(f"{fraction * 100:1.1f}%")
+            theta += 360 * fraction
+        return True
+
+class TimelineChart(DashboardChart):
+    def __init__(self, figure, canvas):
+        super().__init__(figure, canvas)
+        self.line, self.fill = None, None
+
+    @staticmethod
+    def _series(by_date: Dict):
+        dates = sorted(by_date.keys())
+        return [datetime.fromisoformat(date.replace('Z', '+00:00')) for date in dates], [by_date[date] for date in dates]
+
+    def _build(self, by_date: Dict):
+        self.line = self.fill = None
+        try:
+            date_objects, values = self._series(by_date)
+        except ValueError:
+            print("Formato data non valido per il grafico Andamento."); return
+        self.line, = self.ax.plot(date_objects, values, linewidth=2.5, marker='o', markersize=6, markerfacecolor='white')
+        self.fill = self.ax.fill_between(date_objects, values, alpha=0.1)
+        self.ax.set_title('Andamento Ordini', fontweight='bold')
+        self.ax.grid(True, alpha=0.3)
+        self.fig.autofmt_xdate()
+
+    def _update_artists(self, by_date: Dict) -> bool:
+        if self.line is None or not by_date: return False
+        try:
+            date_objects, values = self._series(by_date)
+        except ValueError:
+            return False
+        self.line.set_data(date_objects, values)
+        # L'area sotto la curva è una PolyCollection: si sostituisce solo lei, non gli assi
+        self.fill.remove()
+        self.fill = self.ax.fill_between(date_objects, values, alpha=0.1, color=self.fill.get_facecolor()[0][:3])
+        self.ax.relim(); self.ax.autoscale_view()
+        return True
+
+class ProductsChart(DashboardChart):
+    def __init__(self, figure, canvas):
+        super().__init__(figure, canvas)
+        self.bars = None
+
+    @staticmethod
+    def _top(top_products: Dict):
+        sorted_products = sorted(top_products.items(), key=lambda item: item[1])[-5:]
+        return [item[0] for item in sorted_products], [item[1] for item in sorted_products]
+
+    def _build(self, top_products: Dict):
+        products, values = self._top(top_products)
+        self.bars = self.ax.barh(products, values, height=0.6)
+        self.ax.set_title('Top 5 Prodotti', fontweight='bold')
+
+    def _update_artists(self, top_products: Dict) -> bool:
+        if self.bars is None or not top_products: return False
+        products, values = self._top(top_products)
+        if len(products) != len(self.bars): return False
+        for bar, value in zip(self.bars, values): bar.set_width(value)
+        self.ax.set_yticks(range(len(products)), products)
+        self.ax.set_xlim(0, max(values) * 1.05 or 1)
+        return True
+
 class ModernDashboard(ttk.Frame):
     def __init__(self, parent):
         super().__init__(parent, style='TFrame')
         self.stats_data = {}
+        self.stats_fingerprint = None
+        self._pending_stats = None
+        self._update_scheduled = False
         self.chart_colors = GiteManiTheme.setup_matplotlib()
         self._create_widgets()
         
@@ -41,7 +188,7 @@ class ModernDashboard(ttk.Frame):
             'avg_order': {'value': tk.StringVar(value="€0.00"), 'trend': tk.StringVar(value="")},
             'pending_orders': {'value': tk.StringVar(value="0"), 'trend': tk.StringVar(value="")},
             'growth': {'value': tk.StringVar(value="+0.0%"), 'trend': tk.StringVar(value="")},
-            'conversion': {'value': tk.StringVar(value="0.0%"), 'trend': tk.StringVar(value="")}
+            'completion': {'value': tk.StringVar(value="0.0%"), 'trend': tk.StringVar(value="")}
         }
         
         kpi_data = [
@@ -50,7 +197,7 @@ class ModernDashboard(ttk.Frame):
             ("Ordine Medio", "avg_order", "🛒", "info"),
             ("In Elaborazione", "pending_orders", "🔄", "warning"),
             ("Crescita Mensile", "growth", "📈", "primary"),
-            ("Tasso Conversione", "conversion", "🎯", "success")
+            ("Tasso Completamento", "completion", "🎯", "success")
         ]
 
         for i, (title, key, icon, color) in enumerate(kpi_data):
@@ -95,56 +242,74 @@ class ModernDashboard(ttk.Frame):
         self.charts_notebook.add(self.products_frame, text="🛒 Prodotti")
         
         self._init_charts()
+        # I grafici nascosti restano "sporchi" e vengono disegnati quando diventano visibili
+        self.charts_notebook.bind("<<NotebookTabChanged>>", lambda event: self._render_visible_chart())
+        self.bind("<Map>", lambda event: self._render_visible_chart())
+        
+    def _create_chart(self, chart_class, frame):
+        figure = Figure(figsize=(5, 4), dpi=100, facecolor=GiteManiTheme.COLORS['card'])
+        canvas = FigureCanvasTkAgg(figure, frame)
+        canvas.get_tk_widget().pack(fill='both', expand=True, padx=10, pady=10)
+        return chart_class(figure, canvas)
         
     def _init_charts(self):
         warnings.filterwarnings('ignore', category=UserWarning, module='matplotlib')
         
-        self.status_fig = Figure(figsize=(5, 4), dpi=100, facecolor=GiteManiTheme.COLORS['card'])
-        self.status_ax = self.status_fig.add_subplot(111)
-        self.status_canvas = FigureCanvasTkAgg(self.status_fig, self.status_frame)
-        self.status_canvas.get_tk_widget().pack(fill='both', expand=True, padx=10, pady=10)
-        
-        self.timeline_fig = Figure(figsize=(5, 4), dpi=100, facecolor=GiteManiTheme.COLORS['card'])
-        self.timeline_ax = self.timeline_fig.add_subplot(111)
-        self.timeline_canvas = FigureCanvasTkAgg(self.timeline_fig, self.timeline_frame)
-        self.timeline_canvas.get_tk_widget().pack(fill='both', expand=True, padx=10, pady=10)
-        
-        self.products_fig = Figure(figsize=(5, 4), dpi=100, facecolor=GiteManiTheme.COLORS['card'])
-        self.products_ax = self.products_fig.add_subplot(111)
-        self.products_canvas = FigureCanvasTkAgg(self.products_fig, self.products_frame)
-        self.products_canvas.get_tk_widget().pack(fill='both', expand=True, padx=10, pady=10)
-        
-        self._update_all_charts({})
+        self.status_chart = self._create_chart(StatusDonutChart, self.status_frame)
+        self.timeline_chart = self._create_chart(TimelineChart, self.timeline_frame)
+        self.products_chart = self._create_chart(ProductsChart, self.products_frame)
+        # Stesso ordine delle schede di charts_notebook
+        self.charts = [self.status_chart, self.timeline_chart, self.products_chart]
+        for chart in self.charts: chart.render(force_rebuild=True)
 
     def update_dashboard(self, stats: Dict):
-        self.stats_data = stats
+        """Raffiche di aggiornamenti ravvicinati diventano un solo aggiornamento dopo dashboard.debounce_ms."""
+        self._pending_stats = stats
+        if self._update_scheduled: return
+        self._update_scheduled = True
+        self.after(config.get('dashboard', 'debounce_ms', 250), self._apply_pending_stats)
+        
+    def _apply_pending_stats(self):
+        self._update_scheduled = False
+        stats, self._pending_stats = self._pending_stats or {}, None
+        fingerprint = stats_fingerprint(stats)
+        if fingerprint == self.stats_fingerprint: return
+        self.stats_data, self.stats_fingerprint = stats, fingerprint
         self._update_kpi(stats)
         self._update_all_charts(stats)
         
+    def get_render_metrics(self) -> Dict[str, float]:
+        """Costo medio (ms) degli ultimi ridisegni di ogni grafico."""
+        names = ['status', 'timeline', 'products']
+        return {name: sum(chart.render_times) / len(chart.render_times) * 1000 for name, chart in zip(names, self.charts) if chart.render_times}
+        
     def _update_kpi(self, stats: Dict):
         total_orders = stats.get('total_orders', 0)
         total_revenue = stats.get('total_revenue', 0)
-        pending_orders = (stats.get('by_status', {}).get('processing', 0) + 
-                          stats.get('by_status', {}).get('pending', 0))
         avg_order = total_revenue / total_orders if total_orders > 0 else 0
+        kpi = stats.get('kpi', {})
+        current = kpi.get('current', {})
+        period = f"vs {kpi.get('period_days', 30)} gg prec."
         
         self.kpi_vars['total_orders']['value'].set(f"{total_orders:,}")
-        self.kpi_vars['total_orders']['trend'].set("▲ +15% vs mese prec.")
+        self.kpi_vars['total_orders']['trend'].set(format_trend(kpi.get('orders_change'), period))
         
         self.kpi_vars['total_revenue']['value'].set(f"€{total_revenue:,.2f}")
-        self.kpi_vars['total_revenue']['trend'].set("▲ +12% vs mese prec.")
+        self.kpi_vars['total_revenue']['trend'].set(format_trend(kpi.get('revenue_change'), period))
 
         self.kpi_vars['avg_order']['value'].set(f"€{avg_order:.2f}")
-        self.kpi_vars['avg_order']['trend'].set("▼ -2% vs mese prec.")
+        self.kpi_vars['avg_order']['trend'].set(format_trend(kpi.get('avg_order_change'), period))
 
+        pending_orders = kpi.get('pending_orders', 0)
         self.kpi_vars['pending_orders']['value'].set(f"{pending_orders}")
-        self.kpi_vars['pending_orders']['trend'].set("Invariato")
+        self.kpi_vars['pending_orders']['trend'].set(f"{pending_orders / total_orders * 100:.0f}% degli ordini" if total_orders else "Nessun ordine")
 
-        self.kpi_vars['growth']['value'].set("+12.5%")
-        self.kpi_vars['growth']['trend'].set("Obiettivo: 15%")
+        growth = kpi.get('revenue_change')
+        self.kpi_vars['growth']['value'].set(f"{growth:+.1f}%" if growth is not None else "n.d.")
+        self.kpi_vars['growth']['trend'].set(f"Obiettivo: {config.get('dashboard', 'growth_target', 15)}%")
         
-        self.kpi_vars['conversion']['value'].set("3.2%")
-        self.kpi_vars['conversion']['trend'].set("▲ +0.5% vs mese prec.")
+        self.kpi_vars['completion']['value'].set(f"{current.get('completion_rate', 0):.1f}%")
+        self.kpi_vars['completion']['trend'].set(format_trend(kpi.get('completion_rate_change'), period, unit=" pt"))
 
         for key, trend_info in self.kpi_vars.items():
             widget = trend_info['trend']._widget
@@ -158,50 +323,12 @@ class ModernDashboard(ttk.Frame):
                     widget.configure(foreground=GiteManiTheme.COLORS['text_secondary'])
 
     def _update_all_charts(self, stats: Dict):
-        self._update_status_donut(stats.get('by_status', {}))
-        self._update_timeline_chart(stats.get('by_date', {}))
-        self._update_products_chart(stats.get('top_products', {}))
-        
-    def _update_status_donut(self, by_status: Dict):
-        self.status_ax.clear()
-        if by_status:
-            labels = list(by_status.keys())
-            sizes = list(by_status.values())
-            wedges, texts, autotexts = self.status_ax.pie(
-                sizes, autopct='%1.1f%%', startangle=90, 
-                wedgeprops=dict(width=0.4, edgecolor=GiteManiTheme.COLORS['card'], linewidth=2),
-                pctdistance=0.8
-            )
-            plt.setp(autotexts, size=8, weight="bold", color="white")
-            self.status_ax.set_title('Distribuzione Stati Ordini', fontweight='bold')
-        self.status_fig.tight_layout()
-        self.status_canvas.draw()
-        
-    def _update_timeline_chart(self, by_date: Dict):
-        self.timeline_ax.clear()
-        if by_date:
-            dates = sorted(by_date.keys())
-            values = [by_date[date] for date in dates]
-            try:
-                date_objects = [datetime.fromisoformat(date.replace('Z', '+00:00')) for date in dates]
-                self.timeline_ax.plot(date_objects, values, linewidth=2.5, marker='o', markersize=6, markerfacecolor='white')
-                self.timeline_ax.fill_between(date_objects, values, alpha=0.1)
-                self.timeline_ax.set_title('Andamento Ordini', fontweight='bold')
-                self.timeline_ax.grid(True, alpha=0.3)
-                self.timeline_fig.autofmt_xdate()
-            except ValueError:
-                print("Formato data non valido per il grafico Andamento.")
-        self.timeline_fig.tight_layout()
-        self.timeline_canvas.draw()
-        
-    def _update_products_chart(self, top_products: Dict):
-        self.products_ax.clear()
-        if top_products:
-            sorted_products = sorted(top_products.items(), key=lambda item: item[1])[-5:]
-            products = [item[0] for item in sorted_products]
-            values = [item[1] for item in sorted_products]
-            
-            self.products_ax.barh(products, values, height=0.6)
-            self.products_ax.set_title('Top 5 Prodotti', fontweight='bold')
-        self.products_fig.tight_layout()
-        self.products_canvas.draw()
+        self.status_chart.set_data(stats.get('by_status', {}))
+        self.timeline_chart.set_data(stats.get('by_date', {}))
+        self.products_chart.set_data(stats.get('top_products', {}))
+        self._render_visible_chart()
+        
+    def _render_visible_chart(self):
+        """Disegna solo il grafico della scheda visibile (e solo se la dashboard è a schermo)."""
+        if not self.winfo_ismapped(): return
+        self.charts[self.charts_notebook.index(self.charts_notebook.select())].render()
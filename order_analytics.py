@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motore statistiche ordini per Gestionale Gitemania
+Carica date, stati, totali e quantità prodotto come array colonnari e calcola gli aggregati con NumPy
+Sviluppato da TechExpresso
+"""
+
+import json
+from operator import itemgetter
+import numpy as np
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+def encode(values: Iterable):
+    """Codifica a dizionario: (valori distinti, codice intero per ogni valore). Evita np.unique su stringhe."""
+    values = values if isinstance(values, list) else list(values)
+    distinct = list(dict.fromkeys(values))
+    index = {value: code for code, value in enumerate(distinct)}
+    return distinct, np.fromiter(map(index.__getitem__, values), dtype=np.int32, count=len(values))
+
+def parse_day(value) -> np.datetime64:
+    """Giorno da una data ISO ('' o valori non validi diventano NaT)."""
+    try: return np.datetime64(value[:10], 'D') if isinstance(value, str) and value else np.datetime64('NaT')
+    except ValueError: return np.datetime64('NaT')
+
+def to_days(values: Iterable) -> np.ndarray:
+    """Array datetime64[D] dalle date ISO: ogni data distinta viene interpretata una volta sola."""
+    distinct, codes = encode(values)
+    return np.array([parse_day(value) for value in distinct], dtype='datetime64[D]')[codes] if distinct else np.array([], dtype='datetime64[D]')
+
+def percent_change(current: float, previous: float) -> Optional[float]:
+    """Variazione percentuale (None se il periodo precedente è vuoto)."""
+    return (current - previous) / previous * 100 if previous else None
+
+def _day_sums(days: np.ndarray, *weights: np.ndarray):
+    """Giorni distinti (ordinati) e somma di ogni colonna di pesi per giorno, con bincount sull'intervallo di date."""
+    if not len(days): return days, [w[:0] for w in weights]
+    numbers = days.astype(np.int64)
+    first = numbers.min()
+    sums = [np.bincount(numbers - first, weights=w) for w in weights]
+    present = np.flatnonzero(np.bincount(numbers - first))
+    return (present + first).astype('datetime64[D]'), [total[present] for total in sums]
+
+class OrderAnalytics:
+    """
+    Statistiche su due insiemi di colonne: righe (giorno, stato, ordini, fatturato) e righe (giorno, prodotto, quantità).
+    Le righe possono essere singoli ordini (orders=1) o aggregati giornalieri già pronti, come stats_daily_status.
+    Stati e prodotti sono codificati come interi: i raggruppamenti sono np.bincount, senza confronti tra stringhe.
+    """
+    COMPLETED_STATUSES = ('completed',)
+    PENDING_STATUSES = ('processing', 'pending')
+
+    def __init__(self, days: np.ndarray, status_names: List[str], status_codes: np.ndarray, orders: np.ndarray, revenue: np.ndarray,
+                 product_days: np.ndarray, product_names: List[str], product_codes: np.ndarray, quantities: np.ndarray):
+        self.days, self.status_names, self.status_codes = days, status_names, status_codes
+        self.orders, self.revenue = orders.astype(np.int64), revenue.astype(np.float64)
+        self.product_days, self.product_names, self.product_codes = product_days, product_names, product_codes
+        self.quantities = quantities.astype(np.int64)
+        self.completed = np.isin(status_codes, [i for i, name in enumerate(status_names) if name in self.COMPLETED_STATUSES])
+
+    @classmethod
+    def from_rollups(cls, status_rows: List[tuple], product_rows: List[tuple]) -> 'OrderAnalytics':
+        """Da righe (giorno, stato, ordini, fatturato) e (giorno, prodotto, quantità), es. le tabelle stats_daily_*."""
+        day, status, orders, revenue = (list(map(itemgetter(i), status_rows)) for i in range(4))
+        product_day, product, quantity = (list(map(itemgetter(i), product_rows)) for i in range(3))
+        status_names, status_codes = encode(status)
+        product_names, product_codes = encode(product)
+        return cls(to_days(day), status_names, status_codes, np.array(orders, dtype=np.int64), np.array(revenue, dtype=np.float64),
+                   to_days(product_day), product_names, product_codes, np.array(quantity, dtype=np.int64))
+
+    @classmethod
+    def from_orders(cls, orders: List[Dict]) -> 'OrderAnalytics':
+        """Da ordini con status, total, date_created e line_items (lista o JSON), es. le righe lette da Supabase."""
+        def as_float(value):
+            try: return float(value or 0)
+            except (TypeError, ValueError): return 0.0
+        status_rows, product_rows = [], []
+        for order in orders:
+            created = order.get('date_created') or ''
+            status_rows.append((created, order.get('status') or '', 1, as_float(order.get('total'))))
+            items = order.get('line_items') or []
+            if isinstance(items, str):
+                try: items = json.loads(items)
+                except ValueError: items = []
+            for item in items:
+                if isinstance(item, dict): product_rows.append((created, item.get('name') or 'Sconosciuto', int(item.get('quantity') or 0)))
+        return cls.from_rollups(status_rows, product_rows)
+
+    @staticmethod
+    def _range(days: np.ndarray, start=None, end=None) -> np.ndarray:
+        """Maschera dei giorni in [start, end] (estremi opzionali; NaT resta fuori se c'è un estremo)."""
+        mask = np.ones(len(days), dtype=bool)
+        if start is not None: mask &= days >= np.datetime64(start, 'D')
+        if end is not None: mask &= days <= np.datetime64(end, 'D')
+        return mask
+
+    def totals(self, start=None, end=None) -> Dict:
+        mask = self._range(self.days, start, end)
+        orders, revenue = int(self.orders[mask].sum()), float(self.revenue[mask].sum())
+        completed = int(self.orders[mask & self.completed].sum())
+        return {'orders': orders, 'revenue': revenue, 'avg_order': revenue / orders if orders else 0.0,
+                'completion_rate': completed / orders * 100 if orders else 0.0}
+
+    def status_distribution(self, start=None, end=None) -> Dict[str, int]:
+        mask = self._range(self.days, start, end)
+        counts = np.bincount(self.status_codes[mask], weights=self.orders[mask], minlength=len(self.status_names))
+        return {name: int(count) for name, count in zip(self.status_names, counts) if count > 0}
+
+    def daily_series(self, start=None, end=None) -> Dict[str, int]:
+        mask = self._range(self.days, start, end) & ~np.isnat(self.days)
+        days, (counts,) = _day_sums(self.days[mask], self.orders[mask])
+        return {str(day): int(count) for day, count in zip(days, counts) if count > 0}
+
+    def weekly_series(self, start=None, end=None) -> Dict[str, Dict]:
+        """Ordini e fatturato per settimana (chiave: lunedì della settimana)."""
+        mask = self._range(self.days, start, end) & ~np.isnat(self.days)
+        days = self.days[mask]
+        # 1970-01-01 era giovedì: (giorni dall'epoca + 3) % 7 è la distanza dal lunedì
+        weeks, (counts, revenue) = _day_sums(days - (days.astype(np.int64) + 3) % 7, self.orders[mask], self.revenue[mask])
+        return {str(week): {'orders': int(count), 'revenue': float(value)} for week, count, value in zip(weeks, counts, revenue) if count > 0}
+
+    def top_products(self, limit: int = 5, start=None, end=None) -> Dict[str, int]:
+        mask = self._range(self.product_days, start, end)
+        quantities = np.bincount(self.product_codes[mask], weights=self.quantities[mask], minlength=len(self.product_names))
+        names = np.array(self.product_names, dtype=object)
+        order = np.lexsort((names, -quantities))[:limit]  # quantità decrescente, a parità per nome
+        return {names[i]: int(quantities[i]) for i in order if quantities[i] > 0}
+
+    def period_comparison(self, period_days: int = 30, today: date = None) -> Dict:
+        """Ultimi period_days giorni (oggi compreso) contro i period_days precedenti."""
+        today = today or date.today()
+        current_start, previous_end = today - timedelta(days=period_days - 1), today - timedelta(days=period_days)
+        current = self.totals(current_start, today)
+        previous = self.totals(previous_end - timedelta(days=period_days - 1), previous_end)
+        return {'period_days': period_days, 'current': current, 'previous': previous,
+                'orders_change': percent_change(current['orders'], previous['orders']),
+                'revenue_change': percent_change(current['revenue'], previous['revenue']),
+                'avg_order_change': percent_change(current['avg_order'], previous['avg_order']),
+                'completion_rate_change': current['completion_rate'] - previous['completion_rate'] if previous['orders'] else None}
+
+    def summary(self, days: int = 0, period_days: int = 30, top_n: int = 5, today: date = None) -> Dict:
+        """
+        Statistiche nel formato di DatabaseManager.get_order_stats (days > 0: dal giorno di N giorni fa),
+        più by_week e i confronti col periodo precedente in 'kpi'.
+        """
+        today = today or date.today()
+        start = today - timedelta(days=days) if days > 0 else None
+        totals = self.totals(start)
+        stats = {'total_orders': totals['orders'], 'total_revenue': totals['revenue'],
+                 'by_status': self.status_distribution(start), 'by_date': self.daily_series(start),
+                 'top_products': self.top_products(top_n, start), 'by_week': self.weekly_series(start),
+                 'kpi': self.period_comparison(period_days, today)}
+        by_status = stats['by_status']
+        stats['kpi']['pending_orders'] = sum(by_status.get(status, 0) for status in self.PENDING_STATUSES)
+        return stats
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Impronta degli ordini per Gestionale Gitemania
+Una sola serializzazione per ordine: colonne JSON salvate e hash di modifica, uguali per SQLite e Supabase
+Sviluppato da TechExpresso
+"""
+
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import blake2b
+
+try:
+    import orjson
+except ImportError:  # dipendenza opzionale: senza orjson si usa json della libreria standard
+    orjson = None
+COMPACT_JSON = orjson is not None  # formato prodotto da dumps (senza spazi dopo ',' e ':')
+
+def dumps(value) -> str:
+    """
+    JSON compatto con orjson se installato, altrimenti json.dumps. Entrambi si rileggono con json.loads;
+    le impronte cambiano tra i due formati, ma il fast path su date_modified evita riscritture in massa.
+    """
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode() if orjson else json.dumps(value)
+
+# Campi che definiscono una modifica: scalari più le righe prodotto e di spedizione (JSON già serializzato)
+FINGERPRINT_FIELDS = ('status', 'total', 'date_modified', 'payment_method')
+FINGERPRINT_SIZE = 16  # 32 caratteri esadecimali, come il vecchio MD5 (stessa colonna hash_signature)
+
+@dataclass
+class EncodedOrder:
+    """Colonne JSON di un ordine WooCommerce e la sua impronta, calcolate con una sola serializzazione."""
+    billing_data: str
+    shipping_data: str
+    line_items: str
+    shipping_lines: str
+    raw_data: str
+    fingerprint: str
+
+def fingerprint(order: dict, line_items_json: str = None, shipping_lines_json: str = None) -> str:
+    """
+    Impronta BLAKE2b dell'ordine. I JSON di line_items e shipping_lines già serializzati per le colonne
+    vengono riusati; gli scalari entrano con repr, così None, '' e 0 restano distinti.
+    """
+    if line_items_json is None: line_items_json = dumps(order.get('line_items', []))
+    if shipping_lines_json is None: shipping_lines_json = dumps(order.get('shipping_lines', []))
+    scalars = '\x1f'.join([repr(order.get(field)) for field in FINGERPRINT_FIELDS])
+    return blake2b(f"{scalars}\x1e{line_items_json}\x1e{shipping_lines_json}".encode(), digest_size=FINGERPRINT_SIZE).hexdigest()
+
+def encode_order(order: dict) -> EncodedOrder:
+    """Serializza una volta le parti JSON dell'ordine e ne ricava l'impronta."""
+    line_items, shipping_lines = dumps(order.get('line_items', [])), dumps(order.get('shipping_lines', []))
+    return EncodedOrder(dumps(order.get('billing', {}) or {}), dumps(order.get('shipping', {}) or {}), line_items, shipping_lines,
+                        dumps(order), fingerprint(order, line_items, shipping_lines))
+
+def same_revision(order: dict, date_modified, status) -> bool:
+    """
+    Fast path prima di serializzare: WooCommerce aggiorna date_modified a ogni modifica dell'ordine,
+    quindi stessa date_modified (e stesso stato, che alcuni plugin cambiano senza toccarla) = ordine invariato.
+    """
+    modified = order.get('date_modified')
+    return modified is not None and modified == date_modified and (order.get('status') or '') == (status or '')
+
+def older_revision(date_modified, stored_date_modified) -> bool:
+    """
+    Copia più vecchia di quella salvata (webhook ritentato o consegnato in ritardo): date_modified strettamente
+    precedente. Date mancanti o non confrontabili non bloccano la scrittura.
+    """
+    if not date_modified or not stored_date_modified: return False
+    try: return datetime.fromisoformat(date_modified) < datetime.fromisoformat(stored_date_modified)
+    except (TypeError, ValueError): return False
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Esecuzione in background delle query per Gestionale Gitemania
+Le query girano su un thread dedicato e i risultati tornano sulla coda dell'interfaccia Tk
+Sviluppato da TechExpresso
+"""
+
+import itertools, queue, threading
+from collections import OrderedDict
+from typing import Callable, Dict
+
+class QueryExecutor:
+    """
+    Thread dedicato alle letture dal database. Ogni richiesta appartiene a un canale (es. "orders_view"):
+    una nuova richiesta sullo stesso canale sostituisce quella ancora in attesa e rende obsoleto
+    il risultato di quella in corso, che non viene consegnato.
+    I risultati arrivano su result_queue come ("query_result", (canale, generazione, callback, risultato)).
+    """
+    def __init__(self, result_queue: queue.Queue):
+        self.result_queue = result_queue
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._latest: Dict[str, int] = {}
+        self._generations = itertools.count(1)
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name='query-executor')
+        self._thread.start()
+
+    def submit(self, channel: str, query: Callable, on_result: Callable) -> int:
+        """Accoda query() sul canale; on_result(risultato) verrà eseguita nel thread Tk. Restituisce la generazione."""
+        with self._condition:
+            generation = next(self._generations)
+            self._latest[channel] = generation
+            self._pending.pop(channel, None)  # la richiesta precedente non ancora partita viene scartata
+            self._pending[channel] = (generation, query, on_result)
+            self._condition.notify()
+            return generation
+
+    def is_current(self, channel: str, generation: int) -> bool:
+        with self._condition:
+            return self._latest.get(channel) == generation
+
+    def deliver(self, channel: str, generation: int, on_result: Callable, result):
+        """Da chiamare nel thread Tk: applica il risultato solo se nessuna richiesta più recente lo ha superato."""
+        if self.is_current(channel, generation): on_result(result)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._pending.clear()
+            self._condition.notify()
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running: return
+                channel, (generation, query, on_result) = self._pending.popitem(last=False)
+            try:
+                result = query()
+            except Exception as e:
+                print(f"❌ Errore query in background ({channel}): {e}"); continue
+            if self.is_current(channel, generation):
+                self.result_queue.put(("query_result", (channel, generation, on_result, result)))
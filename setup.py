@@ -19,7 +19,7 @@ HIDDEN_IMPORTS = [
     'tkinter', 'tkinter.ttk', 'tkinter.messagebox', 'tkinter.filedialog',
     'PIL', 'PIL._tkinter_finder', 'woocommerce', 'cryptography', 'matplotlib',
     'matplotlib.backends.backend_tkagg', 'pandas', 'openpyxl', 'docx',
-    'flask', 'schedule', 'apscheduler', 'qrcode', 'sqlite3', 'json',
+    'flask', 'apscheduler', 'qrcode', 'sqlite3', 'json',
     'threading', 'datetime', 'requests', 'urllib3', 'certifi',
     'charset_normalizer', 'idna', 'ttkthemes', 'ttkbootstrap',
 ]
@@ -6,15 +6,148 @@ Gestisce database e sincronizzazione dati
 Sviluppato da TechExpresso
 """
 
+import os
+import gzip
 import json
-import hashlib
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from supabase import create_client, Client
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.pool
 import threading
 from config import config
+from database_manager import SyncResult
+from order_analytics import OrderAnalytics
+from order_fingerprint import fingerprint, same_revision
+
+SUPABASE_TABLES_SQL = {
+    # orders.id era BIGINT senza default: gli insert (che non passano id) fallivano. Le tabelle già create
+    # vengono allineate da SUPABASE_MIGRATIONS_SQL.
+    'orders': '''
+        CREATE TABLE IF NOT EXISTS orders (
+            id BIGSERIAL PRIMARY KEY,
+            woo_id BIGINT UNIQUE NOT NULL,
+            order_number VARCHAR(50),
+            status VARCHAR(50),
+            currency VARCHAR(10),
+            total DECIMAL(10,2),
+            total_tax DECIMAL(10,2),
+            shipping_total DECIMAL(10,2),
+            customer_id BIGINT,
+            customer_email VARCHAR(255),
+            customer_name VARCHAR(255),
+            billing_data JSONB,
+            shipping_data JSONB,
+            line_items JSONB,
+            shipping_lines JSONB,
+            payment_method VARCHAR(100),
+            payment_method_title VARCHAR(255),
+            date_created TIMESTAMP,
+            date_modified TIMESTAMP,
+            date_completed TIMESTAMP,
+            raw_data JSONB,
+            hash_signature VARCHAR(64),
+            sync_status VARCHAR(20) DEFAULT 'synced',
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    ''',
+    'customers': '''
+        CREATE TABLE IF NOT EXISTS customers (
+            id BIGSERIAL PRIMARY KEY,
+            woo_id BIGINT UNIQUE,
+            email VARCHAR(255),  -- non univoca: clienti WooCommerce diversi possono condividere l'email (upsert su woo_id)
+            first_name VARCHAR(255),
+            last_name VARCHAR(255),
+            phone VARCHAR(50),
+            total_orders INTEGER DEFAULT 0,
+            total_spent DECIMAL(10,2) DEFAULT 0,
+            last_order_date TIMESTAMP,
+            billing_data JSONB,
+            shipping_data JSONB,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    ''',
+    'products': '''
+        CREATE TABLE IF NOT EXISTS products (
+            id BIGSERIAL PRIMARY KEY,
+            woo_id BIGINT UNIQUE,
+            sku VARCHAR(100),
+            name VARCHAR(500),
+            price DECIMAL(10,2),
+            regular_price DECIMAL(10,2),
+            sale_price DECIMAL(10,2),
+            stock_quantity INTEGER,
+            manage_stock BOOLEAN DEFAULT FALSE,
+            in_stock BOOLEAN DEFAULT TRUE,
+            categories JSONB,
+            images JSONB,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    ''',
+    'export_logs': '''
+        CREATE TABLE IF NOT EXISTS export_logs (
+            id BIGSERIAL PRIMARY KEY,
+            export_type VARCHAR(20),
+            file_name VARCHAR(255),
+            file_path VARCHAR(500),
+            total_records INTEGER,
+            date_from DATE,
+            date_to DATE,
+            status VARCHAR(20),
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+    '''
+}
+
+# Migrazioni idempotenti per gli schemi creati con versioni precedenti di SUPABASE_TABLES_SQL
+SUPABASE_MIGRATIONS_SQL = [
+    # orders.id BIGINT -> default da sequenza (equivalente a BIGSERIAL), ripartendo dopo l'id massimo esistente
+    '''
+        CREATE SEQUENCE IF NOT EXISTS orders_id_seq OWNED BY orders.id;
+        SELECT setval('orders_id_seq', COALESCE((SELECT MAX(id) FROM orders), 0) + 1, false);
+        ALTER TABLE orders ALTER COLUMN id SET DEFAULT nextval('orders_id_seq');
+    ''',
+    # customers.email UNIQUE: due customer_id con la stessa email facevano fallire l'upsert su woo_id (23505)
+    '''
+        ALTER TABLE customers DROP CONSTRAINT IF EXISTS customers_email_key;
+        CREATE INDEX IF NOT EXISTS idx_customers_email ON customers(email);
+    ''',
+]
+
+# Tabelle copiate da backup_data, nell'ordine in cui compaiono nel file
+BACKUP_TABLES = ['orders', 'customers', 'export_logs']
+
+def copy_text_value(value) -> str:
+    """Valore nel formato testo di COPY: NULL come \\N, dizionari e liste come JSON, caratteri speciali con escape."""
+    if value is None: return '\\N'
+    if isinstance(value, bool): return 't' if value else 'f'
+    if isinstance(value, (dict, list)): value = json.dumps(value, ensure_ascii=False, default=str)
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+class CopyStream:
+    """File di sola lettura per copy_expert: genera le righe COPY un blocco alla volta, senza costruire il testo intero in memoria."""
+    
+    def __init__(self, records: List[dict], columns: List[str]):
+        self._lines = ('\t'.join(copy_text_value(record.get(column)) for column in columns) + '\n' for record in records)
+        self._buffer = ''
+        
+    def read(self, size: int = -1) -> str:
+        parts, length = [self._buffer], len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None: break
+            parts.append(line); length += len(line)
+        data = ''.join(parts)
+        if size < 0: size = len(data)
+        self._buffer = data[size:]
+        return data[:size]
+        
+    readline = read
 
 class SupabaseManager:
     """Gestione database Supabase per sincronizzazione ordini"""
@@ -24,6 +157,7 @@ class SupabaseManager:
         self.connected = False
         self.last_backup = None
         self.lock = threading.Lock()
+        self.pg_pool = None
         
     def initialize(self, url: str, key: str) -> bool:
         """Inizializza connessione Supabase"""
@@ -48,88 +182,7 @@ class SupabaseManager:
             
     def _ensure_tables(self):
         """Verifica e crea tabelle necessarie"""
-        tables_sql = {
-            'orders': '''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id BIGINT PRIMARY KEY,
-                    woo_id BIGINT UNIQUE NOT NULL,
-                    order_number VARCHAR(50),
-                    status VARCHAR(50),
-                    currency VARCHAR(10),
-                    total DECIMAL(10,2),
-                    total_tax DECIMAL(10,2),
-                    shipping_total DECIMAL(10,2),
-                    customer_id BIGINT,
-                    customer_email VARCHAR(255),
-                    customer_name VARCHAR(255),
-                    billing_data JSONB,
-                    shipping_data JSONB,
-                    line_items JSONB,
-                    shipping_lines JSONB,
-                    payment_method VARCHAR(100),
-                    payment_method_title VARCHAR(255),
-                    date_created TIMESTAMP,
-                    date_modified TIMESTAMP,
-                    date_completed TIMESTAMP,
-                    raw_data JSONB,
-                    hash_signature VARCHAR(64),
-                    sync_status VARCHAR(20) DEFAULT 'synced',
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            ''',
-            'customers': '''
-                CREATE TABLE IF NOT EXISTS customers (
-                    id BIGSERIAL PRIMARY KEY,
-                    woo_id BIGINT UNIQUE,
-                    email VARCHAR(255) UNIQUE,
-                    first_name VARCHAR(255),
-                    last_name VARCHAR(255),
-                    phone VARCHAR(50),
-                    total_orders INTEGER DEFAULT 0,
-                    total_spent DECIMAL(10,2) DEFAULT 0,
-                    last_order_date TIMESTAMP,
-                    billing_data JSONB,
-                    shipping_data JSONB,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            ''',
-            'products': '''
-                CREATE TABLE IF NOT EXISTS products (
-                    id BIGSERIAL PRIMARY KEY,
-                    woo_id BIGINT UNIQUE,
-                    sku VARCHAR(100),
-                    name VARCHAR(500),
-                    price DECIMAL(10,2),
-                    regular_price DECIMAL(10,2),
-                    sale_price DECIMAL(10,2),
-                    stock_quantity INTEGER,
-                    manage_stock BOOLEAN DEFAULT FALSE,
-                    in_stock BOOLEAN DEFAULT TRUE,
-                    categories JSONB,
-                    images JSONB,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    updated_at TIMESTAMP DEFAULT NOW()
-                );
-            ''',
-            'export_logs': '''
-                CREATE TABLE IF NOT EXISTS export_logs (
-                    id BIGSERIAL PRIMARY KEY,
-                    export_type VARCHAR(20),
-                    file_name VARCHAR(255),
-                    file_path VARCHAR(500),
-                    total_records INTEGER,
-                    date_from DATE,
-                    date_to DATE,
-                    status VARCHAR(20),
-                    error_message TEXT,
-                    created_at TIMESTAMP DEFAULT NOW()
-                );
-            '''
-        }
-        
-        for table_name, sql in tables_sql.items():
+        for table_name, sql in SUPABASE_TABLES_SQL.items():
             try:
                 # Note: In a real implementation, you'd use proper migrations
                 # For now, we'll just log the table creation intent
@@ -175,21 +228,68 @@ class SupabaseManager:
                 print(f"❌ Errore sincronizzazione ordine {order_data.get('id', 'N/A')}: {e}")
                 return False
                 
-    def _calculate_order_hash(self, order_data: dict) -> str:
-        """Calcola hash MD5 dell'ordine per rilevare modifiche"""
-        # Campi significativi per il confronto
-        significant_fields = [
-            'status', 'total', 'date_modified', 'line_items',
-            'shipping_lines', 'payment_method'
-        ]
+    def sync_multiple_orders(self, orders_data: List[dict], raise_errors: bool = False) -> SyncResult:
+        """
+        Sincronizza un batch di ordini a blocchi di supabase.sync_chunk_size: per blocco una select degli hash
+        (filtro in_ sui woo_id), un upsert degli ordini nuovi o modificati e un upsert dei loro clienti.
+        Restituisce (inseriti, aggiornati) con i woo_id toccati, come DatabaseManager.sync_multiple_orders.
+        Con raise_errors il primo blocco fallito interrompe il batch con la sua eccezione (es. per il replicatore).
+        """
+        if not self.connected:
+            return SyncResult()
+            
+        chunk_size = config.get('supabase', 'sync_chunk_size', 500)
+        inserted, updated = [], []
+        with self.lock:
+            for start in range(0, len(orders_data), chunk_size):
+                try:
+                    chunk_inserted, chunk_updated = self._sync_orders_chunk(orders_data[start:start + chunk_size])
+                    inserted.extend(chunk_inserted); updated.extend(chunk_updated)
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    # I blocchi sono indipendenti: quelli falliti vengono ritentati alla prossima sincronizzazione
+                    print(f"❌ Errore sincronizzazione blocco ordini {start + 1}-{start + chunk_size}: {e}")
+        if inserted or updated:
+            print(f"✅ Supabase: {len(inserted)} ordini inseriti, {len(updated)} aggiornati")
+        return SyncResult(inserted, updated)
+        
+    def _sync_orders_chunk(self, orders_data: List[dict]):
+        """Un blocco di sync_multiple_orders: tre richieste al massimo, qualunque sia il numero di ordini"""
+        # Per ordini ripetuti nel blocco vale l'ultima versione
+        latest = {order['id']: order for order in orders_data if order.get('id') is not None}
+        if not latest:
+            return [], []
+        existing = self.client.table('orders').select('woo_id', 'hash_signature', 'date_modified', 'status').in_('woo_id', list(latest)).execute()
+        existing_rows = {row['woo_id']: row for row in existing.data or []}
         
-        hash_data = {}
-        for field in significant_fields:
-            if field in order_data:
-                hash_data[field] = order_data[field]
+        records, inserted, updated, customers = [], [], [], {}
+        now = datetime.now().isoformat()
+        for woo_id, order in latest.items():
+            stored = existing_rows.get(woo_id)
+            # Stessa revisione WooCommerce: l'impronta non viene neppure calcolata
+            if stored and same_revision(order, stored.get('date_modified'), stored.get('status')):
+                continue
+            order_hash = self._calculate_order_hash(order)
+            if stored and stored.get('hash_signature') == order_hash:
+                continue
+            order_record = self._extract_order_data(order, order_hash)
+            order_record['updated_at'] = now
+            records.append(order_record)
+            (updated if stored else inserted).append(woo_id)
+            customer_record = self._extract_customer_data(order)
+            if customer_record:
+                customers[customer_record['woo_id']] = customer_record  # un record per cliente: vince l'ordine più recente del blocco
                 
-        hash_string = json.dumps(hash_data, sort_keys=True, default=str)
-        return hashlib.md5(hash_string.encode()).hexdigest()
+        if records:
+            self.client.table('orders').upsert(records, on_conflict='woo_id').execute()
+        if customers:
+            self.client.table('customers').upsert(list(customers.values()), on_conflict='woo_id').execute()
+        return inserted, updated
+        
+    def _calculate_order_hash(self, order_data: dict) -> str:
+        """Impronta dell'ordine per rilevare modifiche (la stessa del database locale, vedi order_fingerprint)"""
+        return fingerprint(order_data)
         
     def _extract_order_data(self, order_data: dict, order_hash: str) -> dict:
         """Estrae dati ordine per database"""
@@ -220,26 +320,34 @@ class SupabaseManager:
             'hash_signature': order_hash
         }
         
+    def _extract_customer_data(self, order_data: dict) -> Optional[dict]:
+        """Record cliente dai dati di fatturazione dell'ordine (None senza customer_id o email)"""
+        billing = order_data.get('billing', {})
+        customer_id = order_data.get('customer_id')
+        
+        if not customer_id or not billing.get('email'):
+            return None
+            
+        return {
+            'woo_id': customer_id,
+            'email': billing.get('email'),
+            'first_name': billing.get('first_name', ''),
+            'last_name': billing.get('last_name', ''),
+            'phone': billing.get('phone', ''),
+            'billing_data': billing,
+            'shipping_data': order_data.get('shipping', {}),
+            'updated_at': datetime.now().isoformat()
+        }
+        
     def _sync_customer_from_order(self, order_data: dict):
         """Sincronizza dati cliente dall'ordine"""
         try:
-            billing = order_data.get('billing', {})
-            customer_id = order_data.get('customer_id')
+            customer_record = self._extract_customer_data(order_data)
             
-            if not customer_id or not billing.get('email'):
+            if not customer_record:
                 return
+            customer_id = customer_record['woo_id']
                 
-            customer_record = {
-                'woo_id': customer_id,
-                'email': billing.get('email'),
-                'first_name': billing.get('first_name', ''),
-                'last_name': billing.get('last_name', ''),
-                'phone': billing.get('phone', ''),
-                'billing_data': billing,
-                'shipping_data': order_data.get('shipping', {}),
-                'updated_at': datetime.now().isoformat()
-            }
-            
             # Upsert cliente
             existing = self.client.table('customers').select('id').eq('woo_id', customer_id).execute()
             
@@ -251,6 +359,105 @@ class SupabaseManager:
         except Exception as e:
             print(f"❌ Errore sincronizzazione cliente: {e}")
             
+    def connect_postgres(self, dsn: str = None) -> bool:
+        """Connessione Postgres diretta opzionale (dsn o supabase.postgres_dsn cifrato in configurazione), con pool di connessioni"""
+        dsn = dsn or config.get_encrypted('supabase', 'postgres_dsn')
+        if not dsn:
+            return False
+            
+        try:
+            self.pg_pool = psycopg2.pool.ThreadedConnectionPool(1, config.get('supabase', 'postgres_pool_size', 4), dsn)
+            with self._pg_connection() as conn, conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            print("✅ Connessione Postgres diretta stabilita")
+            self.apply_schema_migrations()
+            return True
+            
+        except Exception as e:
+            print(f"❌ Errore connessione Postgres diretta: {e}")
+            self.close_postgres()
+            return False
+            
+    def apply_schema_migrations(self) -> bool:
+        """Applica SUPABASE_MIGRATIONS_SQL sulla connessione diretta (serve il proprietario delle tabelle)"""
+        try:
+            with self._pg_connection() as conn, conn.cursor() as cursor:
+                for sql in SUPABASE_MIGRATIONS_SQL:
+                    cursor.execute(sql)
+            return True
+            
+        except Exception as e:
+            print(f"⚠️ Migrazione schema Supabase non applicata: {e}")
+            return False
+            
+    def close_postgres(self):
+        """Chiude tutte le connessioni del pool Postgres"""
+        if self.pg_pool:
+            self.pg_pool.closeall()
+            self.pg_pool = None
+            
+    @contextmanager
+    def _pg_connection(self):
+        """Connessione presa dal pool: commit all'uscita, rollback in caso di errore"""
+        conn = self.pg_pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pg_pool.putconn(conn)
+            
+    def bulk_import_orders(self, orders_data: List[dict], raise_errors: bool = False) -> SyncResult:
+        """
+        Import massivo sulla connessione Postgres diretta: COPY degli ordini in una tabella temporanea e merge
+        su woo_id nella stessa transazione (gli ordini con hash invariato non vengono riscritti), poi i loro clienti.
+        Restituisce (inseriti, aggiornati) come sync_multiple_orders; con raise_errors propaga l'errore.
+        """
+        if not self.pg_pool:
+            return SyncResult()
+            
+        latest = {order['id']: order for order in orders_data if order.get('id') is not None}
+        if not latest:
+            return SyncResult()
+        records = [self._extract_order_data(order, self._calculate_order_hash(order)) for order in latest.values()]
+        
+        try:
+            with self._pg_connection() as conn, conn.cursor() as cursor:
+                written = self._copy_merge(cursor, 'orders', records, changed_column='hash_signature')
+                customers = {}
+                for woo_id, _ in written:
+                    customer_record = self._extract_customer_data(latest[woo_id])
+                    if customer_record:
+                        customers[customer_record['woo_id']] = customer_record
+                if customers:
+                    self._copy_merge(cursor, 'customers', list(customers.values()))
+                    
+            result = SyncResult([woo_id for woo_id, inserted in written if inserted], [woo_id for woo_id, inserted in written if not inserted])
+            print(f"✅ Import Postgres: {result[0]} ordini inseriti, {result[1]} aggiornati")
+            return result
+            
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"❌ Errore import massivo Postgres: {e}")
+            return SyncResult()
+            
+    def _copy_merge(self, cursor, table: str, records: List[dict], changed_column: str = None) -> List[tuple]:
+        """COPY dei record in una tabella temporanea e INSERT ... ON CONFLICT (woo_id); restituisce (woo_id, inserito) delle righe scritte"""
+        columns = list(records[0])
+        column_list = ', '.join(columns)
+        staging = f"{table}_staging"
+        cursor.execute(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA")
+        cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN", CopyStream(records, columns))
+        assignments = ', '.join(f"{column} = EXCLUDED.{column}" for column in columns if column not in ('woo_id', 'updated_at'))
+        condition = f" WHERE {table}.{changed_column} IS DISTINCT FROM EXCLUDED.{changed_column}" if changed_column else ""
+        # xmax = 0 solo per le righe appena inserite
+        cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} "
+                       f"ON CONFLICT (woo_id) DO UPDATE SET {assignments}, updated_at = NOW(){condition} RETURNING woo_id, xmax = 0")
+        return cursor.fetchall()
+        
     def get_orders(self, filters: dict = None, limit: int = 100) -> List[dict]:
         """Recupera ordini dal database"""
         if not self.connected:
@@ -277,37 +484,20 @@ class SupabaseManager:
             return []
             
     def get_order_stats(self, days: int = 30) -> dict:
-        """Recupera statistiche ordini dal database"""
+        """Recupera statistiche ordini dal database (ultimi N giorni, confrontati con gli N precedenti)"""
         if not self.connected:
             return {}
             
         try:
-            date_from = (datetime.now() - timedelta(days=days)).isoformat()
+            date_from = (datetime.now() - timedelta(days=days * 2)).isoformat()
             
-            result = self.client.table('orders').select('status, total, date_created').gte('date_created', date_from).execute()
+            result = self.client.table('orders').select('status, total, date_created, line_items').gte('date_created', date_from).execute()
             
             if not result.data:
                 return {}
                 
-            orders = result.data
-            
-            stats = {
-                'total_orders': len(orders),
-                'total_revenue': sum(float(order['total']) for order in orders),
-                'by_status': {},
-                'by_date': {},
-                'period_days': days
-            }
-            
-            for order in orders:
-                # Per stato
-                status = order['status']
-                stats['by_status'][status] = stats['by_status'].get(status, 0) + 1
-                
-                # Per data
-                date_created = order['date_created'][:10]
-                stats['by_date'][date_created] = stats['by_date'].get(date_created, 0) + 1
-                
+            stats = OrderAnalytics.from_orders(result.data).summary(days, period_days=days)
+            stats['period_days'] = days
             return stats
             
         except Exception as e:
@@ -315,40 +505,78 @@ class SupabaseManager:
             return {}
             
     def backup_data(self, backup_path: str = None) -> bool:
-        """Effettua backup dati"""
-        if not self.connected:
+        """
+        Effettua backup dati in streaming: cursore lato server sulla connessione Postgres diretta se presente,
+        altrimenti PostgREST a pagine (keyset su id). Le righe vengono scritte man mano; percorso .gz = file compresso.
+        """
+        if not self.connected and not self.pg_pool:
             return False
             
         try:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             
             if not backup_path:
-                backup_path = f"backup_gitemania_{timestamp}.json"
+                backup_path = f"backup_gitemania_{timestamp}.json.gz"
                 
-            # Recupera tutti i dati
-            orders = self.client.table('orders').select('*').execute()
-            customers = self.client.table('customers').select('*').execute()
-            export_logs = self.client.table('export_logs').select('*').execute()
-            
-            backup_data = {
-                'timestamp': timestamp,
-                'version': '1.0.0',
-                'orders': orders.data if orders.data else [],
-                'customers': customers.data if customers.data else [],
-                'export_logs': export_logs.data if export_logs.data else []
-            }
-            
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, indent=2, ensure_ascii=False, default=str)
+            if self.pg_pool:
+                with self._pg_connection() as conn:
+                    # Stessa istantanea per tutte le tabelle
+                    with conn.cursor() as cursor:
+                        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+                    counts = self._write_backup(backup_path, timestamp, lambda table: self._iter_table_postgres(conn, table))
+            else:
+                counts = self._write_backup(backup_path, timestamp, self._iter_table_rest)
                 
             self.last_backup = datetime.now()
-            print(f"💾 Backup completato: {backup_path}")
+            print(f"💾 Backup completato: {backup_path} ({', '.join(f'{table}: {count}' for table, count in counts.items())})")
             return True
             
         except Exception as e:
             print(f"❌ Errore backup: {e}")
             return False
             
+    def _write_backup(self, backup_path: str, timestamp: str, iter_table) -> Dict[str, int]:
+        """Scrive il JSON del backup riga per riga (iter_table(tabella) produce righe JSON) e lo rende visibile solo a fine scrittura"""
+        part_path = backup_path + '.part'
+        opener = gzip.open if backup_path.endswith('.gz') else open
+        counts = {}
+        with opener(part_path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'timestamp': timestamp, 'version': '1.0.0'})[:-1])
+            for table in BACKUP_TABLES:
+                f.write(f', "{table}": [')
+                count = 0
+                for row in iter_table(table):
+                    f.write(('\n' if not count else ',\n') + row)
+                    count += 1
+                f.write(']')
+                counts[table] = count
+            f.write('}\n')
+        os.replace(part_path, backup_path)
+        return counts
+        
+    def _iter_table_postgres(self, conn, table: str):
+        """Righe JSON di una tabella da un cursore lato server (itersize righe per viaggio)"""
+        with conn.cursor(name=f"backup_{table}") as cursor:
+            cursor.itersize = config.get('supabase', 'backup_page_size', 1000)
+            cursor.execute(f"SELECT row_to_json(t)::text FROM {table} t ORDER BY id")
+            for (row,) in cursor:
+                yield row
+                
+    def _iter_table_rest(self, table: str):
+        """Righe JSON di una tabella via PostgREST, a pagine ordinate per id (entro il limite di righe dell'API)"""
+        page_size = config.get('supabase', 'backup_page_size', 1000)
+        last_id = None
+        while True:
+            query = self.client.table(table).select('*').order('id').limit(page_size)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.execute().data or []
+            for row in rows:
+                yield json.dumps(row, ensure_ascii=False, default=str)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]['id']
+            
     def log_export(self, export_type: str, file_name: str, file_path: str, 
                    total_records: int, date_from: str = None, date_to: str = None,
                    status: str = 'success', error_message: str = None) -> bool:
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Replica write-behind verso Supabase per Gestionale Gitemania
+Svuota in background la coda replication_outbox del database locale, a blocchi e con ritentativi
+Sviluppato da TechExpresso
+"""
+
+import json, threading
+from typing import Callable, Dict, Optional
+from config import config
+
+class SupabaseReplicator:
+    """
+    Invia a Supabase gli ordini accodati da DatabaseManager.sync_multiple_orders. La coda è su SQLite:
+    sopravvive a riavvii e cadute di rete, e contiene solo gli ordini cambiati (una voce per ordine).
+    Una voce confermata viene rimossa solo se l'ordine non è cambiato nel frattempo; gli upsert sono
+    idempotenti (Supabase salta gli ordini con lo stesso hash), quindi ripetere un blocco non ha effetti.
+    Con supabase.direct_postgres la coda (compreso l'import completo della prima attivazione) passa dalla
+    connessione Postgres diretta: COPY e merge a blocchi di supabase.bulk_import_batch_size.
+    on_status(stato) riceve profondità della coda, ritardo e stato della connessione dopo ogni giro.
+    """
+    def __init__(self, database_manager, supabase_manager, connect: Callable[[], bool] = None, on_status: Callable[[Dict], None] = None):
+        self.database_manager = database_manager
+        self.supabase_manager = supabase_manager
+        self.connect = connect
+        self.on_status = on_status
+        self.batch_size = config.get('supabase', 'replication_batch_size', 200)
+        self.bulk_batch_size = config.get('supabase', 'bulk_import_batch_size', 5000)
+        self.interval = config.get('supabase', 'replication_interval', 30)
+        self.retry_base = config.get('supabase', 'replication_retry_base', 5)
+        self.retry_max = config.get('supabase', 'replication_retry_max', 600)
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Attiva l'accodamento nel database locale e avvia il thread di replica."""
+        self.database_manager.replication_enabled = True
+        if config.get('supabase', 'direct_postgres', False): self.supabase_manager.connect_postgres()
+        seeded = self.database_manager.seed_replication_outbox()
+        if seeded: print(f"☁️ Replica Supabase attivata: {seeded} ordini esistenti in coda")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='supabase-replicator')
+        self._thread.start()
+
+    def schedule(self):
+        """Da chiamare dopo una sincronizzazione locale: svuota la coda subito invece che al prossimo intervallo."""
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set(); self._wake.set()
+        if self._thread: self._thread.join(timeout=10)
+        self.supabase_manager.close_postgres()
+
+    def status(self) -> Dict:
+        depth, lag = self.database_manager.get_replication_status()
+        return {'depth': depth, 'lag': lag, 'online': (self.supabase_manager.connected or bool(self.supabase_manager.pg_pool)) and not self.failures, 'last_error': self.last_error}
+
+    def drain_once(self) -> int:
+        """Un blocco dalla coda: restituisce gli ordini replicati (0 se la coda è vuota o in attesa di ritentativo, -1 se fallito)."""
+        direct = bool(self.supabase_manager.pg_pool)
+        batch = self.database_manager.get_replication_batch(self.bulk_batch_size if direct else self.batch_size)
+        if not batch: return 0
+        if not direct and not self.supabase_manager.connected and not (self.connect and self.connect()):
+            # Offline: le voci restano in coda senza consumare tentativi
+            self.last_error = "Supabase non raggiungibile"
+            return -1
+        try:
+            push = self.supabase_manager.bulk_import_orders if direct else self.supabase_manager.sync_multiple_orders
+            push([json.loads(payload) for _, _, payload in batch], raise_errors=True)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ Errore replica Supabase ({len(batch)} ordini, ritento più tardi): {e}")
+            self.database_manager.defer_replication([woo_id for woo_id, _, _ in batch], self.retry_base, self.retry_max)
+            return -1
+        self.database_manager.ack_replication([(woo_id, hash_signature) for woo_id, hash_signature, _ in batch])
+        self.last_error = None
+        return len(batch)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                replicated = self.drain_once()
+            except Exception as e:
+                print(f"❌ Errore nel replicatore Supabase: {e}"); replicated = -1
+            self.failures = self.failures + 1 if replicated < 0 else 0
+            if self.on_status:
+                try: self.on_status(self.status())
+                except Exception as e: print(f"❌ Errore stato replica: {e}")
+            if replicated > 0: continue  # altri blocchi in coda: nessuna attesa
+            if self.failures:
+                # Backoff globale: una rete assente non viene interrogata a ogni modifica locale
+                self._stop_event.wait(min(self.retry_max, self.retry_base * 2 ** min(self.failures - 1, 20)))
+            else:
+                self._wake.wait(self.interval)
+            self._wake.clear()
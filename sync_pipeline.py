@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline di sincronizzazione completa per Gestionale Gitemania
+Download, preparazione degli ordini, scrittura su SQLite e notifiche all'interfaccia in stadi paralleli
+Sviluppato da TechExpresso
+"""
+
+import itertools, os, queue, threading, time
+from typing import Callable, Dict, List
+from config import config
+from database_manager import SyncResult
+
+_STOP = object()  # segnale di fine per gli stadi a valle
+
+class StageStats:
+    """Ordini elaborati e secondi di lavoro effettivo (attese sulle code escluse) di uno stadio."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.orders = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, orders: int, seconds: float):
+        with self.lock:
+            self.orders += orders; self.busy += seconds
+
+    @property
+    def rate(self) -> float:
+        """Ordini al secondo di lavoro: lo stadio più lento è il collo di bottiglia."""
+        return self.orders / self.busy if self.busy else 0.0
+
+class SyncPipeline:
+    """
+    Stadi collegati da code limitate: fetch (il chiamante, via submit) → preparazione su un pool di thread
+    (DatabaseManager.prepare_orders: serializzazione, impronte, compressione) → un solo writer che accorpa
+    le pagine pronte in transazioni da write_batch ordini, nell'ordine di download → notifiche (on_progress, on_changed).
+    Se uno stadio è indietro le code si riempiono e gli stadi a monte attendono: il download rallenta invece
+    di accumulare pagine in memoria. Il pool è di thread e non di processi: spedire una pagina a un altro
+    processo costa quanto prepararla, mentre zlib, BLAKE2b e le scritture SQLite rilasciano il GIL.
+    """
+    def __init__(self, database_manager, on_progress: Callable[[int], None] = None, on_changed: Callable[[List[int]], None] = None,
+                 workers: int = None, queue_pages: int = None, write_batch: int = None):
+        self.database_manager = database_manager
+        self.on_progress = on_progress
+        self.on_changed = on_changed
+        self.workers = max(1, workers or config.get('app', 'sync_transform_workers', 0) or min(4, os.cpu_count() or 1))
+        self.write_batch = write_batch or config.get('app', 'sync_write_batch', 1000)
+        queue_pages = queue_pages or config.get('app', 'sync_pipeline_queue', 4)
+        self.transform_queue = queue.Queue(maxsize=queue_pages)
+        self.write_queue = queue.Queue(maxsize=queue_pages)
+        self.notify_queue = queue.Queue(maxsize=queue_pages)
+        self.stats = {name: StageStats(name) for name in ('fetch', 'transform', 'write', 'notify')}
+        self.inserted_ids, self.updated_ids = [], []
+        self.error = None
+        self.failed_stage = None  # stadio del primo errore ('transform', 'write')
+        self._stop = threading.Event()
+        self._threads, self._writer, self._notifier = [], None, None
+        self._sequence = itertools.count()  # numero d'ordine delle pagine inviate
+        self._started_at = self._last_submit = None
+
+    def start(self):
+        self._started_at = self._last_submit = time.perf_counter()
+        self._threads = [threading.Thread(target=self._transform_loop, daemon=True, name=f'sync-transform-{i}') for i in range(self.workers)]
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name='sync-writer')
+        self._notifier = threading.Thread(target=self._notify_loop, daemon=True, name='sync-notify')
+        for thread in self._threads + [self._writer, self._notifier]: thread.start()
+        return self
+
+    def submit(self, orders_page: List[dict]):
+        """Stadio fetch: da usare come page_callback di get_orders_paged. Attende se la preparazione è indietro."""
+        if self.error: raise self.error  # interrompe il download
+        now = time.perf_counter()
+        self.stats['fetch'].add(len(orders_page), now - self._last_submit)
+        self._put(self.transform_queue, (next(self._sequence), orders_page))
+        self._last_submit = time.perf_counter()
+
+    def finish(self) -> SyncResult:
+        """Attende che tutte le pagine inviate siano scritte e notificate; solleva l'errore del primo stadio fallito."""
+        for _ in self._threads: self._put(self.transform_queue, _STOP)
+        for thread in self._threads: thread.join()
+        self._put(self.write_queue, _STOP); self._writer.join()
+        self._put(self.notify_queue, _STOP); self._notifier.join()
+        print(f"📊 Pipeline di sincronizzazione: {self.format_report()}")
+        if self.error: raise self.error
+        return SyncResult(self.inserted_ids, self.updated_ids)
+
+    def abort(self):
+        """Ferma tutti gli stadi senza attendere le pagine in coda."""
+        self._stop.set()
+
+    def report(self) -> Dict[str, dict]:
+        """Per stadio: ordini, secondi di lavoro e ordini/s; 'total' è il tempo reale dall'avvio."""
+        report = {name: {'orders': stage.orders, 'seconds': stage.busy, 'orders_per_sec': stage.rate} for name, stage in self.stats.items()}
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        written = self.stats['write'].orders
+        report['total'] = {'orders': written, 'seconds': elapsed, 'orders_per_sec': written / elapsed if elapsed else 0.0}
+        return report
+
+    def format_report(self) -> str:
+        return ', '.join(f"{name} {values['orders_per_sec']:,.0f} ordini/s" for name, values in self.report().items())
+
+    def _put(self, target: queue.Queue, item):
+        # Backpressure: attesa finché lo stadio a valle non libera posto (o la pipeline viene fermata)
+        while not self._stop.is_set():
+            try: target.put(item, timeout=0.2); return
+            except queue.Full: continue
+
+    def _get(self, source: queue.Queue, block: bool = True):
+        while not self._stop.is_set():
+            try: return source.get(timeout=0.2) if block else source.get_nowait()
+            except queue.Empty:
+                if not block: return None
+        return _STOP
+
+    def _fail(self, stage: str, error: Exception):
+        print(f"❌ Errore nello stadio '{stage}' della sincronizzazione: {error}")
+        if self.error is None: self.error, self.failed_stage = error, stage
+        self._stop.set()
+
+    def _transform_loop(self):
+        while True:
+            item = self._get(self.transform_queue)
+            if item is _STOP: return
+            sequence, page = item
+            try:
+                start = time.perf_counter()
+                # Il fast path legge le revisioni da un reader: non attende il writer (WAL)
+                revisions = self.database_manager.get_order_revisions([order.get('id') for order in page])
+                prepared = self.database_manager.prepare_orders(page, revisions)
+                self.stats['transform'].add(len(page), time.perf_counter() - start)
+            except Exception as e:
+                self._fail('transform', e); return
+            self._put(self.write_queue, (sequence, len(page), prepared))
+
+    def _write_loop(self):
+        # I worker finiscono le pagine in ordine sparso: scritte per numero di sequenza, così la copia di un ordine
+        # scaricata prima (modificato durante la sincronizzazione) non sovrascrive mai quella scaricata dopo
+        pending, next_sequence, finished = {}, 0, False
+        while not self._stop.is_set():
+            if not finished:
+                item = self._get(self.write_queue)
+                if item is _STOP: finished = True
+                else: pending[item[0]] = item[1:]
+            # Accorpa le pagine già pronte e consecutive: una transazione per write_batch ordini invece che per pagina
+            batch, received = [], 0
+            while True:
+                while next_sequence in pending and received < self.write_batch:
+                    batch.append(pending.pop(next_sequence)); received += len(batch[-1][1]); next_sequence += 1
+                if finished or received >= self.write_batch: break
+                item = self._get(self.write_queue, block=False)
+                if item is None: break
+                if item is _STOP: finished = True
+                else: pending[item[0]] = item[1:]
+            if not batch:
+                if finished: return
+                continue
+            try:
+                start = time.perf_counter()
+                result = self.database_manager.write_prepared_orders([order for _, prepared in batch for order in prepared], raise_errors=True)
+                self.stats['write'].add(sum(count for count, _ in batch), time.perf_counter() - start)
+            except Exception as e:
+                self._fail('write', e); return
+            self.inserted_ids.extend(result.inserted_ids); self.updated_ids.extend(result.updated_ids)
+            self._put(self.notify_queue, (sum(count for count, _ in batch), result.changed_ids))
+
+    def _notify_loop(self):
+        synced = 0
+        while True:
+            item = self._get(self.notify_queue)
+            if item is _STOP: return
+            count, changed_ids = item
+            synced += count
+            start = time.perf_counter()
+            try:
+                if self.on_progress: self.on_progress(synced)
+                if changed_ids and self.on_changed: self.on_changed(changed_ids)
+            except Exception as e:
+                print(f"❌ Errore notifica sincronizzazione: {e}")
+            self.stats['notify'].add(count, time.perf_counter() - start)
@@ -8,18 +8,54 @@ Sviluppato da TechExpresso
 
 import sys
 import os
+import json
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from unittest.mock import Mock, patch, MagicMock
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 # Aggiungi path per import moduli
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from config import Config
+from config import Config, config
 from woocommerce_api import WooCommerceManager
 from supabase_manager import SupabaseManager
 from export_manager import ExportManager
+from database_manager import DatabaseManager, SyncResult
+from webhook_server import WebhookServer, sign_payload
+from traveler_prefetcher import TravelerPrefetcher
+from query_executor import QueryExecutor
+from ui_dispatcher import UIQueue, QueueDispatcher, coalesce_messages
 
+def make_order(woo_id, status='processing', date_modified='2025-01-01T12:00:00', **fields):
+    """Ordine WooCommerce minimo per i test; i campi passati sostituiscono quelli predefiniti"""
+    order = {
+        'id': woo_id, 'number': str(woo_id), 'status': status, 'total': '100.00',
+        'billing': {'first_name': 'Mario', 'last_name': 'Rossi', 'email': f'mario{woo_id}@example.com'},
+        'line_items': [{'name': 'Gita Roma', 'quantity': 2}],
+        'date_created': '2025-01-01T10:00:00', 'date_modified': date_modified
+    }
+    order.update(fields)
+    return order
+    
+class TempDatabaseTestCase(unittest.TestCase):
+    """Base per i test con un DatabaseManager su file SQLite in una cartella temporanea"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'test.db')
+        self.db = DatabaseManager(db_path=self.db_path)
+        
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        
 class TestConfig(unittest.TestCase):
     """Test configurazione applicazione"""
     
@@ -117,6 +153,482 @@ class TestWooCommerceManager(unittest.TestCase):
         # Test che non sollevi eccezioni
         self.woo_manager._default_order_handler(test_event)
         
+class StubWooCommerceServer:
+    """Server HTTP locale che imita gli endpoint REST WooCommerce usati dal gestionale"""
+    
+    def __init__(self, orders):
+        self.orders = orders
+        self.throttle_pages = set()   # pagine che rispondono una volta con 429
+        self.travelers = {}           # woo_id -> dati viaggiatori dell'endpoint custom
+        self.missing_travelers = set()  # woo_id per cui l'endpoint viaggiatori risponde 404
+        self.unavailable_once = set() # percorsi che rispondono una volta con 503
+        self.requests = []
+        self.client_ports = set()
+        self.request_headers = []
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive come un server web reale
+            
+            def log_message(self, *args): pass
+            
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                stub.requests.append((url.path, query))
+                stub.client_ports.add(self.client_address[1])
+                stub.request_headers.append(dict(self.headers))
+                if url.path in stub.unavailable_once:
+                    stub.unavailable_once.discard(url.path)
+                    return self._send({'code': 'unavailable'}, status=503, headers={'Retry-After': '0'})
+                if url.path.endswith('/system_status'):
+                    return self._send({})
+                if url.path.startswith('/wp-json/gitemania/v1/viaggiatori/'):
+                    if int(url.path.rsplit('/', 1)[1]) in stub.missing_travelers:
+                        return self._send({'code': 'rest_no_route'}, status=404)
+                    return self._send(stub.travelers.get(int(url.path.rsplit('/', 1)[1]), []))
+                if url.path.endswith('/orders'):
+                    page, per_page = int(query.get('page', 1)), int(query.get('per_page', 10))
+                    if page in stub.throttle_pages:
+                        stub.throttle_pages.discard(page)
+                        return self._send({'code': 'too_many_requests'}, status=429, headers={'Retry-After': '0'})
+                    orders = stub.orders
+                    if 'modified_after' in query:
+                        orders = [o for o in orders if o.get('date_modified_gmt', '') > query['modified_after']]
+                    if query.get('orderby') == 'modified':
+                        orders = sorted(orders, key=lambda o: o.get('date_modified_gmt', ''))
+                    total_pages = (len(orders) + per_page - 1) // per_page
+                    body = orders[(page - 1) * per_page:page * per_page]
+                    return self._send(body, headers={'X-WP-Total': str(len(orders)), 'X-WP-TotalPages': str(total_pages)})
+                self._send({'code': 'rest_no_route'}, status=404)
+                
+            def _send(self, payload, status=200, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items(): self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+                
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        
+class StubPostgrestServer:
+    """Server HTTP locale che imita PostgREST (REST di Supabase) per le tabelle con chiave woo_id"""
+    
+    def __init__(self):
+        self.tables = {}   # tabella -> {woo_id: riga}
+        self.requests = [] # (metodo, tabella)
+        self.failing = False  # True: ogni richiesta risponde 502 (servizio irraggiungibile dietro il gateway)
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # intestazioni e corpo in scritture separate: niente attese da ACK ritardato
+            
+            def log_message(self, *args): pass
+            
+            def _request(self):
+                url = urlparse(self.path)
+                table = url.path.rsplit('/', 1)[1]
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                stub.requests.append((self.command, table))
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                if stub.failing:
+                    self._send({'message': 'Bad Gateway'}, status=502)  # 503 verrebbe ritentato dal client postgrest
+                    return None
+                return stub.tables.setdefault(table, {}), query, body
+                
+            def _matching(self, rows, query):
+                selected = list(rows.values())
+                for column, condition in query.items():
+                    if column in ('select', 'limit', 'on_conflict', 'order'): continue
+                    operator, _, value = condition.partition('.')
+                    if operator == 'gt':
+                        selected = [row for row in selected if row.get(column) is not None and row[column] > int(value)]
+                        continue
+                    values = value.strip('()').split(',') if operator == 'in' else [value]
+                    selected = [row for row in selected if str(row.get(column)) in values]
+                if 'order' in query: selected.sort(key=lambda row: row.get(query['order'].split('.')[0]))
+                return selected[:int(query['limit'])] if 'limit' in query else selected
+                
+            def do_GET(self):
+                request = self._request()
+                if request is None: return
+                rows, query, _ = request
+                columns = [c for c in query.get('select', '*').split(',') if c != '*']
+                self._send([{c: row.get(c) for c in columns} if columns else row for row in self._matching(rows, query)])
+                
+            def do_POST(self):
+                request = self._request()
+                if request is None: return
+                rows, query, body = request
+                records = body if isinstance(body, list) else [body]
+                if 'on_conflict' not in query and any(r.get('woo_id') in rows for r in records):
+                    return self._send({'code': '23505', 'message': 'duplicate key value'}, status=409)
+                for record in records:
+                    key = record.get('woo_id', len(rows) + 1)
+                    rows[key] = {'id': len(rows) + 1, **rows.get(key, {}), **record}  # id come una colonna BIGSERIAL
+                self._send(records, status=201)
+                
+            def do_PATCH(self):
+                request = self._request()
+                if request is None: return
+                rows, query, body = request
+                matching = self._matching(rows, query)
+                for row in matching: row.update(body)
+                self._send(matching)
+                
+            def _send(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        
+class TestWooCommercePaging(unittest.TestCase):
+    """Test download concorrente delle pagine contro un server WooCommerce locale"""
+    
+    def setUp(self):
+        self.stub = StubWooCommerceServer([{'id': i, 'status': 'processing'} for i in range(1, 96)])
+        self.woo_manager = WooCommerceManager()
+        self.assertTrue(self.woo_manager.initialize(self.stub.url, "ck_test", "cs_test"))
+        
+    def tearDown(self):
+        self.stub.close()
+        
+    def _download(self, **kwargs):
+        received, callback_threads = [], set()
+        def on_page(orders_page):
+            callback_threads.add(threading.get_ident())
+            received.extend(order['id'] for order in orders_page)
+        self.assertTrue(self.woo_manager.get_orders_paged(params={'per_page': 10}, page_callback=on_page, **kwargs))
+        return received, callback_threads
+        
+    def test_concurrent_pages(self):
+        """Test tutte le pagine scaricate una sola volta e consegnate sul thread chiamante"""
+        received, callback_threads = self._download(concurrency=4)
+        self.assertEqual(sorted(received), list(range(1, 96)))
+        self.assertEqual(callback_threads, {threading.get_ident()})
+        
+    def test_throttled_page_is_retried(self):
+        """Test pagina con risposta 429 ritentata dal rate limiter adattivo"""
+        self.stub.throttle_pages = {3, 7}
+        received, _ = self._download(concurrency=3)
+        self.assertEqual(sorted(received), list(range(1, 96)))
+        pages_requested = [int(q['page']) for path, q in self.stub.requests if path.endswith('/orders')]
+        self.assertEqual(pages_requested.count(3), 2)
+        
+    def test_single_retry_layer(self):
+        """Test 429 persistente: ogni tentativo passa dal rate limiter, nessun retry della sessione sotto"""
+        class AlwaysThrottled(set):
+            def discard(self, page): pass
+        self.stub.throttle_pages = AlwaysThrottled({2})
+        from woocommerce_api import AdaptiveRateLimiter
+        with patch.object(AdaptiveRateLimiter, 'on_throttle', autospec=True) as on_throttle:
+            self.assertFalse(self.woo_manager.get_orders_paged(params={'per_page': 10}, concurrency=1))
+        pages_requested = [int(q['page']) for path, q in self.stub.requests if path.endswith('/orders')]
+        self.assertEqual(pages_requested.count(2), WooCommerceManager.PAGE_RETRIES)
+        self.assertEqual(on_throttle.call_count, WooCommerceManager.PAGE_RETRIES)
+        
+    def test_failed_page_is_reported(self):
+        """Test errore su una pagina scaricata in parallelo: il log riporta la pagina fallita"""
+        def fail_page_5(params, page, per_page, limiter):
+            if page == 5: raise requests.HTTPError("HTTP 500 sulla pagina 5")
+            return original(params, page, per_page, limiter)
+        original = self.woo_manager._fetch_orders_page
+        with patch.object(self.woo_manager, '_fetch_orders_page', side_effect=fail_page_5), patch('builtins.print') as mock_print:
+            self.assertFalse(self.woo_manager.get_orders_paged(params={'per_page': 10}, concurrency=3))
+        errors = [call.args[0] for call in mock_print.call_args_list if call.args and 'Eccezione grave' in str(call.args[0])]
+        self.assertEqual(len(errors), 1)
+        self.assertIn('(pagina 5)', errors[0])
+        
+    def test_sequential_fallback(self):
+        """Test modalità sequenziale con concorrenza 1"""
+        received, _ = self._download(concurrency=1)
+        self.assertEqual(received, list(range(1, 96)))
+        
+class TestPooledHttpSession(unittest.TestCase):
+    """Test sessione HTTP condivisa: keep-alive, compressione, retry e metriche"""
+    
+    def setUp(self):
+        self.stub = StubWooCommerceServer([{'id': i} for i in range(1, 6)])
+        self.stub.travelers = {i: [{'nome': f'Viaggiatore {i}'}] for i in range(1, 6)}
+        self.woo_manager = WooCommerceManager()
+        self.assertTrue(self.woo_manager.initialize(self.stub.url, "ck_test", "cs_test"))
+        
+    def tearDown(self):
+        self.woo_manager.session.close()
+        self.stub.close()
+        
+    def test_connections_are_reused(self):
+        """Test chiamate wc/v3 e viaggiatori sulla stessa connessione keep-alive"""
+        for woo_id in range(1, 6):
+            self.assertEqual(self.woo_manager.get_viaggiatori_for_order(woo_id), [{'nome': f'Viaggiatore {woo_id}'}])
+        self.woo_manager.get_orders_paged(concurrency=1)
+        self.assertEqual(len(self.stub.client_ports), 1)
+        self.assertIn('gzip', self.stub.request_headers[-1].get('Accept-Encoding', ''))
+        
+    def test_retry_on_server_error(self):
+        """Test retry automatico su 503 con Retry-After"""
+        self.stub.unavailable_once = {'/wp-json/gitemania/v1/viaggiatori/3'}
+        self.assertEqual(self.woo_manager.get_viaggiatori_for_order(3), [{'nome': 'Viaggiatore 3'}])
+        self.assertEqual(sum(1 for path, _ in self.stub.requests if path.endswith('/viaggiatori/3')), 2)
+        
+    def test_latency_metrics(self):
+        """Test metriche di latenza raggruppate per endpoint"""
+        for woo_id in range(1, 4): self.woo_manager.get_viaggiatori_for_order(woo_id)
+        metrics = self.woo_manager.get_http_metrics()
+        self.assertEqual(metrics['GET /wp-json/gitemania/v1/viaggiatori/{id}']['requests'], 3)
+        self.assertEqual(metrics['GET /wp-json/wc/v3/system_status']['errors'], 0)
+        
+class TestDeltaPolling(TempDatabaseTestCase):
+    """Test polling per data di modifica con high-water mark persistente"""
+    
+    def setUp(self):
+        super().setUp()
+        orders = [{'id': i, 'status': 'processing', 'total': '10.00', 'date_created': f'2025-03-01T10:{i:02d}:00',
+                   'date_modified': f'2025-03-01T10:{i:02d}:00', 'date_modified_gmt': f'2025-03-01T09:{i:02d}:00'} for i in range(1, 26)]
+        self.stub = StubWooCommerceServer(orders)
+        self.synced = []
+        
+        def on_update(orders_page, sync_state=None):
+            self.synced.extend(order['id'] for order in orders_page)
+            self.db.sync_multiple_orders(orders_page, sync_state)
+            
+        self.woo_manager = WooCommerceManager(on_order_update=on_update, state_store=self.db)
+        self.woo_manager.last_sync = datetime(2025, 3, 1, tzinfo=timezone.utc)
+        self.assertTrue(self.woo_manager.initialize(self.stub.url, "ck_test", "cs_test"))
+        
+    def tearDown(self):
+        self.stub.close()
+        super().tearDown()
+        
+    def test_poll_pages_and_persists_mark(self):
+        """Test tutte le pagine scaricate e high-water mark salvato nel DB"""
+        with patch.dict(config.config['app'], {'per_page': 10}):
+            self.assertTrue(self.woo_manager.poll_modified_orders())
+        self.assertEqual(self.synced, list(range(1, 26)))
+        self.assertEqual(self.db.get_sync_state(WooCommerceManager.HIGH_WATER_MARK_KEY), '2025-03-01T09:25:00+00:00')
+        _, query = [r for r in self.stub.requests if r[0].endswith('/orders')][0]
+        self.assertEqual((query['orderby'], query['order']), ('modified', 'asc'))
+        
+    def test_order_modified_during_poll(self):
+        """Test ordine modificato durante il giro: la riga al confine della pagina non viene saltata"""
+        on_update = self.woo_manager.on_order_update
+        def modify_after_first_page(orders_page, sync_state=None):
+            on_update(orders_page, sync_state)
+            if orders_page[0]['id'] == 1:
+                self.stub.orders[1] = dict(self.stub.orders[1], status='completed', date_modified_gmt='2025-03-02T08:00:00')
+        self.woo_manager.on_order_update = modify_after_first_page
+        with patch.dict(config.config['app'], {'per_page': 10}):
+            self.assertTrue(self.woo_manager.poll_modified_orders())
+        self.assertEqual(sorted(set(self.synced)), list(range(1, 26)))
+        self.assertEqual(self.synced.count(2), 2)
+        self.assertEqual(self.db.get_sync_state(WooCommerceManager.HIGH_WATER_MARK_KEY), '2025-03-02T08:00:00+00:00')
+        
+    def test_restart_resumes_from_mark(self):
+        """Test un nuovo manager (riavvio) chiede solo gli ordini modificati dopo il mark"""
+        self.woo_manager.poll_modified_orders()
+        self.stub.orders[2] = dict(self.stub.orders[2], status='completed', date_modified_gmt='2025-03-02T08:00:00')
+        self.synced.clear()
+        restarted = WooCommerceManager(on_order_update=self.woo_manager.on_order_update, state_store=self.db)
+        restarted.api = self.woo_manager.api
+        self.assertTrue(restarted.poll_modified_orders())
+        self.assertEqual(self.synced, [25, 3])  # 25 per la sovrapposizione di 1 secondo, 3 per il cambio di stato
+        self.assertEqual({o['woo_id']: o['status'] for o in self.db.get_orders()}[3], 'completed')
+        
+    def test_mark_not_advanced_on_failure(self):
+        """Test high-water mark invariato se il salvataggio fallisce"""
+        def failing_update(orders_page, sync_state=None): raise RuntimeError("disco pieno")
+        self.woo_manager.on_order_update = failing_update
+        self.assertFalse(self.woo_manager.poll_modified_orders())
+        self.assertIsNone(self.db.get_sync_state(WooCommerceManager.HIGH_WATER_MARK_KEY))
+        
+class TestWebhookServer(unittest.TestCase):
+    """Test ricevitore webhook con un client locale che invia payload firmati"""
+    
+    SECRET = "segreto_di_test"
+    
+    def setUp(self):
+        import requests
+        self.http = requests
+        self.batches = []
+        self.batch_received = threading.Event()
+        def on_batch(orders):
+            self.batches.append(sorted(order['id'] for order in orders))
+            self.batch_received.set()
+        self.server = WebhookServer(self.SECRET, on_batch=on_batch, host='127.0.0.1', port=0, max_orders=3, flush_interval_ms=100)
+        self.assertTrue(self.server.start())
+        self.url = f"http://127.0.0.1:{self.server.effective_port}/webhooks/woocommerce"
+        
+    def tearDown(self):
+        self.server.stop()
+        
+    def _post(self, order, topic='order.updated', secret=SECRET):
+        body = json.dumps(order).encode()
+        headers = {'Content-Type': 'application/json', 'X-WC-Webhook-Topic': topic, 'X-WC-Webhook-Signature': sign_payload(body, secret)}
+        return self.http.post(self.url, data=body, headers=headers, timeout=5)
+        
+    def test_signed_orders_are_batched(self):
+        """Test ordini firmati accodati e salvati in un unico batch (duplicati uniti)"""
+        self.server.batcher.flush_interval = 30  # solo il raggiungimento di max_orders deve svuotare la coda
+        time.sleep(0.3)
+        for woo_id in (1, 2, 2, 3):
+            self.assertEqual(self._post({'id': woo_id, 'status': 'processing'}).status_code, 202)
+        self.assertTrue(self.batch_received.wait(5))
+        self.assertEqual(self.batches[0], [1, 2, 3])
+        self.assertTrue(self.server.is_healthy())
+        
+    def test_time_based_flush(self):
+        """Test consegna dopo flush_interval_ms anche con pochi ordini"""
+        self._post({'id': 10, 'status': 'completed'}, topic='order.created')
+        self.assertTrue(self.batch_received.wait(5))
+        self.assertEqual(self.batches, [[10]])
+        
+    def test_invalid_signature_rejected(self):
+        """Test firma non valida rifiutata senza accodare l'ordine"""
+        self.assertEqual(self._post({'id': 1}, secret='sbagliato').status_code, 401)
+        self.assertFalse(self.batch_received.wait(0.3))
+        self.assertFalse(self.server.is_healthy())
+        
+    def test_ping_and_polling_fallback(self):
+        """Test ping di creazione webhook e polling rallentato mentre i webhook sono sani"""
+        self.assertEqual(self.http.post(self.url, data={'webhook_id': '7'}, timeout=5).status_code, 200)
+        woo_manager = WooCommerceManager()
+        woo_manager.webhook_server = self.server
+        self.assertEqual(woo_manager.poll_interval(), config.get('app', 'sync_interval', 60))
+        self._post({'id': 5})
+        self.assertEqual(woo_manager.poll_interval(), config.get('webhook', 'reconciliation_interval', 900))
+        
+    def test_late_webhook_does_not_overwrite_newer_order(self):
+        """Test consegna ritentata di un payload vecchio dopo quello più recente: l'ordine salvato resta il più recente"""
+        tmp_dir = tempfile.mkdtemp()
+        db = DatabaseManager(db_path=os.path.join(tmp_dir, 'test.db'))
+        written = []
+        def on_batch(orders):
+            written.append(db.sync_multiple_orders(orders)); self.batch_received.set()
+        self.server.stop()
+        self.server = WebhookServer(self.SECRET, on_batch=on_batch, host='127.0.0.1', port=0, max_orders=1, flush_interval_ms=50)
+        try:
+            self.assertTrue(self.server.start())
+            self.url = f"http://127.0.0.1:{self.server.effective_port}/webhooks/woocommerce"
+            for order in (make_order(7, 'completed', '2025-01-02T09:00:00'), make_order(7, 'processing', '2025-01-01T12:00:00')):
+                self.batch_received.clear()
+                self.assertEqual(self._post(order).status_code, 202)
+                self.assertTrue(self.batch_received.wait(5))
+            self.assertEqual([tuple(result) for result in written], [(1, 0), (0, 0)])
+            self.assertEqual((db.get_order(7)['status'], db.get_order(7)['date_modified']), ('completed', '2025-01-02T09:00:00'))
+        finally:
+            db.close(); shutil.rmtree(tmp_dir, ignore_errors=True)
+        
+class TestTravelerCache(TempDatabaseTestCase):
+    """Test cache SQLite dei viaggiatori, prefetch in background ed export"""
+    
+    def setUp(self):
+        super().setUp()
+        self.orders = [{'id': i, 'number': str(i), 'status': 'processing', 'total': '50.00', 'billing': {'first_name': 'Mario', 'last_name': 'Rossi'},
+                        'line_items': [], 'date_created': f'2025-01-{i:02d}T10:00:00', 'date_modified': '2025-01-01T12:00:00'} for i in range(1, 21)]
+        self.db.sync_multiple_orders(self.orders)
+        self.stub = StubWooCommerceServer(self.orders)
+        self.stub.travelers = {i: [{'nome': f'Nome{i}', 'cognome': 'Bianchi'}] for i in range(1, 21)}
+        self.woo_manager = WooCommerceManager()
+        self.assertTrue(self.woo_manager.initialize(self.stub.url, "ck_test", "cs_test"))
+        self.prefetcher = TravelerPrefetcher(self.woo_manager, self.db, concurrency=3)
+        
+    def tearDown(self):
+        self.prefetcher.stop()
+        self.woo_manager.session.close()
+        self.stub.close()
+        super().tearDown()
+        
+    def _traveler_requests(self):
+        return [path for path, _ in self.stub.requests if '/viaggiatori/' in path]
+        
+    def test_cache_invalidated_by_date_modified(self):
+        """Test cache valida solo per la date_modified con cui è stata scaricata"""
+        self.db.save_cached_travelers([(1, '2025-01-01T12:00:00', [{'nome': 'Anna'}])])
+        self.assertEqual(self.db.get_cached_travelers([1, 2]), {1: [{'nome': 'Anna'}]})
+        self.assertNotIn(1, [woo_id for woo_id, _ in self.db.get_orders_missing_travelers()])
+        self.db.sync_multiple_orders([dict(self.orders[0], date_modified='2025-01-05T08:00:00')])
+        self.assertEqual(self.db.get_cached_travelers([1]), {})
+        self.assertIn((1, '2025-01-05T08:00:00'), self.db.get_orders_missing_travelers())
+        
+    def test_prefetch_fills_cache(self):
+        """Test prefetch in background: ogni ordine scaricato una volta sola"""
+        self.stub.unavailable_once = {'/wp-json/gitemania/v1/viaggiatori/7'}
+        self.prefetcher.schedule()
+        self.assertTrue(self.prefetcher.wait(timeout=30))
+        cached = self.db.get_cached_travelers(list(range(1, 21)))
+        self.assertEqual(len(cached), 20)
+        self.assertEqual(cached[7], [{'nome': 'Nome7', 'cognome': 'Bianchi'}])
+        requests_made = len(self._traveler_requests())
+        self.prefetcher.schedule()
+        self.assertTrue(self.prefetcher.wait(timeout=30))
+        self.assertEqual(len(self._traveler_requests()), requests_made)
+        self.assertEqual(self.db.get_orders_missing_travelers(), [])
+        
+    def test_failed_fetch_not_retried_every_sync(self):
+        """Test ordine che l'endpoint non serve (404): voce negativa, nessuna nuova richiesta fino a modifica o scadenza del ritentativo"""
+        self.stub.missing_travelers = {4}
+        self.prefetcher.schedule()
+        self.assertTrue(self.prefetcher.wait(timeout=30))
+        self.assertNotIn(4, self.db.get_cached_travelers(list(range(1, 21))))
+        self.assertEqual(self.db.get_orders_missing_travelers(), [])
+        requests_made = len(self._traveler_requests())
+        self.prefetcher.schedule()
+        self.assertTrue(self.prefetcher.wait(timeout=30))
+        self.assertEqual(len(self._traveler_requests()), requests_made)
+        self.assertEqual(self.db.get_orders_missing_travelers(failed_retry_hours=0), [(4, '2025-01-01T12:00:00')])
+        self.db.sync_multiple_orders([dict(self.orders[3], date_modified='2025-01-06T08:00:00')])
+        self.assertEqual(self.db.get_orders_missing_travelers(), [(4, '2025-01-06T08:00:00')])
+        
+    def test_export_uses_cache(self):
+        """Test export CSV con viaggiatori dalla cache, senza chiamate HTTP"""
+        self.prefetcher.schedule()
+        self.assertTrue(self.prefetcher.wait(timeout=30))
+        requests_made = len(self._traveler_requests())
+        results = []
+        export_manager = ExportManager(self.db, on_export_complete=results.append)
+        export_manager.exports_dir = self.tmp_dir
+        export_manager.export_orders_csv()
+        self.assertTrue(results[0].success)
+        with open(results[0].file_path, encoding='utf-8-sig') as csvfile:
+            content = csvfile.read()
+        self.assertIn('Nome13', content)
+        self.assertEqual(len(self._traveler_requests()), requests_made)
+        
+    def test_export_streams_with_progress(self):
+        """Test export a blocchi con avanzamento e viaggiatori dai meta_data se non in cache"""
+        self.db.sync_multiple_orders([dict(self.orders[0], date_modified='2025-02-01T00:00:00', meta_data=[{'key': '_dati_viaggiatori', 'value': [{'nome': 'DaMeta'}]}])])
+        results, progress = [], []
+        export_manager = ExportManager(self.db, on_export_complete=results.append, on_export_progress=lambda done, total: progress.append((done, total)))
+        export_manager.exports_dir = self.tmp_dir
+        with patch.dict(config.config, {'export': {'fetch_size': 7}}):
+            export_manager.export_orders_csv()
+        self.assertTrue(results[0].success)
+        self.assertEqual(results[0].total_records, 20)
+        self.assertEqual(progress, [(7, 20), (14, 20), (20, 20)])
+        with open(results[0].file_path, encoding='utf-8-sig') as csvfile:
+            self.assertIn('DaMeta', csvfile.read())
+        self.assertEqual([name for name in os.listdir(self.tmp_dir) if name.endswith('.part')], [])
+        
 class TestSupabaseManager(unittest.TestCase):
     """Test Supabase Database Manager"""
     
@@ -170,6 +682,1134 @@ class TestSupabaseManager(unittest.TestCase):
         self.assertEqual(extracted['customer_name'], 'Mario Rossi')
         self.assertEqual(extracted['hash_signature'], 'test_hash')
         
+    def test_sync_multiple_orders_batches_requests(self):
+        """Test sync in blocco contro PostgREST locale: select + upsert ordini + upsert clienti per blocco"""
+        stub = StubPostgrestServer()
+        try:
+            self.assertTrue(self.supabase_manager.initialize(stub.url, "test-key"))
+            order = lambda woo_id, status='processing': {'id': woo_id, 'status': status, 'total': '10.00', 'customer_id': woo_id % 3 + 1,
+                                                         'billing': {'email': f"cliente{woo_id % 3 + 1}@example.com", 'first_name': 'Mario'},
+                                                         'line_items': [], 'date_modified': '2025-01-01T10:00:00'}
+            stub.requests.clear()
+            with patch.object(config, 'get', side_effect=lambda section, key, default=None: 4 if key == 'sync_chunk_size' else default):
+                result = self.supabase_manager.sync_multiple_orders([order(i) for i in range(1, 11)])
+                self.assertEqual(tuple(result), (10, 0))
+                self.assertEqual(stub.requests.count(('GET', 'orders')), 3)
+                self.assertEqual(stub.requests.count(('POST', 'orders')), 3)
+                self.assertEqual(stub.requests.count(('POST', 'customers')), 3)
+                self.assertEqual(sorted(stub.tables['customers']), [1, 2, 3])
+                
+                stub.requests.clear()
+                result = self.supabase_manager.sync_multiple_orders([order(1), order(2, 'completed'), order(2, 'completed'), order(11)])
+                self.assertEqual((result.inserted_ids, result.updated_ids), ([11], [2]))
+                self.assertEqual(stub.tables['orders'][2]['status'], 'completed')
+                self.assertEqual(stub.requests, [('GET', 'orders'), ('POST', 'orders'), ('POST', 'customers')])
+                
+                stub.requests.clear()
+                self.assertEqual(tuple(self.supabase_manager.sync_multiple_orders([order(1), order(2, 'completed')])), (0, 0))
+                self.assertEqual(stub.requests, [('GET', 'orders')])
+        finally:
+            stub.close()
+            
+    def test_copy_stream_encoding(self):
+        """Test righe COPY in formato testo: NULL, JSON ed escape, lette a blocchi di qualsiasi dimensione"""
+        from supabase_manager import CopyStream
+        records = [{'woo_id': 1, 'name': 'Tab\there', 'data': {'a': 'x\\y'}}, {'woo_id': 2, 'name': None, 'data': ['riga\nnuova']}]
+        # Prima l'escape JSON, poi quello di COPY: la barra rovesciata raddoppia due volte
+        expected = '1\tTab\\there\t{"a": "x\\\\\\\\y"}\n2\t\\N\t["riga\\\\nnuova"]\n'
+        for size in (1, 7, 8192):
+            stream, chunks = CopyStream(records, ['woo_id', 'name', 'data']), []
+            while True:
+                chunk = stream.read(size)
+                if not chunk: break
+                chunks.append(chunk)
+            self.assertEqual(''.join(chunks), expected)
+            
+    def test_backup_streams_rest_pages(self):
+        """Test backup senza Postgres diretto: pagine PostgREST per id scritte man mano in un file compresso"""
+        import gzip
+        stub, tmp_dir = StubPostgrestServer(), tempfile.mkdtemp()
+        try:
+            self.assertTrue(self.supabase_manager.initialize(stub.url, "test-key"))
+            self.supabase_manager.sync_multiple_orders([{'id': i, 'status': 'completed', 'total': '5.00'} for i in range(1, 26)])
+            stub.requests.clear()
+            backup_path = os.path.join(tmp_dir, 'backup.json.gz')
+            with patch.object(config, 'get', side_effect=lambda section, key, default=None: 10 if key == 'backup_page_size' else default):
+                self.assertTrue(self.supabase_manager.backup_data(backup_path))
+            with gzip.open(backup_path, 'rt', encoding='utf-8') as f:
+                backup = json.load(f)
+            self.assertEqual([order['woo_id'] for order in backup['orders']], list(range(1, 26)))
+            self.assertEqual((backup['customers'], backup['export_logs']), ([], []))
+            self.assertEqual(stub.requests.count(('GET', 'orders')), 3)
+            self.assertFalse(os.path.exists(backup_path + '.part'))
+        finally:
+            stub.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            
+@unittest.skipUnless(os.environ.get('GITEMANIA_TEST_POSTGRES_DSN'), "GITEMANIA_TEST_POSTGRES_DSN non impostata (Postgres locale per i test)")
+class TestSupabasePostgres(unittest.TestCase):
+    """Test import COPY e backup in streaming contro un Postgres locale (schema temporaneo dedicato)"""
+    
+    def setUp(self):
+        import psycopg2
+        from psycopg2.extensions import make_dsn
+        from supabase_manager import SUPABASE_TABLES_SQL
+        dsn = os.environ['GITEMANIA_TEST_POSTGRES_DSN']
+        self.schema = f"gitemania_test_{os.getpid()}"
+        self.admin = psycopg2.connect(dsn)
+        self.admin.autocommit = True
+        with self.admin.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA {self.schema}")
+            cursor.execute(f"SET search_path TO {self.schema}")
+            for sql in SUPABASE_TABLES_SQL.values(): cursor.execute(sql)
+        self.supabase_manager = SupabaseManager()
+        self.assertTrue(self.supabase_manager.connect_postgres(make_dsn(dsn, options=f"-c search_path={self.schema}")))
+        self.tmp_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        self.supabase_manager.close_postgres()
+        with self.admin.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA {self.schema} CASCADE")
+        self.admin.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        
+    def _order(self, woo_id, status='processing'):
+        """Ordine con tab, virgolette e a capo da codificare per COPY; quattro clienti condivisi"""
+        return make_order(woo_id, status, total='12.50', customer_id=woo_id % 4 + 1,
+                          billing={'email': f"cliente{woo_id % 4 + 1}@example.com", 'first_name': 'Anna\tMaria'}, line_items=[{'name': 'Gita "Roma"\n'}])
+        
+    def test_bulk_import_merges_changes(self):
+        """Test COPY + merge: inserimenti, aggiornamenti solo con hash diverso, clienti deduplicati"""
+        result = self.supabase_manager.bulk_import_orders([self._order(i) for i in range(1, 2001)])
+        self.assertEqual(tuple(result), (2000, 0))
+        result = self.supabase_manager.bulk_import_orders([self._order(1), self._order(2, 'completed'), self._order(2001)])
+        self.assertEqual((result.inserted_ids, result.updated_ids), ([2001], [2]))
+        with self.admin.cursor() as cursor:
+            cursor.execute(f"SELECT status, line_items->0->>'name' FROM {self.schema}.orders WHERE woo_id = 2")
+            self.assertEqual(cursor.fetchone(), ('completed', 'Gita "Roma"\n'))
+            cursor.execute(f"SELECT COUNT(*), MIN(first_name) FROM {self.schema}.customers")
+            self.assertEqual(cursor.fetchone(), (4, 'Anna\tMaria'))
+            
+    def test_legacy_orders_id_migration(self):
+        """Test migrazione di orders.id BIGINT senza default creato dalle versioni precedenti"""
+        from supabase_manager import SUPABASE_TABLES_SQL
+        legacy_sql = SUPABASE_TABLES_SQL['orders'].replace('id BIGSERIAL PRIMARY KEY', 'id BIGINT PRIMARY KEY')
+        with self.admin.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {self.schema}")
+            cursor.execute("DROP TABLE orders")
+            cursor.execute(legacy_sql)
+            cursor.execute("INSERT INTO orders (id, woo_id) VALUES (50, 9999)")
+        self.assertTrue(self.supabase_manager.apply_schema_migrations())
+        self.assertTrue(self.supabase_manager.apply_schema_migrations())
+        self.assertEqual(tuple(self.supabase_manager.bulk_import_orders([self._order(1)])), (1, 0))
+        with self.admin.cursor() as cursor:
+            cursor.execute(f"SELECT id FROM {self.schema}.orders WHERE woo_id = 1")
+            self.assertEqual(cursor.fetchone(), (51,))
+            
+    def test_customers_sharing_email(self):
+        """Test clienti WooCommerce diversi con la stessa email: l'import non fallisce, un record per customer_id"""
+        from supabase_manager import SUPABASE_TABLES_SQL
+        with self.admin.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {self.schema}")
+            cursor.execute("DROP TABLE customers")
+            cursor.execute(SUPABASE_TABLES_SQL['customers'].replace('email VARCHAR(255),', 'email VARCHAR(255) UNIQUE,'))  # schema precedente
+        self.assertTrue(self.supabase_manager.apply_schema_migrations())
+        orders = [make_order(1, customer_id=10, billing={'email': 'famiglia@example.com'}), make_order(2, customer_id=11, billing={'email': 'famiglia@example.com'})]
+        self.assertEqual(tuple(self.supabase_manager.bulk_import_orders(orders)), (2, 0))
+        with self.admin.cursor() as cursor:
+            cursor.execute(f"SELECT woo_id FROM {self.schema}.customers ORDER BY woo_id")
+            self.assertEqual(cursor.fetchall(), [(10,), (11,)])
+            
+    def test_streaming_backup(self):
+        """Test backup da cursore lato server in un file compresso"""
+        import gzip
+        self.supabase_manager.bulk_import_orders([self._order(i) for i in range(1, 101)])
+        backup_path = os.path.join(self.tmp_dir, 'backup.json.gz')
+        self.assertTrue(self.supabase_manager.backup_data(backup_path))
+        with gzip.open(backup_path, 'rt', encoding='utf-8') as f:
+            backup = json.load(f)
+        self.assertEqual(len(backup['orders']), 100)
+        self.assertEqual(len(backup['customers']), 4)
+        
+class TestSupabaseReplication(TempDatabaseTestCase):
+    """Test coda di replica durevole su SQLite e replicatore verso un PostgREST locale"""
+    
+    def setUp(self):
+        super().setUp()
+        self.db.replication_enabled = True
+        self.stub = StubPostgrestServer()
+        
+    def tearDown(self):
+        self.stub.close()
+        super().tearDown()
+        
+    def _replicator(self):
+        from supabase_manager import SupabaseManager
+        from supabase_replicator import SupabaseReplicator
+        supabase_manager = SupabaseManager()
+        return SupabaseReplicator(self.db, supabase_manager, connect=lambda: supabase_manager.initialize(self.stub.url, "test-key"))
+        
+    def test_outbox_keeps_latest_change_per_order(self):
+        """Test coda: solo ordini cambiati, una voce per ordine, ritardo dalla prima modifica non replicata"""
+        self.db.sync_multiple_orders([make_order(1), make_order(2)])
+        first_enqueued = self.db.get_replication_status()
+        self.db.sync_multiple_orders([make_order(1, 'completed'), make_order(2)])
+        batch = self.db.get_replication_batch(10)
+        self.assertEqual(sorted(woo_id for woo_id, _, _ in batch), [1, 2])
+        self.assertEqual(json.loads(dict((w, p) for w, _, p in batch)[1])['status'], 'completed')
+        depth, lag = self.db.get_replication_status()
+        self.assertEqual(depth, 2)
+        self.assertGreaterEqual(lag, first_enqueued[1])
+        # Conferma di una versione superata: la voce resta in coda
+        stale_hash = batch[0][1]
+        self.db.sync_multiple_orders([make_order(batch[0][0], 'refunded')])
+        self.db.ack_replication([(batch[0][0], stale_hash)])
+        self.assertEqual(self.db.get_replication_status()[0], 2)
+        
+    def test_replication_disabled_by_default(self):
+        """Test nessuna voce in coda senza replica attiva"""
+        self.db.replication_enabled = False
+        self.db.sync_multiple_orders([make_order(1)])
+        self.assertEqual(self.db.get_replication_status(), (0, 0.0))
+        
+    def test_replicator_survives_outage_and_restart(self):
+        """Test rete assente: voci rinviate con backoff, conservate dopo il riavvio e poi replicate una volta sola"""
+        self.db.sync_multiple_orders([make_order(i) for i in range(1, 6)])
+        replicator = self._replicator()
+        self.stub.failing = True
+        self.assertEqual(replicator.drain_once(), -1)
+        self.assertEqual(len(self.db.get_replication_batch(10)), 5)  # offline: nessun tentativo consumato
+        self.stub.failing = False
+        self.assertTrue(replicator.connect())
+        self.stub.failing = True
+        self.assertEqual(replicator.drain_once(), -1)
+        self.assertEqual(self.db.get_replication_batch(10), [])  # upsert fallito: in attesa del ritentativo
+        self.db.close()
+        
+        self.db = DatabaseManager(db_path=self.db_path)
+        self.db.replication_enabled = True
+        self.assertEqual(self.db.get_replication_status()[0], 5)
+        with self.db.connections.writer() as conn:
+            conn.execute('UPDATE replication_outbox SET next_attempt_at = 0')  # backoff scaduto
+        self.stub.failing = False
+        replicator = self._replicator()
+        self.assertEqual(replicator.drain_once(), 5)
+        self.assertEqual(sorted(self.stub.tables['orders']), [1, 2, 3, 4, 5])
+        self.assertEqual(self.db.get_replication_status(), (0, 0.0))
+        self.stub.requests.clear()
+        self.db.sync_multiple_orders([make_order(3, 'completed')])
+        self.assertEqual(replicator.drain_once(), 1)
+        self.assertEqual(self.stub.tables['orders'][3]['status'], 'completed')
+        self.assertEqual(self.stub.requests, [('GET', 'orders'), ('POST', 'orders')])
+        
+    def test_direct_postgres_imports_queue(self):
+        """Test supabase.direct_postgres: la coda (import completo iniziale compreso) passa da COPY e merge, non da PostgREST"""
+        self.db.replication_enabled = False
+        self.db.sync_multiple_orders([make_order(i) for i in range(1, 4)])
+        replicator = self._replicator()
+        imported = []
+        def connect_postgres(dsn=None):
+            replicator.supabase_manager.pg_pool = Mock(); return True
+        def bulk_import_orders(orders_data, raise_errors=False):
+            imported.extend(order['id'] for order in orders_data); return SyncResult(imported)
+        with patch.object(config, 'get', side_effect=lambda section, key, default=None: True if key == 'direct_postgres' else default), \
+             patch.object(replicator.supabase_manager, 'connect_postgres', side_effect=connect_postgres), \
+             patch.object(replicator.supabase_manager, 'bulk_import_orders', side_effect=bulk_import_orders), \
+             patch.object(replicator.supabase_manager, 'close_postgres'):
+            replicator.start()
+            try:
+                deadline = time.monotonic() + 5
+                while time.monotonic() < deadline and self.db.get_replication_status()[0]: time.sleep(0.05)
+            finally:
+                replicator.stop()
+        self.assertEqual(sorted(imported), [1, 2, 3])
+        self.assertEqual(self.stub.requests, [])
+        self.assertEqual(self.db.get_replication_status(), (0, 0.0))
+        
+    def test_background_replication_reports_status(self):
+        """Test thread di replica: coda esistente accodata all'avvio, svuotata e stato riportato"""
+        self.db.replication_enabled = False
+        self.db.sync_multiple_orders([make_order(i) for i in range(1, 4)])
+        replicator = self._replicator()
+        statuses = []
+        replicator.on_status = statuses.append
+        replicator.start()
+        try:
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline and not (statuses and statuses[-1]['depth'] == 0): time.sleep(0.05)
+            self.assertEqual(sorted(self.stub.tables.get('orders', {})), [1, 2, 3])
+            self.assertTrue(statuses[-1]['online'])
+            self.db.sync_multiple_orders([make_order(4)])
+            replicator.schedule()
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline and 4 not in self.stub.tables['orders']: time.sleep(0.05)
+            self.assertIn(4, self.stub.tables['orders'])
+        finally:
+            replicator.stop()
+            
+class TestDatabaseManager(TempDatabaseTestCase):
+    """Test Database Manager SQLite"""
+    
+    def test_incremental_sync(self):
+        """Test sync incrementale: inserimenti, aggiornamenti e ordini invariati"""
+        self.assertEqual(self.db.sync_multiple_orders([make_order(1), make_order(2)]), (2, 0))
+        # Ordine invariato = nessuna scrittura, ordine modificato = update, ordine nuovo = insert
+        result = self.db.sync_multiple_orders([make_order(1), make_order(2, 'completed', '2025-01-02T09:00:00'), make_order(3)])
+        self.assertEqual(result, (1, 1))
+        orders = {o['woo_id']: o for o in self.db.get_orders()}
+        self.assertEqual(len(orders), 3)
+        self.assertEqual(orders[2]['status'], 'completed')
+        
+    def test_sync_reports_changed_ids(self):
+        """Test woo_id inseriti/aggiornati restituiti dalla sync e rilettura mirata per la tabella"""
+        result = self.db.sync_multiple_orders([make_order(1), make_order(2)])
+        self.assertEqual((result.inserted_ids, result.updated_ids), ([1, 2], []))
+        result = self.db.sync_multiple_orders([make_order(1), make_order(2, 'completed', '2025-01-02T09:00:00'), make_order(3)])
+        self.assertEqual(result, (1, 1))
+        self.assertEqual((result.inserted_ids, result.updated_ids, result.changed_ids), ([3], [2], [3, 2]))
+        self.assertEqual(self.db.sync_multiple_orders([make_order(1)]).changed_ids, [])
+        rows = self.db.get_orders_by_ids(result.changed_ids, {'status': 'processing'}, columns=['woo_id', 'status'], sort_by='total')
+        self.assertEqual(rows, [{'woo_id': 3, 'status': 'processing', 'page_key': 100.0}])
+        self.assertEqual(len(self.db.get_orders_by_ids([1, 2, 3, 99])), 3)
+        
+    def test_duplicate_orders_in_batch(self):
+        """Test ordine ripetuto nello stesso batch (non deve violare il vincolo UNIQUE)"""
+        result = self.db.sync_multiple_orders([make_order(1), make_order(1, 'completed', '2025-01-02T09:00:00')])
+        self.assertEqual(result, (1, 1))
+        self.assertEqual(self.db.get_orders()[0]['status'], 'completed')
+        
+    def test_existing_hash_lookup_is_chunked(self):
+        """Test lookup hash su batch più grandi del limite di parametri SQLite"""
+        self.db.LOOKUP_CHUNK_SIZE = 10
+        self.assertEqual(self.db.sync_multiple_orders([make_order(i) for i in range(1, 36)]), (35, 0))
+        self.assertEqual(self.db.sync_multiple_orders([make_order(i) for i in range(1, 41)]), (5, 0))
+        
+    def test_wal_mode(self):
+        """Test connessioni persistenti in modalità WAL"""
+        with self.db.connections.writer() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        with self.db.connections.reader() as conn:
+            self.assertEqual(conn.execute('PRAGMA query_only').fetchone()[0], 1)
+            
+    def test_reads_during_write(self):
+        """Test letture non bloccate da una scrittura in corso"""
+        import threading
+        self.db.sync_multiple_orders([make_order(1)])
+        write_started, release_write = threading.Event(), threading.Event()
+        
+        def long_write():
+            with self.db.connections.writer() as conn:
+                conn.execute("UPDATE orders SET status = 'completed'")
+                write_started.set()
+                release_write.wait(5)
+                
+        writer_thread = threading.Thread(target=long_write)
+        writer_thread.start()
+        self.assertTrue(write_started.wait(5))
+        # Il reader vede l'ultimo snapshot confermato senza attendere il writer
+        self.assertEqual(self.db.get_orders()[0]['status'], 'processing')
+        release_write.set()
+        writer_thread.join()
+        self.assertEqual(self.db.get_orders()[0]['status'], 'completed')
+        
+    def test_order_stats(self):
+        """Test statistiche calcolate da SQL e order_items"""
+        self.db.sync_multiple_orders([make_order(1), make_order(2, 'completed'), make_order(3, 'completed')])
+        stats = self.db.get_order_stats()
+        self.assertEqual(stats['total_orders'], 3)
+        self.assertEqual(stats['total_revenue'], 300.0)
+        self.assertEqual(stats['by_status'], {'processing': 1, 'completed': 2})
+        self.assertEqual(stats['by_date'], {'2025-01-01': 3})
+        self.assertEqual(stats['top_products'], {'Gita Roma': 6})
+        
+    def test_migration_from_legacy_database(self):
+        """Test aggiornamento in loco di un gitemania.db creato con lo schema originale"""
+        import sqlite3, json
+        from database_manager import MIGRATIONS, _migrate_v1_base_schema
+        legacy_path = os.path.join(self.tmp_dir, 'legacy.db')
+        conn = sqlite3.connect(legacy_path)
+        _migrate_v1_base_schema(conn.cursor())
+        conn.execute("INSERT INTO orders (woo_id, status, total, date_created, line_items) VALUES (7, 'completed', 50, '2025-02-03T10:00:00', ?)",
+                     (json.dumps([{'product_id': 11, 'name': 'Gita Roma', 'quantity': 3, 'total': '50.00'}]),))
+        conn.commit(); conn.close()
+        
+        legacy_db = DatabaseManager(db_path=legacy_path)
+        try:
+            self.assertEqual(legacy_db.get_schema_version(), MIGRATIONS[-1][0])
+            with legacy_db.connections.reader() as conn:
+                self.assertEqual(conn.execute('SELECT order_woo_id, product_id, name, quantity, total FROM order_items').fetchall(), [(7, 11, 'Gita Roma', 3, 50.0)])
+                indexes = {row[1] for row in conn.execute("PRAGMA index_list('orders')")}
+            self.assertTrue({'idx_orders_date_created', 'idx_orders_status', 'idx_orders_customer_email', 'idx_orders_status_date'} <= indexes)
+            self.assertEqual(legacy_db.get_order_stats()['by_date'], {'2025-02-03': 1})
+        finally:
+            legacy_db.close()
+            
+    def test_migration_moves_raw_data_to_payload_store(self):
+        """Test migrazione v9: raw_data esistenti compressi in order_payloads, colonna rimossa"""
+        import sqlite3, json
+        from database_manager import MIGRATIONS, _migrate_v1_base_schema, pending_migrations
+        legacy_path = os.path.join(self.tmp_dir, 'legacy.db')
+        self.assertEqual(pending_migrations(legacy_path), [])
+        conn = sqlite3.connect(legacy_path)
+        _migrate_v1_base_schema(conn.cursor())
+        conn.executemany("INSERT INTO orders (woo_id, status, raw_data) VALUES (?, 'processing', ?)", [(5, json.dumps(make_order(5))), (7, json.dumps(make_order(7))), (8, None)])
+        conn.commit(); conn.close()
+        
+        self.assertEqual([version for version, _ in pending_migrations(legacy_path)], [version for version, _, _ in MIGRATIONS])
+        progress = []
+        legacy_db = DatabaseManager(db_path=legacy_path, on_migration_progress=progress.append)
+        try:
+            self.assertEqual(pending_migrations(legacy_path), [])
+            self.assertIn("Migrazione database v9: payload raw_data compressi e deduplicati", progress)
+            self.assertEqual(progress[-1], "Compattazione del database (VACUUM)")
+            with legacy_db.connections.reader() as conn:
+                self.assertNotIn('raw_data', [row[1] for row in conn.execute("PRAGMA table_info('orders')")])
+                self.assertEqual(conn.execute('SELECT COUNT(*) FROM order_payloads').fetchone()[0], 2)
+            self.assertEqual(legacy_db.get_order(5)['raw_data'], make_order(5))
+            self.assertEqual(legacy_db.get_order(7)['raw_data']['billing']['last_name'], 'Rossi')
+            self.assertIsNone(legacy_db.get_order(8)['raw_data'])
+        finally:
+            legacy_db.close()
+
+    def test_payload_store(self):
+        """Test payload compressi: rilettura identica, contenuto già salvato riusato, nessun payload orfano"""
+        import zlib
+        from database_manager import compress_payload, decompress_payload, PAYLOAD_CODEC, PAYLOAD_CODEC_ZLIB
+        from order_fingerprint import dumps
+        order = make_order(1)
+        payload = dumps(order)
+        self.assertEqual(decompress_payload(compress_payload(payload)), payload)
+        self.assertEqual(decompress_payload(b'\x00' + payload.encode()), payload)
+        self.assertLess(len(compress_payload(payload)), len(zlib.compress(payload.encode())))  # il dizionario aiuta sugli ordini piccoli
+        self.assertEqual(decompress_payload(compress_payload(json.dumps(order), PAYLOAD_CODEC_ZLIB)), json.dumps(order))
+        with self.assertRaises(ValueError): decompress_payload(b'\x7f' + payload.encode())
+        
+        self.db.sync_multiple_orders([order, make_order(2)])
+        # Modifica (solo stato, stessa date_modified) e ritorno al contenuto originale nello stesso batch: il payload originale resta, l'intermedio viene rimosso
+        self.assertEqual(self.db.sync_multiple_orders([make_order(1, 'completed'), order]).updated_ids, [1, 1])
+        self.db.sync_multiple_orders([make_order(2, 'cancelled', '2025-01-03T09:00:00')])
+        with self.db.connections.reader() as conn:
+            rows = conn.execute('SELECT data FROM order_payloads').fetchall()
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(all(data[:1] == PAYLOAD_CODEC for (data,) in rows))
+        self.assertEqual(self.db.get_order(1)['raw_data'], order)
+        self.assertEqual(sorted(row['raw_data']['status'] for row in self.db.iter_orders(columns=['woo_id', 'raw_data'])), ['cancelled', 'processing'])
+        
+    def test_unchanged_revision_skips_encoding(self):
+        """Test fast path: stessa date_modified e stato non rileggono né riscrivono l'ordine, anche con hash di una versione precedente"""
+        self.db.sync_multiple_orders([make_order(1)])
+        with self.db.connections.writer() as conn:
+            conn.execute("UPDATE orders SET hash_signature = 'md5-legacy' WHERE woo_id = 1")
+        with patch('database_manager.encode_order') as encode:
+            self.assertEqual(self.db.sync_multiple_orders([make_order(1)]).changed_ids, [])
+            encode.assert_not_called()
+        self.assertEqual(self.db.sync_multiple_orders([make_order(1, 'completed')]).updated_ids, [1])
+        self.assertEqual(self.db.get_order(1)['status'], 'completed')
+        
+    def test_order_items_replaced_on_update(self):
+        """Test riscrittura di order_items quando un ordine cambia"""
+        self.db.sync_multiple_orders([make_order(1)])
+        changed = make_order(1, 'completed', '2025-01-02T09:00:00')
+        changed['line_items'] = [{'name': 'Tour Dolomiti', 'quantity': 1}]
+        self.db.sync_multiple_orders([changed])
+        self.assertEqual(self.db.get_order_stats()['top_products'], {'Tour Dolomiti': 1})
+        
+    def test_full_text_search(self):
+        """Test ricerca FTS5: prefissi, accenti, prodotti e viaggiatori"""
+        traveler_order = make_order(1)
+        traveler_order['meta_data'] = [{'key': '_dati_viaggiatori', 'value': '[{"nome": "Niccolò", "cognome": "Bianchi", "email": "nico@example.com", "telefono": "3471112233"}]'}]
+        other_order = make_order(2, 'completed')
+        other_order['billing'] = {'first_name': 'Giulia', 'last_name': 'Verdi', 'email': 'giulia@example.com'}
+        other_order['line_items'] = [{'name': 'Tour Dolomiti', 'quantity': 1}]
+        self.db.sync_multiple_orders([traveler_order, other_order])
+        
+        search = lambda term, **extra: [o['woo_id'] for o in self.db.get_orders({'search_term': term, **extra})]
+        self.assertEqual(search('niccolo'), [1])         # senza accento
+        self.assertEqual(search('bianc'), [1])           # prefisso
+        self.assertEqual(search('3471112233'), [1])      # telefono viaggiatore
+        self.assertEqual(search('dolom'), [2])           # nome prodotto
+        self.assertEqual(search('giulia@example'), [2])  # email cliente
+        self.assertEqual(search('gita', status='processing'), [1])
+        self.assertEqual(search('inesistente'), [])
+        
+    def test_full_text_index_follows_updates(self):
+        """Test indice FTS aggiornato quando l'ordine cambia"""
+        self.db.sync_multiple_orders([make_order(1)])
+        changed = make_order(1, 'completed', '2025-01-02T09:00:00')
+        changed['line_items'] = [{'name': 'Crociera Egeo', 'quantity': 1}]
+        self.db.sync_multiple_orders([changed])
+        self.assertEqual(self.db.get_orders({'search_term': 'gita'}), [])
+        self.assertEqual(len(self.db.get_orders({'search_term': 'crociera'})), 1)
+        
+    def test_stats_rollups_match_rebuild(self):
+        """Test aggregati incrementali identici a un ricalcolo completo dopo cambi di stato e prodotti"""
+        self.db.sync_multiple_orders([make_order(1), make_order(2), make_order(3, 'pending')])
+        changed = make_order(2, 'completed', '2025-01-02T09:00:00')
+        changed['total'] = '80.00'
+        changed['line_items'] = [{'name': 'Tour Dolomiti', 'quantity': 3}]
+        moved = make_order(3, 'refunded', '2025-01-03T09:00:00')
+        moved['date_created'] = '2025-01-05T10:00:00'
+        self.db.sync_multiple_orders([changed, moved, make_order(4), make_order(4, 'cancelled', '2025-01-04T09:00:00')])
+        
+        incremental = self.db.get_order_stats()
+        self.assertEqual(incremental['by_status'], {'processing': 1, 'completed': 1, 'refunded': 1, 'cancelled': 1})
+        self.assertEqual(incremental['by_date'], {'2025-01-01': 3, '2025-01-05': 1})
+        self.assertEqual(incremental['total_revenue'], 380.0)
+        self.assertEqual(incremental['top_products'], {'Gita Roma': 6, 'Tour Dolomiti': 3})
+        self.db.rebuild_order_stats()
+        self.assertEqual(self.db.get_order_stats(), incremental)
+        
+    def test_stats_days_filter(self):
+        """Test statistiche limitate agli ultimi N giorni"""
+        recent = make_order(1)
+        recent['date_created'] = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        self.db.sync_multiple_orders([recent, make_order(2)])
+        self.assertEqual(self.db.get_order_stats(30)['total_orders'], 1)
+        self.assertEqual(self.db.get_order_stats(0)['total_orders'], 2)
+        
+    def test_iter_orders_streams_projection(self):
+        """Test lettura in streaming: solo le colonne richieste, stesso ordine di get_orders"""
+        self.db.sync_multiple_orders([make_order(i, 'completed' if i % 3 else 'processing') for i in range(1, 26)])
+        rows = list(self.db.iter_orders(columns=['woo_id', 'line_items'], fetch_size=10))
+        self.assertEqual([row['woo_id'] for row in rows], [order['woo_id'] for order in self.db.get_orders()])
+        self.assertEqual(set(rows[0]), {'woo_id', 'line_items'})
+        self.assertEqual(rows[0]['line_items'], [{'name': 'Gita Roma', 'quantity': 2}])
+        self.assertEqual(self.db.count_orders({'status': 'processing'}), 8)
+        self.assertEqual(len(list(self.db.iter_orders({'status': 'processing'}, fetch_size=3))), 8)
+        
+    def test_keyset_pagination(self):
+        """Test pagine keyset: concatenate danno la lista completa per ogni ordinamento, avanti e indietro"""
+        orders = []
+        for i in range(1, 48):
+            order = make_order(i, ['completed', 'processing', 'cancelled'][i % 3])
+            order['date_created'] = f'2025-01-{1 + i % 5:02d}T10:00:00'  # molte date uguali: spareggio su woo_id
+            order['total'] = str(i % 7 * 10)
+            orders.append(order)
+        self.db.sync_multiple_orders(orders)
+        for sort_by in ['date_created', 'total', 'status', 'woo_id', 'customer_name']:
+            for descending in (True, False):
+                for filters in [None, {'status': 'completed'}, {'search_term': 'rossi'}]:
+                    expected = sorted((o for o in orders if not filters or filters.get('status', o['status']) == o['status']),
+                                      key=lambda o: ({'total': float(o['total']), 'customer_name': 'Mario Rossi', 'woo_id': o['id']}.get(sort_by, o.get(sort_by)), o['id']), reverse=descending)
+                    pages, key = [], None
+                    while True:
+                        page = self.db.get_orders_page(filters, columns=['woo_id'], sort_by=sort_by, descending=descending, after=key, limit=10)
+                        if not page: break
+                        pages.append(page); key = (page[-1]['page_key'], page[-1]['woo_id'])
+                    self.assertEqual([row['woo_id'] for page in pages for row in page], [o['id'] for o in expected], (sort_by, descending, filters))
+                    if len(pages) > 1:
+                        # Pagina precedente a partire dalla prima riga della seconda pagina
+                        first_of_second = pages[1][0]
+                        previous = self.db.get_orders_page(filters, sort_by=sort_by, descending=descending, before=(first_of_second['page_key'], first_of_second['woo_id']), limit=10)
+                        self.assertEqual([row['woo_id'] for row in previous], [row['woo_id'] for row in pages[0]])
+                        reloaded = self.db.get_orders_page(filters, sort_by=sort_by, descending=descending, after=(first_of_second['page_key'], first_of_second['woo_id']), inclusive=True, limit=10)
+                        self.assertEqual([row['woo_id'] for row in reloaded], [row['woo_id'] for row in pages[1]])
+        with self.assertRaises(ValueError): self.db.get_orders_page(sort_by='raw_data')
+        
+    def test_relevance_pagination(self):
+        """Test lista a finestra con una ricerca: ordine bm25 come get_orders, pagine keyset su (rank, woo_id)"""
+        orders = []
+        for i in range(1, 31):
+            order = make_order(i)
+            # 'verdi' nel cliente per alcuni ordini, solo nel prodotto per altri: pesi diversi nel ranking
+            if i % 3 == 0: order['billing'] = {'first_name': 'Luca', 'last_name': 'Verdi', 'email': f'verdi{i}@example.com'}
+            else: order['line_items'] = [{'name': f"Tour Verdi {'lungo ' * (i % 4)}", 'quantity': 1}]
+            orders.append(order)
+        self.db.sync_multiple_orders(orders)
+        filters = {'search_term': 'verdi'}
+        ranked = [o['woo_id'] for o in self.db.get_orders(filters)]
+        by_date = [row['woo_id'] for row in self.db.get_orders_page(filters, columns=['woo_id'], sort_by='date_created', limit=100)]
+        self.assertNotEqual(ranked, by_date)
+        pages, key = [], None
+        while True:
+            page = self.db.get_orders_page(filters, columns=['woo_id'], sort_by='relevance', after=key, limit=7)
+            if not page: break
+            pages.append(page); key = (page[-1]['page_key'], page[-1]['woo_id'])
+        self.assertEqual(sorted(row['woo_id'] for page in pages for row in page), list(range(1, 31)))
+        rows = [row for page in pages for row in page]
+        self.assertEqual([row['page_key'] for row in rows], sorted((row['page_key'] for row in rows), reverse=True))
+        # Stesso ranking di get_orders (a parità di rank get_orders spareggia per data, la lista per woo_id)
+        self.assertEqual([woo_id % 3 == 0 for woo_id in ranked], [row['woo_id'] % 3 == 0 for row in rows])
+        self.assertTrue(all(row['woo_id'] % 3 == 0 for row in pages[0]))  # prima i clienti, che pesano di più
+        previous = self.db.get_orders_page(filters, columns=['woo_id'], sort_by='relevance', before=(pages[1][0]['page_key'], pages[1][0]['woo_id']), limit=7)
+        self.assertEqual([row['woo_id'] for row in previous], [row['woo_id'] for row in pages[0]])
+        changed = self.db.get_orders_by_ids([3], filters, columns=['woo_id'], sort_by='relevance')
+        self.assertEqual(changed[0]['page_key'], next(row['page_key'] for page in pages for row in page if row['woo_id'] == 3))
+        # Senza ricerca full-text 'relevance' equivale all'ordinamento per data
+        self.assertEqual([row['woo_id'] for row in self.db.get_orders_page(None, columns=['woo_id'], sort_by='relevance', limit=100)],
+                         [row['woo_id'] for row in self.db.get_orders_page(None, columns=['woo_id'], limit=100)])
+        
+    def test_lazy_json_columns(self):
+        """Test colonne JSON decodificate solo al primo accesso e proiezione delle colonne"""
+        self.db.sync_multiple_orders([make_order(1)])
+        order = self.db.get_orders()[0]
+        self.assertIsInstance(dict.__getitem__(order, 'raw_data'), bytes)  # payload compresso
+        self.assertEqual(order['raw_data']['billing']['last_name'], 'Rossi')
+        self.assertIs(order['raw_data'], order.get('raw_data'))
+        self.assertIsInstance(dict.__getitem__(order, 'billing_data'), str)
+        self.assertEqual(dict(order)['billing_data']['first_name'], 'Mario')
+        self.assertEqual(json.loads(json.dumps(order))['line_items'], [{'name': 'Gita Roma', 'quantity': 2}])
+        projected = self.db.get_orders({'search_term': 'rossi'}, columns=['woo_id', 'customer_name', 'status'])
+        self.assertEqual(projected, [{'woo_id': 1, 'customer_name': 'Mario Rossi', 'status': 'processing'}])
+        self.assertEqual(self.db.get_order(1)['line_items'], [{'name': 'Gita Roma', 'quantity': 2}])
+        self.assertIsNone(self.db.get_order(99))
+        with self.assertRaises(ValueError): self.db._select_columns(['woo_id; DROP TABLE orders'])
+        
+class TestQueryExecutor(unittest.TestCase):
+    """Test esecuzione query in background con richieste superate"""
+    
+    def setUp(self):
+        import queue
+        self.results = queue.Queue()
+        self.executor = QueryExecutor(self.results)
+        
+    def tearDown(self):
+        self.executor.stop()
+        
+    def _drain(self, timeout=2.0):
+        """Consegna i risultati come farebbe il dispatcher nel thread Tk"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try: msg_type, data = self.results.get(timeout=0.05)
+            except Exception: continue
+            self.assertEqual(msg_type, "query_result")
+            self.executor.deliver(*data)
+        
+    def test_newer_request_supersedes_stale_ones(self):
+        """Test filtro digitato più volte: la query in corso viene scartata, quelle in attesa non partono"""
+        started, applied = [], []
+        release = threading.Event()
+        def query(name, wait=False):
+            def run():
+                started.append(name)
+                if wait: release.wait(2)
+                return name
+            return run
+        self.executor.submit("orders_view", query("a", wait=True), applied.append)
+        time.sleep(0.1)  # "a" in esecuzione
+        self.executor.submit("orders_view", query("b"), applied.append)
+        self.executor.submit("orders_view", query("c"), applied.append)
+        self.executor.submit("stats", query("s"), applied.append)
+        release.set()
+        self._drain(1.0)
+        self.assertEqual(started, ["a", "c", "s"])
+        self.assertEqual(applied, ["c", "s"])
+        
+    def test_result_superseded_after_queueing(self):
+        """Test risultato già in coda ma superato prima di essere applicato nel thread Tk"""
+        applied = []
+        self.executor.submit("orders_view", lambda: 1, applied.append)
+        time.sleep(0.2)
+        self.executor.submit("orders_view", lambda: 2, applied.append)
+        self._drain(0.5)
+        self.assertEqual(applied, [2])
+        
+@unittest.skipUnless(os.environ.get('DISPLAY') or sys.platform == 'win32', "nessun display disponibile per Tk")
+class TestOrdersViewQueries(unittest.TestCase):
+    """Test lista ordini a finestra: pagine e riordinamenti letti tramite QueryExecutor, mai nel thread Tk"""
+    
+    def setUp(self):
+        import tkinter as tk
+        from theme_manager import GiteManiTheme
+        from modern_components import ModernOrdersView
+        self.root = tk.Tk(); self.root.withdraw()
+        GiteManiTheme.apply_to_root(self.root)
+        self.view = ModernOrdersView(self.root, on_filter_apply=lambda: None)
+        self.submitted, self.fetches = [], 0
+        self.view.submit_query = lambda channel, query, on_result: self.submitted.append((channel, query, on_result))
+        self.orders = [{'woo_id': i, 'customer_name': 'Mario Rossi', 'status': 'processing', 'total': 10.0, 'date_created': '2025-01-01T10:00:00',
+                        'payment_method_title': 'Carta', 'page_key': 1000 - i} for i in range(1, 301)]
+        
+    def tearDown(self):
+        self.root.destroy()
+        
+    def _fetch_page(self, sort_by, descending, after=None, before=None, inclusive=False, limit=100):
+        self.fetches += 1
+        start = 0 if after is None else next(i for i, o in enumerate(self.orders) if o['woo_id'] == after[1]) + (0 if inclusive else 1)
+        return self.orders[start:start + limit]
+        
+    def _run_next(self) -> str:
+        """Esegue la prima query accodata come farebbero QueryExecutor e dispatcher"""
+        channel, query, on_result = self.submitted.pop(0)
+        on_result(query())
+        return channel
+        
+    def test_pages_and_sorting_use_executor(self):
+        """Test finestra, pagina successiva e clic sull'intestazione: query accodate, righe applicate nella callback"""
+        self.view.set_data_source(self._fetch_page)
+        self.assertEqual(self.fetches, 0)
+        self.assertEqual(self._run_next(), 'orders_view')
+        self.assertEqual(len(self.view.orders_data), 100)
+        self.view._loading = True; self.view._load_next_page()
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(self._run_next(), 'orders_page')
+        self.assertEqual(len(self.view.orders_data), 200)
+        self.assertFalse(self.view._loading)
+        # Pagina in lettura quando l'utente riordina: la ricarica la rende obsoleta
+        self.view._loading = True; self.view._load_next_page()
+        self.view._on_heading_click('total')
+        self.assertEqual(self.fetches, 2)
+        stale = self.submitted.pop(0)
+        self.assertEqual(self._run_next(), 'orders_view')
+        stale[2](stale[1]())
+        self.assertEqual(len(self.view.orders_data), 100)
+        self.assertEqual(self.view.sort_by, 'total')
+        self.assertFalse(self.view._loading)
+        
+class TestDashboardCharts(unittest.TestCase):
+    """Test ridisegno dei grafici dashboard (backend Agg, senza finestra)"""
+    
+    def _chart(self, chart_class):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        figure = Figure(figsize=(5, 4), dpi=100)
+        return chart_class(figure, FigureCanvasAgg(figure))
+        
+    def test_unchanged_data_skips_redraw(self):
+        """Test impronta: stessi dati, nessun ridisegno"""
+        from modern_dashboard import StatusDonutChart
+        chart = self._chart(StatusDonutChart)
+        chart.set_data({'completed': 10, 'processing': 5})
+        self.assertTrue(chart.render())
+        chart.set_data({'processing': 5, 'completed': 10})
+        self.assertFalse(chart.dirty)
+        self.assertFalse(chart.render())
+        self.assertEqual(len(chart.render_times), 1)
+        
+    def test_chart_requires_build(self):
+        """Test grafico senza _build: errore alla creazione, non al primo ridisegno"""
+        from modern_dashboard import DashboardChart
+        class IncompleteChart(DashboardChart): pass
+        with self.assertRaises(TypeError): self._chart(IncompleteChart)
+        
+    def test_artists_are_reused(self):
+        """Test aggiornamento degli artist esistenti invece di ricostruire gli assi"""
+        from modern_dashboard import StatusDonutChart, ProductsChart, TimelineChart
+        donut = self._chart(StatusDonutChart)
+        donut.set_data({'completed': 1, 'processing': 1}); donut.render()
+        wedges = donut.wedges
+        donut.set_data({'completed': 3, 'processing': 1}); donut.render()
+        self.assertIs(donut.wedges, wedges)
+        self.assertAlmostEqual(wedges[0].theta2 - wedges[0].theta1, 270)
+        self.assertEqual(donut.autotexts[0].get_text(), '75.0%')
+        products = self._chart(ProductsChart)
+        products.set_data({'Gita Roma': 2, 'Gita Firenze': 5}); products.render()
+        bars = products.bars
+        products.set_data({'Gita Roma': 7, 'Gita Firenze': 5}); products.render()
+        self.assertIs(products.bars, bars)
+        self.assertEqual([bar.get_width() for bar in bars], [5, 7])
+        timeline = self._chart(TimelineChart)
+        timeline.set_data({'2025-01-01': 1}); timeline.render()
+        line = timeline.line
+        timeline.set_data({'2025-01-01': 1, '2025-01-02': 4}); timeline.render()
+        self.assertIs(timeline.line, line)
+        self.assertEqual(list(line.get_ydata()), [1, 4])
+        
+class FakeRoot:
+    """Sostituto minimo di tk.Tk: registra bind/after ed esegue i callback a richiesta"""
+    
+    def __init__(self):
+        self.bindings, self.scheduled, self.generated = {}, [], []
+        
+    def bind(self, sequence, callback): self.bindings[sequence] = callback
+    def after(self, ms, callback): self.scheduled.append((ms, callback))
+    def after_idle(self, callback): self.scheduled.append((0, callback))
+    def event_generate(self, sequence, when=None):
+        self.generated.append(sequence)
+        self.bindings[sequence](None)
+        
+    def run_pending(self, max_delay=1):
+        """Esegue i callback immediati (non il controllo di riserva); restituisce quanti ne ha eseguiti"""
+        count = 0
+        while True:
+            ready = [item for item in self.scheduled if item[0] <= max_delay]
+            if not ready: return count
+            for item in ready: self.scheduled.remove(item); item[1](); count += 1
+            
+class TestUIDispatcher(unittest.TestCase):
+    """Test dispatcher dei messaggi verso l'interfaccia"""
+    
+    def setUp(self):
+        self.root = FakeRoot()
+        self.queue = UIQueue()
+        self.handled = []
+        handlers = {name: (lambda data, name=name: self.handled.append((name, data)))
+                    for name in ("update_status", "orders_changed", "query_result", "error")}
+        self.dispatcher = QueueDispatcher(self.root, self.queue, handlers, budget_ms=30)
+        self.dispatcher.start()
+        
+    def test_coalesce_messages(self):
+        """Test accorpamento: ultimo stato, id uniti, risultati query tutti in ordine"""
+        messages = [("update_status", "a"), ("orders_changed", [1, 2]), ("query_result", 1),
+                    ("update_status", "b"), ("orders_changed", [3]), ("query_result", 2)]
+        self.assertEqual(coalesce_messages(messages, ("update_status",), ("orders_changed",)),
+                         [("query_result", 1), ("update_status", "b"), ("orders_changed", [1, 2, 3]), ("query_result", 2)])
+        
+    def test_put_wakes_dispatcher_once(self):
+        """Test risveglio: un solo evento per una raffica di messaggi, nessun polling periodico"""
+        for i in range(50): self.queue.put(("update_status", f"Export {i}/50"))
+        self.queue.put(("orders_changed", [1])); self.queue.put(("orders_changed", [2]))
+        self.assertEqual(len(self.root.generated), 1)
+        self.root.run_pending()
+        self.assertEqual(self.handled, [("update_status", "Export 49/50"), ("orders_changed", [1, 2])])
+        self.assertEqual(self.dispatcher.ticks, 1)
+        self.assertTrue(all(ms >= 1000 for ms, _ in self.root.scheduled))  # resta solo il controllo di riserva
+        self.queue.put(("error", "x"))
+        self.assertEqual(len(self.root.generated), 2)
+        
+    def test_budget_splits_work_across_ticks(self):
+        """Test budget: i messaggi oltre il limite passano ai cicli successivi senza perdersi"""
+        self.dispatcher.handlers["query_result"] = lambda data: (time.sleep(0.02), self.handled.append(("query_result", data)))
+        for i in range(6): self.queue.put(("query_result", i))
+        self.root.run_pending()
+        self.assertEqual([data for _, data in self.handled], list(range(6)))
+        self.assertGreaterEqual(self.dispatcher.ticks, 3)
+        
+    def test_handler_error_does_not_stop_dispatch(self):
+        """Test errore in un gestore: gli altri messaggi vengono comunque consegnati"""
+        self.dispatcher.handlers["error"] = Mock(side_effect=RuntimeError("boom"))
+        self.queue.put(("error", "x")); self.queue.put(("update_status", "ok"))
+        self.root.run_pending()
+        self.assertEqual(self.handled, [("update_status", "ok")])
+        
+    def test_fallback_poll_without_event_support(self):
+        """Test Tcl senza event_generate da altri thread: il controllo di riserva consegna i messaggi"""
+        self.root.event_generate = Mock(side_effect=RuntimeError("main thread is not in main loop"))
+        self.queue.put(("update_status", "x"))
+        self.assertEqual(self.handled, [])
+        self.assertEqual(self.root.run_pending(), 0)
+        fallback = [callback for ms, callback in self.root.scheduled if ms >= 1000]
+        self.root.scheduled.clear()
+        for callback in fallback: callback()
+        self.root.run_pending()
+        self.assertEqual(self.handled, [("update_status", "x")])
+        
+class TestOrderAnalytics(unittest.TestCase):
+    """Test statistiche vettoriali e confronti col periodo precedente"""
+    
+    def setUp(self):
+        from order_analytics import OrderAnalytics
+        self.today = datetime(2025, 3, 31).date()
+        day = lambda offset: (self.today - timedelta(days=offset)).strftime('%Y-%m-%dT10:00:00')
+        orders = [
+            {'status': 'completed', 'total': '100.00', 'date_created': day(0), 'line_items': [{'name': 'Gita Roma', 'quantity': 2}]},
+            {'status': 'processing', 'total': '50.00', 'date_created': day(3), 'line_items': '[{"name": "Tour Dolomiti", "quantity": 5}]'},
+            {'status': 'completed', 'total': '30.00', 'date_created': day(9), 'line_items': [{'name': 'Gita Roma', 'quantity': 1}]},
+            {'status': 'completed', 'total': '60.00', 'date_created': day(12), 'line_items': []},
+            {'status': 'cancelled', 'total': '40.00', 'date_created': day(13), 'line_items': []},
+            {'status': 'pending', 'total': 'n/a', 'date_created': '', 'line_items': None},
+        ]
+        self.analytics = OrderAnalytics.from_orders(orders)
+        
+    def test_period_comparison(self):
+        """Test variazioni reali di ordini, fatturato, ordine medio e completamento"""
+        kpi = self.analytics.period_comparison(7, self.today)
+        self.assertEqual((kpi['current']['orders'], kpi['current']['revenue']), (2, 150.0))
+        self.assertEqual((kpi['previous']['orders'], kpi['previous']['revenue']), (3, 130.0))
+        self.assertAlmostEqual(kpi['orders_change'], -100 / 3)
+        self.assertAlmostEqual(kpi['revenue_change'], 20 / 130 * 100)
+        self.assertAlmostEqual(kpi['avg_order_change'], (75 - 130 / 3) / (130 / 3) * 100)
+        self.assertAlmostEqual(kpi['completion_rate_change'], 50 - 200 / 3)
+        empty = self.analytics.period_comparison(7, self.today + timedelta(days=30))
+        self.assertIsNone(empty['revenue_change'])
+        
+    def test_series_and_distribution(self):
+        """Test distribuzione stati, serie giornaliera e settimanale, prodotti più venduti"""
+        self.assertEqual(self.analytics.status_distribution(), {'completed': 3, 'processing': 1, 'cancelled': 1, 'pending': 1})
+        self.assertEqual(self.analytics.daily_series('2025-03-25'), {'2025-03-28': 1, '2025-03-31': 1})
+        self.assertEqual(self.analytics.weekly_series(), {'2025-03-17': {'orders': 3, 'revenue': 130.0},
+                                                          '2025-03-24': {'orders': 1, 'revenue': 50.0},
+                                                          '2025-03-31': {'orders': 1, 'revenue': 100.0}})
+        self.assertEqual(list(self.analytics.top_products(1).items()), [('Tour Dolomiti', 5)])
+        self.assertEqual(self.analytics.top_products(5, '2025-03-30'), {'Gita Roma': 2})
+        
+    def test_summary_matches_stats_format(self):
+        """Test riepilogo nel formato di get_order_stats, con valori Python serializzabili"""
+        stats = self.analytics.summary(7, period_days=7, today=self.today)
+        self.assertEqual(stats['total_orders'], 2)
+        self.assertEqual(stats['by_status'], {'completed': 1, 'processing': 1})
+        self.assertEqual(stats['kpi']['pending_orders'], 1)
+        self.assertEqual(self.analytics.summary(today=self.today)['total_orders'], 6)
+        json.dumps(stats)
+        
+    def test_database_stats_include_kpi(self):
+        """Test get_order_stats: confronto sugli aggregati giornalieri del database"""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db = DatabaseManager(db_path=os.path.join(tmp_dir, 'test.db'))
+            now = datetime.now()
+            orders = [{'id': i, 'status': 'completed', 'total': '10.00', 'line_items': [{'name': 'Gita Roma', 'quantity': 1}],
+                       'date_created': (now - timedelta(days=offset)).strftime('%Y-%m-%dT%H:%M:%S'), 'date_modified': now.strftime('%Y-%m-%dT%H:%M:%S')}
+                      for i, offset in enumerate([0, 1, 40], start=1)]
+            db.sync_multiple_orders(orders)
+            kpi = db.get_order_stats()['kpi']
+            db.close()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.assertEqual((kpi['current']['orders'], kpi['previous']['orders']), (2, 1))
+        self.assertEqual(kpi['orders_change'], 100.0)
+        
+class TestOrderFingerprint(unittest.TestCase):
+    """Test impronte ordine condivise da database locale e Supabase"""
+    
+    def setUp(self):
+        self.order = {'id': 1, 'status': 'processing', 'total': '10.00', 'date_modified': '2025-01-01T12:00:00', 'payment_method': 'stripe',
+                      'billing': {'first_name': 'Mario'}, 'line_items': [{'name': 'Gita Roma', 'quantity': 1}], 'shipping_lines': []}
+        
+    def test_encode_order_single_pass(self):
+        """Test colonne JSON identiche a json.dumps e impronta uguale a quella calcolata da sola"""
+        from order_fingerprint import encode_order, fingerprint
+        encoded = encode_order(self.order)
+        self.assertEqual([json.loads(value) for value in (encoded.billing_data, encoded.shipping_data, encoded.line_items, encoded.shipping_lines, encoded.raw_data)],
+                         [self.order['billing'], {}, self.order['line_items'], [], self.order])
+        self.assertEqual(encoded.fingerprint, fingerprint(self.order))
+        self.assertEqual(len(encoded.fingerprint), 32)
+        
+    def test_fingerprint_fields(self):
+        """Test impronta sensibile ai campi significativi (None, '' e 0 distinti), non agli altri"""
+        from order_fingerprint import fingerprint
+        base = fingerprint(self.order)
+        for field, value in [('status', 'completed'), ('total', '11.00'), ('date_modified', None), ('payment_method', ''),
+                             ('line_items', [{'name': 'Gita Roma', 'quantity': 2}]), ('shipping_lines', [{'method_id': 'flat_rate'}])]:
+            self.assertNotEqual(fingerprint(dict(self.order, **{field: value})), base, field)
+        self.assertNotEqual(fingerprint(dict(self.order, total=None)), fingerprint(dict(self.order, total='')))
+        self.assertEqual(fingerprint(dict(self.order, billing={'first_name': 'Luca'}, customer_note='x')), base)
+        
+    def test_same_revision(self):
+        """Test fast path: stessa date_modified e stesso stato; senza date_modified si calcola sempre l'impronta"""
+        from order_fingerprint import same_revision
+        self.assertTrue(same_revision(self.order, '2025-01-01T12:00:00', 'processing'))
+        self.assertFalse(same_revision(self.order, '2025-01-01T11:00:00', 'processing'))
+        self.assertFalse(same_revision(self.order, '2025-01-01T12:00:00', 'completed'))
+        self.assertFalse(same_revision(dict(self.order, date_modified=None), None, 'processing'))
+        
+    def test_older_revision(self):
+        """Test copia più vecchia: solo date_modified strettamente precedenti e confrontabili"""
+        from order_fingerprint import older_revision
+        self.assertTrue(older_revision('2025-01-01T11:00:00', '2025-01-01T12:00:00'))
+        self.assertFalse(older_revision('2025-01-01T12:00:00', '2025-01-01T12:00:00'))
+        self.assertFalse(older_revision('2025-01-02T00:00:00', '2025-01-01T12:00:00'))
+        self.assertFalse(older_revision(None, '2025-01-01T12:00:00'))
+        self.assertFalse(older_revision('2025-01-01T11:00:00+00:00', '2025-01-01T12:00:00'))  # fusi orari diversi: non confrontabili
+        self.assertFalse(older_revision('ieri', '2025-01-01T12:00:00'))
+        
+    def test_dumps_without_orjson(self):
+        """Test senza orjson: stesso JSON di json.dumps"""
+        import order_fingerprint
+        with patch.object(order_fingerprint, 'orjson', None):
+            self.assertEqual(order_fingerprint.dumps(self.order), json.dumps(self.order))
+            
+    def test_managers_agree(self):
+        """Test stesso hash_signature nel database locale e su Supabase"""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db = DatabaseManager(db_path=os.path.join(tmp_dir, 'test.db'))
+            db.sync_multiple_orders([self.order])
+            with db.connections.reader() as conn:
+                stored = conn.execute('SELECT hash_signature FROM orders WHERE woo_id = 1').fetchone()[0]
+            db.close()
+            self.assertEqual(stored, SupabaseManager()._calculate_order_hash(self.order))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            
+class TestSyncPipeline(TempDatabaseTestCase):
+    """Test pipeline fetch → preparazione → scrittura → notifica della sincronizzazione completa"""
+    
+    def _page(self, first, count=10, status='processing'):
+        return [{'id': woo_id, 'number': str(woo_id), 'status': status, 'total': '10.00', 'date_created': '2025-01-01T10:00:00',
+                 'date_modified': f'2025-01-01T12:00:00-{status}', 'billing': {'first_name': 'Mario', 'last_name': 'Rossi'},
+                 'line_items': [{'name': 'Gita Roma', 'quantity': 1}]} for woo_id in range(first, first + count)]
+        
+    def test_pages_written_and_notified(self):
+        """Test pagine scritte come con sync_multiple_orders, avanzamento e woo_id modificati notificati, statistiche per stadio"""
+        from sync_pipeline import SyncPipeline
+        self.db.sync_multiple_orders(self._page(1, 5))
+        progress, changed = [], []
+        pipeline = SyncPipeline(self.db, on_progress=progress.append, on_changed=changed.extend, workers=3, queue_pages=2, write_batch=25).start()
+        for first in range(1, 100, 10):
+            pipeline.submit(self._page(first, status='completed' if first == 1 else 'processing'))
+        result = pipeline.finish()
+        self.assertEqual((len(result.inserted_ids), len(result.updated_ids)), (95, 5))
+        self.assertEqual(sorted(changed), list(range(1, 101)))
+        self.assertEqual(progress[-1], 100)
+        self.assertEqual(self.db.count_orders(), 100)
+        self.assertEqual(self.db.count_orders({'status': 'completed'}), 10)
+        report = pipeline.report()
+        self.assertEqual({name: report[name]['orders'] for name in ('fetch', 'transform', 'write', 'notify')}, dict.fromkeys(('fetch', 'transform', 'write', 'notify'), 100))
+        self.assertTrue(all(report[name]['orders_per_sec'] > 0 for name in ('transform', 'write')))
+        
+    def test_backpressure(self):
+        """Test code limitate: con il writer bloccato il fetch si ferma invece di accumulare pagine"""
+        from sync_pipeline import SyncPipeline
+        release = threading.Event()
+        write = self.db.write_prepared_orders
+        def slow_write(prepared, sync_state=None, raise_errors=False):
+            release.wait(5); return write(prepared, sync_state, raise_errors)
+        submitted = []
+        with patch.object(self.db, 'write_prepared_orders', side_effect=slow_write):
+            pipeline = SyncPipeline(self.db, workers=1, queue_pages=1, write_batch=10).start()
+            def fetch():
+                for first in range(1, 200, 10):
+                    pipeline.submit(self._page(first)); submitted.append(first)
+            fetcher = threading.Thread(target=fetch); fetcher.start()
+            time.sleep(0.5)
+            # writer (1 in scrittura) + coda scrittura (1) + worker (1) + coda preparazione (1) + 1 in submit
+            self.assertLessEqual(len(submitted), 5)
+            release.set(); fetcher.join(10)
+            self.assertEqual(len(submitted), 20)
+            self.assertEqual(len(pipeline.finish().inserted_ids), 200)
+        
+    def test_pages_written_in_download_order(self):
+        """Test pagine preparate fuori ordine: la copia di un ordine scaricata per prima non sovrascrive quella più recente"""
+        from sync_pipeline import SyncPipeline
+        prepare = self.db.prepare_orders
+        def slow_prepare(orders, revisions=None):
+            if orders[0]['status'] == 'processing': time.sleep(0.3)  # la pagina con la copia vecchia finisce per ultima
+            return prepare(orders, revisions)
+        with patch.object(self.db, 'prepare_orders', side_effect=slow_prepare):
+            pipeline = SyncPipeline(self.db, workers=2, queue_pages=2, write_batch=1).start()
+            pipeline.submit([make_order(1, 'processing', '2025-01-01T12:00:00')])
+            pipeline.submit([make_order(1, 'completed', '2025-01-01T12:05:00'), make_order(2)])
+            pipeline.finish()
+        self.assertEqual(self.db.get_order(1)['status'], 'completed')
+        self.assertEqual(self.db.count_orders(), 2)
+        
+    def test_stage_error_stops_fetch(self):
+        """Test errore nella preparazione: il fetch viene interrotto e finish solleva l'errore"""
+        from sync_pipeline import SyncPipeline
+        pipeline = SyncPipeline(self.db, workers=1, queue_pages=1)
+        with patch.object(self.db, 'prepare_orders', side_effect=ValueError("ordine non valido")):
+            pipeline.start()
+            with self.assertRaises(ValueError):
+                for first in range(1, 1000, 10): pipeline.submit(self._page(first))
+            with self.assertRaises(ValueError): pipeline.finish()
+        self.assertEqual(self.db.count_orders(), 0)
+        
+    def test_write_error_fails_pipeline(self):
+        """Test errore di scrittura SQLite: lo stadio write fallisce, le pagine successive non vengono scritte e finish solleva l'errore"""
+        import sqlite3
+        from contextlib import contextmanager
+        from sync_pipeline import SyncPipeline
+        @contextmanager
+        def full_disk():
+            raise sqlite3.OperationalError("database or disk is full")
+            yield
+        with patch.object(self.db.connections, 'writer', side_effect=full_disk):
+            self.assertEqual(tuple(self.db.sync_multiple_orders(self._page(1))), (0, 0))  # percorso interattivo: errore stampato, risultato vuoto
+            pipeline = SyncPipeline(self.db, workers=1, queue_pages=1, write_batch=10).start()
+            with self.assertRaises(sqlite3.OperationalError):
+                for first in range(1, 1000, 10): pipeline.submit(self._page(first))
+            with self.assertRaises(sqlite3.OperationalError): pipeline.finish()
+        self.assertEqual(pipeline.failed_stage, 'write')
+        self.assertTrue(self.db.sync_idle.is_set())
+        self.assertEqual(self.db.count_orders(), 0)
+        
+class TestExportScheduler(TempDatabaseTestCase):
+    """Test export pianificati: espressioni cron, export incrementali e registro export_logs"""
+    
+    def setUp(self):
+        super().setUp()
+        self.db.sync_multiple_orders([make_order(woo_id, date_modified=f'2025-03-01T10:{woo_id:02d}:00') for woo_id in range(1, 11)])
+        self.scheduled = []
+        self.export_manager = ExportManager(self.db, on_scheduled_export=lambda name, result: self.scheduled.append((name, result)))
+        self.export_manager.exports_dir = self.tmp_dir
+        
+    def tearDown(self):
+        self.export_manager.stop_scheduler()
+        super().tearDown()
+        
+    def _exported_ids(self, result):
+        with open(result.file_path, encoding='utf-8-sig') as csvfile:
+            return sorted(int(line.split(',')[0]) for line in csvfile.read().splitlines()[1:])
+        
+    def test_cron_next_run(self):
+        """Test prossima esecuzione: orari fissi, passi, giorni feriali, 29 febbraio ed espressioni non valide"""
+        from export_manager import CronSchedule
+        sunday = datetime(2026, 10, 18, 9, 7, 30)
+        self.assertEqual(CronSchedule('0 0 * * *').next_run(sunday), datetime(2026, 10, 19, 0, 0))
+        self.assertEqual(CronSchedule('*/15 8-18 * * *').next_run(sunday), datetime(2026, 10, 18, 9, 15))
+        self.assertEqual(CronSchedule('30 6 * * 1-5').next_run(sunday), datetime(2026, 10, 19, 6, 30))
+        self.assertEqual(CronSchedule('0 22 * * 0,6').next_run(datetime(2026, 10, 18, 22, 0)), datetime(2026, 10, 24, 22, 0))
+        self.assertEqual(CronSchedule('0 12 29 2 *').next_run(sunday), datetime(2028, 2, 29, 12, 0))
+        self.assertEqual(CronSchedule('0 0 1 * 1').next_run(sunday), datetime(2026, 10, 19, 0, 0))  # giorno 1 oppure lunedì
+        for expression in ('0 0 * *', '60 0 * * *', '0 0 * * 1-9', 'a b c d e'):
+            with self.assertRaises(ValueError): CronSchedule(expression)
+        with self.assertRaises(ValueError): CronSchedule('0 0 31 2 *').next_run(sunday)
+        
+    def test_load_schedules_skips_invalid(self):
+        """Test pianificazioni da configurazione: disattivate e non valide ignorate, predefinita a mezzanotte"""
+        self.assertEqual([entry['name'] for entry, _ in self.export_manager.load_schedules()], ['giornaliero'])
+        schedules = [{'name': 'ok', 'cron': '0 3 * * *'}, {'name': 'spenta', 'cron': '0 3 * * *', 'enabled': False}, {'name': 'rotta', 'cron': '0 25 * * *'}, {'cron': '0 3 * * *'}]
+        with patch.dict(config.config, {'export': {'schedules': schedules}}):
+            self.assertEqual([entry['name'] for entry, _ in self.export_manager.load_schedules()], ['ok'])
+        
+    def test_incremental_export(self):
+        """Test export incrementale: prima tutto, poi nulla, poi solo gli ordini modificati o nuovi; registro in export_logs"""
+        entry = {'name': 'notte', 'cron': '0 0 * * *'}
+        first = self.export_manager.run_scheduled_export(entry)
+        self.assertTrue(first.success)
+        self.assertEqual(self._exported_ids(first), list(range(1, 11)))
+        self.assertEqual((first.sync_seq_from, first.sync_seq_to), (0, 10))
+        empty = self.export_manager.run_scheduled_export(entry)
+        self.assertEqual((empty.success, empty.total_records, empty.file_path), (True, 0, ''))
+        self.db.sync_multiple_orders([make_order(3, date_modified='2025-03-02T08:00:00'), make_order(7, date_modified='2025-03-02T09:00:00'), make_order(11, date_modified='2025-03-02T10:00:00')])
+        third = self.export_manager.run_scheduled_export(entry)
+        self.assertEqual(self._exported_ids(third), [3, 7, 11])
+        self.assertEqual((third.sync_seq_from, third.sync_seq_to), (10, 13))
+        last = self.db.get_last_export('notte')
+        self.assertEqual((last['file_name'], last['total_records'], last['sync_seq']), (third.file_name, 3, 13))
+        self.assertEqual([name for name, _ in self.scheduled], ['notte'] * 3)
+        full = self.export_manager.run_scheduled_export({'name': 'completo', 'incremental': False})
+        self.assertEqual(self._exported_ids(full), list(range(1, 12)))
+        
+    def test_failed_export_keeps_watermark(self):
+        """Test export fallito registrato come errore: il successivo riparte dallo stesso punto"""
+        entry = {'name': 'notte'}
+        self.export_manager.run_scheduled_export(entry)
+        self.db.sync_multiple_orders([make_order(5, date_modified='2025-04-01T00:00:00')])
+        with patch.object(self.export_manager, '_export_csv', side_effect=OSError("disco pieno")):
+            failed = self.export_manager.run_scheduled_export(entry)
+        self.assertFalse(failed.success)
+        self.assertIn('disco pieno', self.db.get_last_export('notte', status='error')['error_message'])
+        retry = self.export_manager.run_scheduled_export(entry)
+        self.assertEqual(retry.sync_seq_from, 10)
+        self.assertEqual(self._exported_ids(retry), [5])
+        
+    def test_late_order_with_old_date_modified(self):
+        """Test ordine sincronizzato dopo l'export con una date_modified più vecchia del punto di ripresa: esportato comunque"""
+        entry = {'name': 'notte'}
+        self.export_manager.run_scheduled_export(entry)
+        self.db.sync_multiple_orders([make_order(12, date_modified='2025-02-01T00:00:00'), make_order(4, 'completed', '2025-03-01T10:04:00')])
+        self.assertEqual(self._exported_ids(self.export_manager.run_scheduled_export(entry)), [4, 12])
+        
+    def test_scheduler_catches_up_missed_run(self):
+        """Test thread di pianificazione: esecuzione saltata dall'ultimo export lanciata subito, stop immediato"""
+        self.db.log_export('notte', '', '', 0)
+        with self.db.connections.writer() as conn:
+            conn.execute("UPDATE export_logs SET created_at = '2020-01-01T00:00:00'")
+        with patch.dict(config.config, {'export': {'schedules': [{'name': 'notte', 'cron': '0 0 * * *'}]}}):
+            self.export_manager.start_scheduler()
+            deadline = time.time() + 10
+            while not self.scheduled and time.time() < deadline: time.sleep(0.05)
+        self.assertEqual(self.scheduled[0][0], 'notte')
+        self.assertEqual(self.scheduled[0][1].total_records, 10)
+        start = time.time()
+        self.export_manager.stop_scheduler()
+        self.assertLess(time.time() - start, 2)
+        self.assertIsNone(self.export_manager.scheduler_thread)
+        
+    def test_background_export_yields_to_sync(self):
+        """Test export pianificato in background: tra un blocco e l'altro attende la scrittura in corso della sincronizzazione"""
+        self.db.sync_idle.clear()  # scrittura della sincronizzazione in corso
+        threading.Timer(0.3, self.db.sync_idle.set).start()
+        start = time.time()
+        with patch.dict(config.config, {'export': {'fetch_size': 4}}):
+            result = self.export_manager._export_csv(None, 'prova', background=True)
+        self.assertGreaterEqual(time.time() - start, 0.25)
+        self.assertEqual(result.total_records, 10)
+        self.db.sync_multiple_orders([make_order(11)])
+        self.assertTrue(self.db.sync_idle.is_set())
+        
 class TestExportManager(unittest.TestCase):
     """Test Export Manager"""
     
@@ -271,7 +1911,23 @@ def run_tests():
     # Aggiungi test cases
     suite.addTests(loader.loadTestsFromTestCase(TestConfig))
     suite.addTests(loader.loadTestsFromTestCase(TestWooCommerceManager))
+    suite.addTests(loader.loadTestsFromTestCase(TestWooCommercePaging))
+    suite.addTests(loader.loadTestsFromTestCase(TestPooledHttpSession))
+    suite.addTests(loader.loadTestsFromTestCase(TestDeltaPolling))
+    suite.addTests(loader.loadTestsFromTestCase(TestWebhookServer))
+    suite.addTests(loader.loadTestsFromTestCase(TestTravelerCache))
     suite.addTests(loader.loadTestsFromTestCase(TestSupabaseManager))
+    suite.addTests(loader.loadTestsFromTestCase(TestSupabasePostgres))
+    suite.addTests(loader.loadTestsFromTestCase(TestSupabaseReplication))
+    suite.addTests(loader.loadTestsFromTestCase(TestDatabaseManager))
+    suite.addTests(loader.loadTestsFromTestCase(TestQueryExecutor))
+    suite.addTests(loader.loadTestsFromTestCase(TestOrdersViewQueries))
+    suite.addTests(loader.loadTestsFromTestCase(TestDashboardCharts))
+    suite.addTests(loader.loadTestsFromTestCase(TestUIDispatcher))
+    suite.addTests(loader.loadTestsFromTestCase(TestOrderAnalytics))
+    suite.addTests(loader.loadTestsFromTestCase(TestOrderFingerprint))
+    suite.addTests(loader.loadTestsFromTestCase(TestSyncPipeline))
+    suite.addTests(loader.loadTestsFromTestCase(TestExportScheduler))
     suite.addTests(loader.loadTestsFromTestCase(TestExportManager))
     suite.addTests(loader.loadTestsFromTestCase(IntegrationTest))
     
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prefetch dei dati viaggiatori per Gestionale Gitemania
+Riempie in background la cache SQLite dei viaggiatori dopo ogni sincronizzazione
+Sviluppato da TechExpresso
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config import config
+
+def normalize_travelers(data) -> Optional[List[Dict]]:
+    """Risposta dell'endpoint viaggiatori come lista di dizionari (None se non interpretabile)."""
+    if isinstance(data, dict): data = [data]
+    if isinstance(data, list): return [t for t in data if isinstance(t, dict)]
+    return None
+
+class TravelerPrefetcher:
+    """
+    Scarica i viaggiatori degli ordini non ancora in cache (o modificati dopo l'ultimo download),
+    con al massimo `concurrency` richieste contemporanee sulla sessione HTTP condivisa.
+    """
+    CHUNK_SIZE = 50  # richieste salvate in cache per ogni transazione
+
+    def __init__(self, woo_manager, database_manager, concurrency: int = None):
+        self.woo_manager = woo_manager
+        self.database_manager = database_manager
+        self.concurrency = concurrency or config.get('app', 'traveler_prefetch_concurrency', 4)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._pending = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def schedule(self):
+        """Richiede un giro di prefetch; se uno è già in corso ne segue un altro alla sua fine."""
+        with self._lock:
+            self._pending.set()
+            if self.running: return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name='traveler-prefetch')
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread: self._thread.join(timeout=10)
+
+    def wait(self, timeout: float = None) -> bool:
+        """Attende la fine del prefetch in corso (True se terminato)."""
+        thread = self._thread
+        if thread: thread.join(timeout)
+        return not self.running
+
+    def fetch_and_cache(self, woo_id: int, date_modified: str) -> Optional[List[Dict]]:
+        """Scarica i viaggiatori di un ordine e li salva in cache (None se la richiesta fallisce: salvata come voce negativa)."""
+        travelers = normalize_travelers(self.woo_manager.get_viaggiatori_for_order(woo_id))
+        self.database_manager.save_cached_travelers([(woo_id, date_modified, travelers)])
+        return travelers
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending.is_set() or self._stop_event.is_set():
+                    self._thread = None  # sotto lock: uno schedule() successivo avvia un nuovo thread
+                    return
+                self._pending.clear()
+            try:
+                self._prefetch_missing()
+            except Exception as e:
+                print(f"❌ Errore nel prefetch dei dati viaggiatori: {e}")
+
+    def _prefetch_missing(self):
+        if not self.woo_manager.api: return
+        missing = self.database_manager.get_orders_missing_travelers(failed_retry_hours=config.get('app', 'traveler_retry_hours', 24))
+        if not missing: return
+        print(f"✈️ Prefetch dati viaggiatori per {len(missing)} ordini...")
+        cached = failed = 0
+
+        def fetch(entry):
+            if self._stop_event.is_set(): return None
+            woo_id, date_modified = entry
+            return woo_id, date_modified, normalize_travelers(self.woo_manager.get_viaggiatori_for_order(woo_id))
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='traveler-fetch') as executor:
+            for start in range(0, len(missing), self.CHUNK_SIZE):
+                if self._stop_event.is_set(): break
+                # Gli ordini falliti restano in cache come voce negativa: ritentati quando cambiano o dopo traveler_retry_hours
+                entries = [entry for entry in executor.map(fetch, missing[start:start + self.CHUNK_SIZE]) if entry]
+                self.database_manager.save_cached_travelers(entries)
+                failed += sum(1 for entry in entries if entry[2] is None)
+                cached += len(entries)
+        print(f"✅ Dati viaggiatori in cache per {cached - failed}/{len(missing)} ordini ({failed} non disponibili)")
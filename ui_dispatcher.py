@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dispatcher dei messaggi verso l'interfaccia per Gestionale Gitemania
+Sveglia il thread Tk solo quando arriva un messaggio, accorpa i messaggi ridondanti e limita il lavoro per ciclo
+Sviluppato da TechExpresso
+"""
+
+import queue, threading, time
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+WAKEUP_EVENT = "<<UIQueueMessage>>"
+
+class UIQueue(queue.Queue):
+    """queue.Queue che, a ogni put, chiede al dispatcher di svegliare il thread Tk."""
+
+    def __init__(self):
+        super().__init__()
+        self.notify: Callable[[], None] = lambda: None
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        self.notify()
+
+def coalesce_messages(messages: List[Tuple[str, object]], keep_last=(), merge=()) -> List[Tuple[str, object]]:
+    """
+    Accorpa i messaggi per tipo: per i tipi in keep_last resta solo l'ultimo, per quelli in merge
+    i dati (liste) vengono concatenati nell'ultimo. Gli altri messaggi restano tutti, nell'ordine di arrivo.
+    """
+    last_index, merged = {}, {}
+    for index, (msg_type, data) in enumerate(messages):
+        if msg_type in keep_last or msg_type in merge: last_index[msg_type] = index
+        if msg_type in merge: merged.setdefault(msg_type, []).extend(data or [])
+    result = []
+    for index, (msg_type, data) in enumerate(messages):
+        if msg_type in last_index:
+            if last_index[msg_type] != index: continue
+            if msg_type in merge: data = merged[msg_type]
+        result.append((msg_type, data))
+    return result
+
+class QueueDispatcher:
+    """
+    Consegna i messaggi di UIQueue agli handler nel thread Tk. Il risveglio avviene con un evento virtuale
+    generato dal produttore (un solo evento finché il precedente non è stato servito); un controllo lento
+    di riserva copre le build Tcl che non accettano event_generate da altri thread.
+    Ogni ciclo lavora al massimo budget_ms: il resto passa al ciclo successivo dopo gli eventi dell'interfaccia.
+    """
+    KEEP_LAST = ("update_status", "refresh_view", "sync_finished", "sync_complete", "replication_status")
+    MERGE = ("orders_changed",)
+    MAX_DRAIN = 1000  # messaggi letti dalla coda per ciclo prima di accorparli
+
+    def __init__(self, root, message_queue: UIQueue, handlers: Dict[str, Callable], budget_ms: int = 30, fallback_ms: int = 1000):
+        self.root = root
+        self.queue = message_queue
+        self.handlers = handlers
+        self.budget = budget_ms / 1000
+        self.fallback_ms = fallback_ms
+        self.backlog = deque()
+        self._wakeup_pending = threading.Event()
+        self._tick_scheduled = False
+        self.ticks = 0
+
+    def start(self):
+        self.root.bind(WAKEUP_EVENT, lambda event: self._schedule_tick())
+        self.queue.notify = self._notify
+        self.root.after(self.fallback_ms, self._fallback_poll)
+        if not self.queue.empty(): self._schedule_tick()
+
+    def _notify(self):
+        # Chiamato da qualsiasi thread: al massimo un evento di risveglio in attesa alla volta
+        if self._wakeup_pending.is_set(): return
+        self._wakeup_pending.set()
+        try:
+            self.root.event_generate(WAKEUP_EVENT, when="tail")
+        except Exception:
+            pass  # Tcl senza supporto thread o finestra chiusa: ci pensa il controllo di riserva
+
+    def _fallback_poll(self):
+        if not self.queue.empty() or self.backlog: self._schedule_tick()
+        self.root.after(self.fallback_ms, self._fallback_poll)
+
+    def _schedule_tick(self):
+        if self._tick_scheduled: return
+        self._tick_scheduled = True
+        self.root.after_idle(self._tick)
+
+    def _tick(self):
+        self._tick_scheduled = False
+        self._wakeup_pending.clear()
+        self.ticks += 1
+        messages = list(self.backlog); self.backlog.clear()
+        for _ in range(self.MAX_DRAIN):
+            try: messages.append(self.queue.get_nowait())
+            except queue.Empty: break
+        pending = deque(coalesce_messages(messages, self.KEEP_LAST, self.MERGE))
+        start = time.perf_counter()
+        while pending:
+            msg_type, data = pending.popleft()
+            handler = self.handlers.get(msg_type)
+            try:
+                if handler: handler(data)
+                else: print(f"⚠️ Messaggio senza gestore: {msg_type}")
+            except Exception as e:
+                print(f"❌ Errore gestione messaggio '{msg_type}': {e}")
+            if time.perf_counter() - start >= self.budget: break
+        self.backlog.extend(pending)
+        # Arretrato o coda non vuota: altro ciclo dopo che Tk ha gestito input e ridisegni
+        if self.backlog or not self.queue.empty():
+            self._tick_scheduled = True
+            self.root.after(1, self._tick)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ricevitore Webhook WooCommerce per Gestionale Gitemania
+Riceve order.created/order.updated in push, verifica la firma HMAC e salva gli ordini a blocchi
+Sviluppato da TechExpresso
+"""
+
+import base64, hashlib, hmac, json, threading, time
+from typing import Callable, Dict, List, Optional
+from flask import Flask, request
+from waitress.server import create_server
+from config import config
+
+SUPPORTED_TOPICS = ('order.created', 'order.updated')
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """Firma WooCommerce: base64(HMAC-SHA256(secret, corpo della richiesta))."""
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+class OrderBatcher:
+    """
+    Accoda gli ordini ricevuti e li consegna a on_batch ogni flush_interval_ms oppure appena
+    raggiunge max_orders; più consegne dello stesso ordine nella finestra diventano una sola (l'ultima).
+    """
+    def __init__(self, on_batch: Callable[[List[Dict]], None], max_orders: int = 50, flush_interval_ms: int = 500):
+        self.on_batch = on_batch
+        self.max_orders = max_orders
+        self.flush_interval = flush_interval_ms / 1000
+        self.last_error: Optional[Exception] = None
+        self._pending: Dict[int, Dict] = {}
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name='webhook-batcher')
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread: self._thread.join(timeout=5)
+        self._flush()  # consegna quanto rimasto in coda
+
+    def put(self, order: Dict):
+        with self._condition:
+            self._pending[order.get('id')] = order
+            if len(self._pending) >= self.max_orders: self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while self._running and len(self._pending) < self.max_orders:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0: break
+                    self._condition.wait(remaining)
+                if not self._running: return
+            self._flush()
+
+    def _flush(self):
+        with self._condition:
+            batch, self._pending = list(self._pending.values()), {}
+        if not batch: return
+        try:
+            self.on_batch(batch)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = e
+            print(f"❌ Errore salvataggio ordini da webhook: {e}")
+
+class WebhookServer:
+    """Endpoint HTTP embedded (waitress) per i webhook WooCommerce degli ordini."""
+
+    def __init__(self, secret: str, on_batch: Callable[[List[Dict]], None], host: str = None, port: int = None,
+                 max_orders: int = None, flush_interval_ms: int = None, path: str = '/webhooks/woocommerce'):
+        self.secret = secret
+        self.host = host or config.get('webhook', 'host', '0.0.0.0')
+        self.port = config.get('webhook', 'port', 8765) if port is None else port
+        self.path = path
+        self.health_window = config.get('webhook', 'health_window', 3600)
+        self.batcher = OrderBatcher(on_batch, max_orders or config.get('webhook', 'batch_max_orders', 50),
+                                    flush_interval_ms or config.get('webhook', 'batch_interval_ms', 500))
+        self.last_delivery_at: Optional[float] = None
+        self.rejected_deliveries = 0
+        self._server = None
+        self._thread = None
+        self.app = self._create_app()
+
+    def _create_app(self) -> Flask:
+        app = Flask(__name__)
+
+        @app.post(self.path)
+        def receive():
+            body = request.get_data()
+            signature = request.headers.get('X-WC-Webhook-Signature', '')
+            topic = request.headers.get('X-WC-Webhook-Topic', '')
+            if not topic:
+                # Ping inviato da WooCommerce alla creazione del webhook (corpo "webhook_id=N", senza firma)
+                return {'status': 'pong'}, 200
+            if not self.secret or not hmac.compare_digest(signature, sign_payload(body, self.secret)):
+                self.rejected_deliveries += 1
+                return {'status': 'invalid signature'}, 401
+            self.last_delivery_at = time.monotonic()
+            if topic not in SUPPORTED_TOPICS: return {'status': 'ignored'}, 202
+            try: order = json.loads(body)
+            except json.JSONDecodeError: return {'status': 'invalid payload'}, 400
+            if not isinstance(order, dict) or order.get('id') is None: return {'status': 'invalid payload'}, 400
+            self.batcher.put(order)
+            return {'status': 'queued'}, 202
+
+        return app
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def effective_port(self) -> int:
+        return self._server.effective_port if self._server else self.port
+
+    def is_healthy(self) -> bool:
+        """Webhook affidabili: server attivo, ultimo salvataggio riuscito e consegne firmate ricevute di recente."""
+        if not self.running or self.batcher.last_error is not None or self.last_delivery_at is None: return False
+        return time.monotonic() - self.last_delivery_at <= self.health_window
+
+    def start(self) -> bool:
+        if self.running: return True
+        try:
+            self._server = create_server(self.app, host=self.host, port=self.port, threads=4)
+        except Exception as e:
+            print(f"❌ Impossibile avviare il server webhook su {self.host}:{self.port}: {e}")
+            return False
+        self.batcher.start()
+        self._thread = threading.Thread(target=self._server.run, daemon=True, name='webhook-server')
+        self._thread.start()
+        print(f"📡 Server webhook in ascolto su {self.host}:{self.effective_port}{self.path}")
+        return True
+
+    def stop(self):
+        if self._server: self._server.close()
+        if self._thread: self._thread.join(timeout=5)
+        self.batcher.stop()
+        self._server = self._thread = None
+        print("⏹️ Server webhook fermato")
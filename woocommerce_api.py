@@ -3,23 +3,120 @@
 """
 Modulo WooCommerce API per Gestionale Gitemania (Versione Finale con Paginazione e Callback Real-time)
 """
-import threading, time, requests # Importa 'requests'
+import threading, time, queue, json, requests # Importa 'requests'
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Callable
-from woocommerce import API
+from urllib.parse import urlencode
+from requests.auth import HTTPBasicAuth
+import woocommerce
+from woocommerce.oauth import OAuth
 from config import config
+from http_client import create_session, mount_single_attempt
+
+def endpoint_url(base_url: str, endpoint: str, version: str = "wc/v3", wp_api: bool = True) -> str:
+    return f"{base_url.rstrip('/')}/{'wp-json' if wp_api else 'wc-api'}/{version}/{endpoint}"
+
+class API:
+    """
+    Client REST WooCommerce con le opzioni e l'autenticazione della libreria woocommerce (Basic su HTTPS,
+    OAuth 1.0a su HTTP), che invia le richieste attraverso la sessione HTTP condivisa (keep-alive,
+    compressione, retry). Della libreria usa solo la classe pubblica OAuth, non i suoi metodi privati.
+    """
+    def __init__(self, url, consumer_key, consumer_secret, session: requests.Session = None, **kwargs):
+        self.url = url
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.wp_api = kwargs.get("wp_api", True)
+        self.version = kwargs.get("version", "wc/v3")
+        self.is_ssl = url.startswith("https")
+        self.timeout = kwargs.get("timeout", 5)
+        self.verify_ssl = kwargs.get("verify_ssl", True)
+        self.query_string_auth = kwargs.get("query_string_auth", False)
+        self.user_agent = kwargs.get("user_agent", f"WooCommerce-Python-REST-API/{woocommerce.__version__}")
+        self.session = session or create_session()
+
+    def endpoint_url(self, endpoint: str) -> str:
+        return endpoint_url(self.url, endpoint, self.version, self.wp_api)
+
+    def request(self, method, endpoint, data=None, params=None, **kwargs):
+        params = dict(params or {})
+        url = self.endpoint_url(endpoint)
+        auth = None
+        headers = {"user-agent": f"{self.user_agent}", "accept": "application/json"}
+        if self.is_ssl and not self.query_string_auth:
+            auth = HTTPBasicAuth(self.consumer_key, self.consumer_secret)
+        elif self.is_ssl:
+            params.update({"consumer_key": self.consumer_key, "consumer_secret": self.consumer_secret})
+        else:
+            oauth = OAuth(url=f"{url}?{urlencode(params)}", consumer_key=self.consumer_key, consumer_secret=self.consumer_secret,
+                          version=self.version, method=method, oauth_timestamp=kwargs.pop("oauth_timestamp", int(time.time())))
+            url, params = oauth.get_oauth_url(), {}
+        if data is not None:
+            data = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            headers["content-type"] = "application/json;charset=utf-8"
+        return self.session.request(method=method, url=url, verify=self.verify_ssl, auth=auth, params=params,
+                                    data=data, timeout=self.timeout, headers=headers, **kwargs)
+
+    def get(self, endpoint, **kwargs): return self.request("GET", endpoint, None, **kwargs)
+    def post(self, endpoint, data, **kwargs): return self.request("POST", endpoint, data, **kwargs)
+    def put(self, endpoint, data, **kwargs): return self.request("PUT", endpoint, data, **kwargs)
+    def delete(self, endpoint, **kwargs): return self.request("DELETE", endpoint, None, **kwargs)
+    def options(self, endpoint, **kwargs): return self.request("OPTIONS", endpoint, None, **kwargs)
+
+class AdaptiveRateLimiter:
+    """
+    Distanzia l'avvio delle richieste condiviso tra più thread: l'intervallo raddoppia
+    quando il server risponde 429/5xx (rispettando Retry-After) e si riduce gradualmente sui successi.
+    """
+    def __init__(self, initial_interval: float = 0.1, min_interval: float = 0.0, max_interval: float = 10.0):
+        self.interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            self._next_slot = start + self.interval
+        if start > now: time.sleep(start - now)
+
+    def on_success(self):
+        with self._lock: self.interval = max(self.min_interval, self.interval * 0.8)
+
+    def on_throttle(self, retry_after: float = None):
+        with self._lock:
+            self.interval = min(self.max_interval, max(self.interval * 2, 0.25))
+            if retry_after: self._next_slot = max(self._next_slot, time.monotonic() + min(retry_after, self.max_interval * 6))
+
+class PageDownloadError(Exception):
+    """Errore di download di una pagina di ordini, con il numero della pagina fallita."""
+    def __init__(self, page: int, error: Exception):
+        super().__init__(str(error))
+        self.page = page
+        self.error = error
 
 class WooCommerceManager:
-    def __init__(self, on_order_update: Callable = None):
+    PAGE_RETRIES = 4
+    HIGH_WATER_MARK_KEY = 'orders_modified_after'
+    HIGH_WATER_MARK_OVERLAP = timedelta(seconds=1)  # riletture idempotenti: copre modifiche salvate nello stesso secondo
+    def __init__(self, on_order_update: Callable = None, state_store=None):
         self.api = None
         self.sync_running = False
-        self.on_order_update = on_order_update or (lambda orders: None)
+        self.on_order_update = on_order_update or (lambda orders, sync_state=None: None)
+        self.state_store = state_store  # DatabaseManager: persiste l'high-water mark tra un avvio e l'altro
+        self.webhook_server = None  # se attivo e sano il polling diventa una riconciliazione lenta
+        self.session = create_session()  # condivisa da tutte le chiamate WooCommerce, anche l'endpoint viaggiatori
         self.last_sync = datetime.now(timezone.utc) - timedelta(days=1)
         
     def initialize(self, base_url: str, consumer_key: str, consumer_secret: str) -> bool:
         try:
             self.api = API(url=base_url, consumer_key=consumer_key, consumer_secret=consumer_secret,
-                           version="wc/v3", timeout=60, verify_ssl=True)
+                           version="wc/v3", timeout=60, verify_ssl=True, session=self.session)
+            # Le pagine di ordini ritentano 429/5xx in _fetch_orders_page (rate limiter adattivo): niente retry della sessione sotto
+            mount_single_attempt(self.session, endpoint_url(base_url, 'orders'))
             response = self.api.get("system_status")
             response.raise_for_status()
             return True
@@ -41,15 +138,75 @@ class WooCommerceManager:
     def _polling_loop(self):
         while self.sync_running:
             try:
-                updated_orders = self.fetch_orders_since(self.last_sync)
-                if updated_orders:
-                    self.on_order_update(updated_orders)
-                    self.last_sync = datetime.now(timezone.utc)
-                time.sleep(config.get('app', 'sync_interval', 60))
+                self.poll_modified_orders()
+                time.sleep(self.poll_interval())
             except Exception as e:
                 print(f"❌ Errore polling: {e}")
                 time.sleep(60)
 
+    def poll_interval(self) -> int:
+        """Intervallo di polling: lento (solo riconciliazione) finché i webhook consegnano regolarmente."""
+        if self.webhook_server and self.webhook_server.is_healthy():
+            return config.get('webhook', 'reconciliation_interval', 900)
+        return config.get('app', 'sync_interval', 60)
+
+    def get_high_water_mark(self) -> datetime:
+        """Data di modifica (GMT) dell'ultimo ordine salvato con successo."""
+        stored = self.state_store.get_sync_state(self.HIGH_WATER_MARK_KEY) if self.state_store else None
+        if stored:
+            try: return datetime.fromisoformat(stored)
+            except ValueError: print(f"⚠️ High-water mark non valido: {stored}")
+        return self.last_sync
+
+    def poll_modified_orders(self) -> bool:
+        """
+        Sincronizzazione delta: scarica in ordine di modifica crescente solo gli ordini modificati dopo
+        l'high-water mark (creati, cambi di stato, rimborsi). Il mark avanza pagina per pagina insieme al
+        commit su DB (on_order_update riceve il nuovo valore in sync_state), quindi un errore non perde ordini.
+        Ogni pagina è richiesta di nuovo a partire dal mark corrente invece che per offset: un ordine modificato
+        durante il giro passa in fondo ai risultati e con page=N farebbe scorrere (e saltare) la riga al confine.
+        Gli ordini della sovrapposizione già consegnati nel giro si riconoscono da (id, date_modified).
+        """
+        if not self.api: return False
+        per_page = int(config.get('app', 'per_page', 100))
+        limiter = AdaptiveRateLimiter()
+        mark = self.get_high_water_mark()
+        delivered = set()
+        page = 1  # >1 solo se una pagina intera cade nella finestra di sovrapposizione già consegnata
+        try:
+            while True:
+                since = mark - self.HIGH_WATER_MARK_OVERLAP
+                params = {'modified_after': since.strftime('%Y-%m-%dT%H:%M:%S'), 'dates_are_gmt': 'true', 'orderby': 'modified', 'order': 'asc'}
+                orders_page = self._fetch_orders_page(params, page, per_page, limiter).json()
+                fresh = [order for order in orders_page if self._revision_key(order) not in delivered]
+                latest = self._latest_modified(fresh)
+                if fresh:
+                    self.on_order_update(fresh, {self.HIGH_WATER_MARK_KEY: latest.isoformat()} if latest else None)
+                    delivered.update(self._revision_key(order) for order in fresh)
+                    if latest and not self.state_store: self.last_sync = latest
+                if len(orders_page) < per_page: return True
+                if latest and latest > mark: mark, page = latest, 1
+                else: page += 1
+        except Exception as e:
+            print(f"❌ Eccezione grave in poll_modified_orders (modificati dopo {mark.isoformat()}): {e}")
+            return False
+
+    @staticmethod
+    def _revision_key(order: Dict) -> tuple:
+        return order.get('id'), order.get('date_modified_gmt') or order.get('date_modified')
+
+    @staticmethod
+    def _latest_modified(orders: List[Dict]) -> Optional[datetime]:
+        latest = None
+        for order in orders:
+            value = order.get('date_modified_gmt') or order.get('date_modified')
+            if not value: continue
+            try: modified = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            except ValueError: continue
+            if modified.tzinfo is None: modified = modified.replace(tzinfo=timezone.utc)
+            if latest is None or modified > latest: latest = modified
+        return latest
+
     def fetch_orders_since(self, since_datetime: datetime) -> Optional[List[Dict]]:
         if not self.api: return None
         try:
@@ -70,18 +227,37 @@ class WooCommerceManager:
             print(f"❌ Errore durante il recupero degli ordini delle ultime 24 ore: {e}")
             return None
 
-    def get_orders_paged(self, params: dict = None, page_callback: Callable = None) -> bool:
+    def get_orders_paged(self, params: dict = None, page_callback: Callable = None, concurrency: int = None) -> bool:
+        """
+        Scarica tutte le pagine di ordini. Dalla prima risposta legge X-WP-Total/X-WP-TotalPages e scarica
+        le pagine restanti in parallelo (sync_concurrency in config.json); le pagine arrivano a page_callback
+        sul thread chiamante attraverso una coda limitata, così le scritture su DB si sovrappongono al download.
+        """
         if not self.api: return False
+        params = dict(params or {})
+        per_page = int(params.pop('per_page', config.get('app', 'per_page', 100)))
+        concurrency = max(1, int(concurrency or config.get('app', 'sync_concurrency', 4)))
+        limiter = AdaptiveRateLimiter()
         page = 1
-        per_page = 100
         try:
+            print(f"📄 Download pagina {page} di ordini...")
+            response = self._fetch_orders_page(params, page, per_page, limiter)
+            orders_page = response.json()
+            if orders_page and page_callback: page_callback(orders_page)
+            if not orders_page or len(orders_page) < per_page:
+                print("✅ Raggiunta l'ultima pagina.")
+                return True
+            total_pages = int(response.headers.get('X-WP-TotalPages') or 0)
+            if total_pages > 1 and concurrency > 1:
+                print(f"📄 {response.headers.get('X-WP-Total', '?')} ordini in {total_pages} pagine: download con {concurrency} connessioni parallele...")
+                self._fetch_pages_concurrently(params, list(range(2, total_pages + 1)), per_page, concurrency, limiter, page_callback)
+                print("✅ Download di tutte le pagine completato.")
+                return True
+            # Fallback sequenziale: header di paginazione non disponibili o concorrenza disattivata
             while True:
-                current_params = {'per_page': per_page, 'page': page}
-                if params: current_params.update(params)
+                page += 1
                 print(f"📄 Download pagina {page} di ordini...")
-                response = self.api.get('orders', params=current_params)
-                response.raise_for_status()
-                orders_page = response.json()
+                orders_page = self._fetch_orders_page(params, page, per_page, limiter).json()
                 if not orders_page:
                     print("✅ Download di tutte le pagine completato.")
                     break
@@ -90,17 +266,67 @@ class WooCommerceManager:
                 if len(orders_page) < per_page:
                     print("✅ Raggiunta l'ultima pagina.")
                     break
-                page += 1
-                time.sleep(1)
             return True
         except Exception as e:
-            print(f"❌ Eccezione grave in get_orders_paged (pagina {page}): {e}")
+            # In parallelo la pagina fallita è quella riportata da _fetch_pages_concurrently, non il contatore locale
+            print(f"❌ Eccezione grave in get_orders_paged (pagina {getattr(e, 'page', page)}): {e}")
             return False
 
+    def _fetch_orders_page(self, params: dict, page: int, per_page: int, limiter: AdaptiveRateLimiter):
+        """
+        Scarica una pagina di ordini ritentando (con rallentamento adattivo) su 429, 5xx ed errori di rete.
+        È l'unico livello di retry per gli ordini: la sessione non ritenta su questo percorso (mount_single_attempt),
+        così ogni 429 arriva al limiter e Retry-After resta entro il suo massimo.
+        """
+        last_error = None
+        for attempt in range(self.PAGE_RETRIES):
+            limiter.wait()
+            try:
+                response = self.api.get('orders', params={**params, 'per_page': per_page, 'page': page})
+            except requests.RequestException as e:
+                last_error = e; limiter.on_throttle(); continue
+            if response.status_code == 429 or response.status_code >= 500:
+                last_error = requests.HTTPError(f"HTTP {response.status_code} sulla pagina {page}", response=response)
+                try: retry_after = float(response.headers.get('Retry-After') or 0)
+                except ValueError: retry_after = 0
+                limiter.on_throttle(retry_after); continue
+            response.raise_for_status()
+            limiter.on_success()
+            return response
+        raise last_error
+
+    def _fetch_pages_concurrently(self, params: dict, pages: List[int], per_page: int, concurrency: int,
+                                  limiter: AdaptiveRateLimiter, page_callback: Callable = None):
+        results = queue.Queue(maxsize=concurrency * 2)  # backpressure: i download attendono se il DB è indietro
+        stop = threading.Event()
+
+        def download(page: int):
+            if stop.is_set(): return
+            try: result = (page, self._fetch_orders_page(params, page, per_page, limiter).json())
+            except Exception as e: result = (page, e)
+            while not stop.is_set():
+                try: results.put(result, timeout=0.5); return
+                except queue.Full: continue
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='woo-pages') as executor:
+            for page in pages: executor.submit(download, page)
+            try:
+                for _ in pages:
+                    page, orders_page = results.get()
+                    if isinstance(orders_page, Exception): raise PageDownloadError(page, orders_page) from orders_page
+                    print(f"📄 Ricevuta pagina {page} di ordini ({len(orders_page)} ordini)")
+                    if orders_page and page_callback: page_callback(orders_page)
+            finally:
+                stop.set()
+
+    def get_http_metrics(self) -> Dict[str, dict]:
+        """Latenze delle chiamate WooCommerce per endpoint (vedi http_client.LatencyMetrics)."""
+        return self.session.metrics.snapshot()
+
     def get_viaggiatori_for_order(self, order_id: int) -> Optional[List[Dict]]:
         """
         Chiama l'endpoint API custom per ottenere i dati dei viaggiatori.
-        USA 'requests' DIRETTAMENTE PER EVITARE IL NAMESPACE wc/v3.
+        USA LA SESSIONE CONDIVISA DIRETTAMENTE PER EVITARE IL NAMESPACE wc/v3.
         """
         if not self.api:
             return None
@@ -109,7 +335,7 @@ class WooCommerceManager:
             url = f"{self.api.url}/wp-json/gitemania/v1/viaggiatori/{order_id}"
             
             # Esegue la richiesta con l'autenticazione corretta
-            response = requests.get(
+            response = self.session.get(
                 url,
                 auth=(self.api.consumer_key, self.api.consumer_secret),
                 timeout=30